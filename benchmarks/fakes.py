@@ -0,0 +1,296 @@
+"""
+Local stand-ins for the external services used by the tools package:
+  - FakeGroqServer: OpenAI/Groq-compatible chat completions over HTTP (JSON and SSE streaming)
+  - FakeSpreadsheet / FakeWorksheet: in-memory emulation of the gspread calls we make
+  - SMTPSink: aiosmtpd server that accepts and counts messages
+"""
+import asyncio
+import json
+import logging
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ---------- Groq ----------
+
+class FakeGroqServer:
+    """
+    Serves POST /openai/v1/chat/completions with configurable latency.
+    Classification prompts get a JSON object (or a JSON array for batch prompts),
+    everything else gets a reply of `reply_tokens` words (cut at max_tokens), streamed if requested.
+    `prompt_token_latency` adds prefill time per prompt token (~4 characters);
+    `model_latency` maps model names to a base latency used instead of `latency`.
+    Classifications report `confidence`; with `chatty`, classifications requested
+    without JSON mode come wrapped in a preamble and a ```json fence.
+    """
+
+    def __init__(self, latency=0.2, token_latency=0.005, reply_tokens=120, host="127.0.0.1", port=0,
+                 prompt_token_latency=0.0, model_latency=None, confidence=0.9, chatty=False):
+        self.latency = latency
+        self.model_latency = model_latency or {}
+        self.confidence = confidence
+        self.chatty = chatty
+        self.token_latency = token_latency
+        self.models = {}  # model -> requests served
+        self.prompt_token_latency = prompt_token_latency
+        self.reply_tokens = reply_tokens
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-groq", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _content_for(self, prompt, max_tokens=None, json_mode=False):
+        """
+        Returns (content, finish_reason).
+        """
+        if '"tickets" array' in prompt:
+            ids = re.findall(r'\{"id": "([^"]+)"', prompt)
+            content = json.dumps({"tickets": [
+                {"id": i, "sentiment": "Negative", "issue_type": "Billing", "confidence": self.confidence} for i in ids
+            ]})
+        elif "classifier" in prompt:
+            content = json.dumps({"sentiment": "Negative", "issue_type": "Billing", "confidence": self.confidence})
+        else:
+            words = min(self.reply_tokens, max_tokens or self.reply_tokens)
+            return " ".join(["word"] * words), "length" if words < self.reply_tokens else "stop"
+        if self.chatty and not json_mode:
+            content = f"Here is the classification:\n```json\n{content}\n```"
+        return content, "stop"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                model = body.get("model", "")
+                with fake._lock:
+                    fake.requests += 1
+                    fake.models[model] = fake.models.get(model, 0) + 1
+                prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+                json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+                content, finish_reason = fake._content_for(prompt, body.get("max_tokens"), json_mode)
+                usage = {
+                    "prompt_tokens": len(prompt) // 4,
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": (len(prompt) + len(content)) // 4,
+                }
+                latency = fake.model_latency.get(model, fake.latency)
+                time.sleep(latency + fake.prompt_token_latency * usage["prompt_tokens"])
+                if body.get("stream"):
+                    self._stream(model, content, usage, finish_reason)
+                else:
+                    self._json(model, content, usage, finish_reason)
+
+            def _json(self, model, content, usage, finish_reason):
+                payload = json.dumps({
+                    "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                 "finish_reason": finish_reason}],
+                    "usage": usage,
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, model, content, usage, finish_reason):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                words = content.split(" ")
+                for i, word in enumerate(words):
+                    last = i == len(words) - 1
+                    chunk = {
+                        "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": word + ("" if last else " ")},
+                                     "finish_reason": finish_reason if last else None}],
+                    }
+                    if last:
+                        chunk["x_groq"] = {"id": "fake", "usage": usage}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    time.sleep(fake.token_latency)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+# ---------- Google Sheets ----------
+
+class FakeWorksheet:
+    """
+    In-memory worksheet implementing the gspread Worksheet calls used by sheet_connector.
+    Every call sleeps for `latency` seconds to stand in for a Sheets API round trip.
+    """
+
+    def __init__(self, spreadsheet, title, sheet_id, latency=0.0):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.latency = latency
+        self.rows = []
+        self.calls = 0
+        self._lock = threading.RLock()
+
+    def _api(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def get_all_values(self):
+        self._api()
+        with self._lock:
+            return [list(r) for r in self.rows]
+
+    def get_all_records(self):
+        values = self.get_all_values()
+        return [dict(zip(values[0], r)) for r in values[1:]] if values else []
+
+    def _read_range(self, a1):
+        if re.fullmatch(r"\d+:\d+", a1):
+            start, end = (int(x) for x in a1.split(":"))
+            return [list(r) for r in self.rows[start - 1:end]]
+        start = int(re.match(r"[A-Z]+(\d+)", a1).group(1))
+        return [list(r) for r in self.rows[start - 1:]]
+
+    def batch_get(self, ranges):
+        self._api()
+        with self._lock:
+            return [self._read_range(r) for r in ranges]
+
+    def append_row(self, values, **kwargs):
+        self.append_rows([values])
+
+    def append_rows(self, values, **kwargs):
+        self._api()
+        with self._lock:
+            self.rows.extend([str(v) for v in row] for row in values)
+
+    def update_cell(self, row, col, value):
+        self._api()
+        with self._lock:
+            self._set(row, col, value)
+
+    def _set(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        cells[col - 1] = str(value)
+
+    def batch_update(self, data, **kwargs):
+        self._api()
+        with self._lock:
+            for item in data:
+                start, _ = item["range"].split(":")
+                col_letters, row = re.match(r"([A-Z]+)(\d+)", start).groups()
+                col = 0
+                for letter in col_letters:
+                    col = col * 26 + ord(letter) - 64
+                for r_offset, values in enumerate(item["values"]):
+                    for c_offset, value in enumerate(values):
+                        self._set(int(row) + r_offset, col + c_offset, value)
+
+    def delete_rows(self, start, end=None):
+        self._api()
+        with self._lock:
+            del self.rows[start - 1:(end or start)]
+
+class FakeSpreadsheet:
+    """
+    In-memory spreadsheet holding FakeWorksheets; supports deleteDimension batch updates.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.worksheets = {}
+
+    def worksheet(self, title):
+        import gspread
+        if title not in self.worksheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.worksheets[title]
+
+    def add_worksheet(self, title, rows=None, cols=None):
+        sheet = FakeWorksheet(self, title, len(self.worksheets), latency=self.latency)
+        self.worksheets[title] = sheet
+        return sheet
+
+    def batch_update(self, body):
+        by_id = {s.id: s for s in self.worksheets.values()}
+        for request in body.get("requests", []):
+            rng = request["deleteDimension"]["range"]
+            sheet = by_id[rng["sheetId"]]
+            sheet._api()
+            with sheet._lock:
+                del sheet.rows[rng["startIndex"]:rng["endIndex"]]
+
+# ---------- SMTP ----------
+
+class _SinkHandler:
+    def __init__(self, sink):
+        self.sink = sink
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.sink.latency:
+            await asyncio.sleep(self.sink.latency)
+        with self.sink.lock:
+            self.sink.messages += 1
+        return "250 OK queued"
+
+class SMTPSink:
+    """
+    Plain (no TLS, no auth) aiosmtpd server that accepts every message and counts it.
+    """
+
+    def __init__(self, latency=0.0, host="127.0.0.1", port=0):
+        from aiosmtpd.controller import Controller
+        logging.getLogger("mail.log").setLevel(logging.WARNING)  # one INFO line per SMTP command
+        if not port:
+            with socket.socket() as probe:
+                probe.bind((host, 0))
+                port = probe.getsockname()[1]
+        self.latency = latency
+        self.messages = 0
+        self.lock = threading.Lock()
+        self._controller = Controller(_SinkHandler(self), hostname=host, port=port)
+
+    @property
+    def address(self):
+        return self._controller.hostname, self._controller.port
+
+    def start(self):
+        self._controller.start()
+        return self
+
+    def stop(self):
+        self._controller.stop()
@@ -0,0 +1,135 @@
+"""
+Cold-start benchmark: how long it takes a fresh interpreter to import each entry
+module, and whether the import succeeds without credentials.
+
+Usage (from the repository root):
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --baseline-ref HEAD~1 --runs 7 --output import_times.json
+
+Each import runs in its own subprocess with `-X importtime` (so nothing is cached
+between runs) and with the Groq/Gmail credentials removed from the environment.
+--baseline-ref extracts another commit with `git archive` and measures it the same way.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+
+MODULES = [
+    "tools.sheet_connector",
+    "tools.classify_ticket",
+    "tools.generate_reply",
+    "tools.gmail_sender",
+    "tools.outbox",
+    "mcp_server",
+    "worker",
+]
+
+# Removed so a module that needs them at import time fails the way a fresh deployment would
+CREDENTIAL_VARS = ("GROQ_API_KEY", "EMAIL_ADDRESS", "EMAIL_APP_PASSWORD")
+
+def clean_env():
+    env = {k: v for k, v in os.environ.items() if k not in CREDENTIAL_VARS}
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    env.pop("PYTHONPATH", None)
+    return env
+
+def self_import_us(stderr, module):
+    """
+    Cumulative microseconds reported by -X importtime for `module` itself.
+    """
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = [p.strip() for p in line[len("import time:"):].split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    return None
+
+def measure(tree, module, runs):
+    """
+    Import `module` from `tree` in `runs` fresh interpreters.
+    Returns wall-clock and -X importtime figures plus the error of the last failing run.
+    """
+    wall = []
+    cumulative = []
+    error = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=tree, env=clean_env(), capture_output=True, text=True, encoding="utf-8", errors="replace",
+        )
+        wall.append(time.perf_counter() - start)
+        us = self_import_us(proc.stderr, module)
+        if us is not None:
+            cumulative.append(us)
+        if proc.returncode != 0:
+            lines = [l for l in proc.stderr.splitlines() if l.strip() and not l.startswith("import time:")]
+            error = lines[-1] if lines else f"exit code {proc.returncode}"
+    return {
+        "ok": error is None,
+        "error": error,
+        "wall_median_ms": round(statistics.median(wall) * 1000, 1),
+        "wall_min_ms": round(min(wall) * 1000, 1),
+        "import_median_ms": round(statistics.median(cumulative) / 1000, 1) if cumulative else None,
+    }
+
+def extract_ref(ref, repo):
+    """
+    Extract the tree at git `ref` into a temporary directory.
+    """
+    target = tempfile.mkdtemp(prefix="import-time-")
+    archive = os.path.join(target, "tree.tar")
+    with open(archive, "wb") as f:
+        subprocess.run(["git", "archive", ref], cwd=repo, stdout=f, check=True)
+    with tarfile.open(archive) as tar:
+        tar.extractall(target)
+    os.remove(archive)
+    return target
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time of the app's entry modules.")
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--baseline-ref", help="git ref to compare against, e.g. HEAD~1")
+    parser.add_argument("--output", default="import_times.json")
+    args = parser.parse_args()
+
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    trees = {"current": repo}
+    if args.baseline_ref:
+        trees["baseline"] = extract_ref(args.baseline_ref, repo)
+
+    results = {name: {m: measure(tree, m, args.runs) for m in args.modules} for name, tree in trees.items()}
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for module in args.modules:
+        row = f"{module:24s}"
+        for name in trees:
+            r = results[name][module]
+            status = "ok  " if r["ok"] else "FAIL"
+            row += f"  {name}: {status} {r['wall_median_ms']:>8.1f} ms"
+        print(row)
+        for name in trees:
+            if not results[name][module]["ok"]:
+                print(f"    {name}: {results[name][module]['error']}")
+    print(f"📄 Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
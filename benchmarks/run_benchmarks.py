@@ -0,0 +1,392 @@
+"""
+Throughput/latency benchmarks for the ticket pipeline against local fakes
+(no Groq, Google or Gmail traffic).
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks --tickets 200 --concurrency 8 --output bench_results.json
+    python -m benchmarks.run_benchmarks --tickets 1000 --llm-latency 0.5 --sheets-latency 0.1
+
+Results (tickets/sec and p50/p95/p99 latency per stage) are written as JSON so runs can be compared.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from benchmarks.fakes import FakeGroqServer, FakeSpreadsheet, SMTPSink
+
+SHEET_HEADER = ["timestamp", "Name", "Email", "IssueType", "Message", "Sentiment", "IssueType_Label", "AutoReply", "TicketID"]
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+def summarize(latencies, wall_seconds, items):
+    return {
+        "count": len(latencies),
+        "items": items,
+        "wall_s": round(wall_seconds, 4),
+        "tickets_per_sec": round(items / wall_seconds, 2) if wall_seconds else None,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+def timed_map(fn, items, concurrency):
+    """
+    Run fn over items on a thread pool; returns (per-call latencies, wall time).
+    """
+    def run(item):
+        start = time.perf_counter()
+        fn(item)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        latencies = list(pool.map(run, items))
+    return latencies, time.perf_counter() - start
+
+def long_message(i):
+    """
+    An oversized ticket: a pasted log plus a quoted email thread and a signature.
+    """
+    log = "\n".join(f"2025-01-01 00:00:{s % 60:02d} ERROR payment-service timeout after 30s (attempt {s})"
+                     for s in range(150))
+    thread = "\n".join(f"> Earlier message line {n} about invoice #{i}" for n in range(60))
+    repeated = "ERROR payment-service timeout after 30s\n" * 40
+    return (f"Ticket {i}: I was charged twice for my subscription and need a refund.\n"
+            f"The app shows this log:\n{log}\n{repeated}"
+            f"Please help.\n\nBest regards,\nCustomer {i}\nAcme Corp\n\n"
+            f"On Mon, Jan 6, 2025 at 10:00 AM Support <support@example.com> wrote:\n{thread}")
+
+def make_ticket(i, long_every=0):
+    return {
+        "timestamp": f"2025-01-01 00:{i // 60 % 60:02d}:{i % 60:02d}",
+        "TicketID": f"TKT-{i:012X}",
+        "Name": f"Customer {i}",
+        "Email": f"customer{i}@example.com",
+        "IssueType": "Billing",
+        "Message": long_message(i) if long_every and i % long_every == 0
+                   else f"Ticket {i}: I was charged twice for my subscription and need a refund.",
+    }
+
+def ticket_row(ticket):
+    return [ticket.get(c, "") for c in SHEET_HEADER]
+
+def configure_environment(args, groq, smtp, workdir):
+    """
+    Point every tools module at the fakes. Must run before any tools import.
+    """
+    smtp_host, smtp_port = smtp.address
+    os.environ.update({
+        "GROQ_API_KEY": "fake-key",
+        "GROQ_BASE_URL": groq.base_url,
+        "GROQ_REQUESTS_PER_MINUTE": "0",
+        "EMAIL_ADDRESS": "support@example.com",
+        "EMAIL_APP_PASSWORD": "fake-password",
+        "SMTP_HOST": smtp_host,
+        "SMTP_PORT": str(smtp_port),
+        "SMTP_STARTTLS": "0",
+        "SMTP_AUTH": "0",
+        "OUTBOX_PATH": os.path.join(workdir, "outbox.db"),
+        "SHEET_LOCK_PATH": os.path.join(workdir, "sheet_lock.db"),
+        "OUTBOX_RATE_PER_MINUTE": "0",
+        "OUTBOX_POLL_INTERVAL": "0.05",
+        "LLM_CACHE_ENABLED": "1" if args.llm_cache else "0",
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.db"),
+        "LOCAL_CLASSIFIER_ENABLED": "1" if args.local_classifier else "0",
+        "REPLY_TEMPLATES_ENABLED": "1" if args.reply_templates else "0",
+        "REPLY_TEMPLATE_PATH": os.path.join(workdir, "reply_templates.db"),
+        "CLASSIFY_BATCH_SIZE": str(args.batch_size),
+        "LEDGER_PATH": os.path.join(workdir, "ledger.db"),
+        "INTAKE_PATH": os.path.join(workdir, "intake.db"),
+        "INTAKE_FLUSH_INTERVAL": "0.05",
+        "ROLLUP_DB_PATH": os.path.join(workdir, "ticket_rollups.db"),
+        "TICKET_DB_PATH": os.path.join(workdir, "support_tickets.db"),
+    })
+
+def install_fake_sheets(spreadsheet):
+    """
+    Replace the workbook with the in-memory emulator. The gspread client is only
+    built on first use, so no Google credentials are needed.
+    """
+    from tools import sheet_connector
+    sheet_connector.reset_sheet_cache()
+    sheet_connector.reset_sync_cache()
+    sheet_connector._workbook = spreadsheet
+    return sheet_connector
+
+def warm_up():
+    """
+    Build the lazily created clients up front so one-off import and setup cost
+    (see benchmarks/import_time.py) is not counted in the first timed call.
+    """
+    import gspread.utils  # noqa: F401  (imported on first sheet read)
+    from tools.settings import get_groq_client
+    get_groq_client()
+
+def bench_fetch(sheet_connector, spreadsheet, args):
+    pending = spreadsheet.worksheets["PendingTickets"]
+    pending.rows = [SHEET_HEADER] + [ticket_row(make_ticket(i)) for i in range(args.tickets)]
+
+    full = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        sheet_connector.fetch_new_tickets(full=True)
+        full.append(time.perf_counter() - start)
+
+    incremental = []
+    next_id = args.tickets
+    for _ in range(args.repeat):
+        for _ in range(args.new_per_fetch):
+            pending.append_rows([ticket_row(make_ticket(next_id))])
+            next_id += 1
+        start = time.perf_counter()
+        sheet_connector.fetch_new_tickets()
+        incremental.append(time.perf_counter() - start)
+
+    return {
+        "fetch_new_tickets_full": summarize(full, sum(full), args.tickets * len(full)),
+        "fetch_new_tickets_incremental": summarize(incremental, sum(incremental), args.new_per_fetch * len(incremental)),
+    }
+
+def bench_intake(args, spreadsheet):
+    """
+    Ticket submission: a direct append_row per ticket (the old register_ticket.py path)
+    versus queuing in the intake journal and letting the flusher write batches.
+    """
+    from tools.intake import IntakeFlusher, get_intake
+    pending = spreadsheet.worksheets["PendingTickets"]
+    tickets = [make_ticket(i + 3 * args.tickets) for i in range(args.tickets)]
+
+    latencies, wall = timed_map(lambda t: pending.append_row(ticket_row(t)), tickets, args.concurrency)
+    results = {"submit_direct_append": summarize(latencies, wall, len(tickets))}
+
+    journal = get_intake()
+    calls_before = pending.calls
+    rows_before = len(pending.rows)
+    flusher = IntakeFlusher(journal).start()
+    start = time.perf_counter()
+    latencies, submit_wall = timed_map(
+        lambda t: journal.submit(t["Name"], t["Email"], t["IssueType"], t["Message"]), tickets, args.concurrency
+    )
+    deadline = time.time() + args.drain_timeout
+    while len(pending.rows) - rows_before < len(tickets) and time.time() < deadline:
+        time.sleep(0.01)
+    flushed_wall = time.perf_counter() - start
+    flusher.stop()
+
+    result = summarize(latencies, submit_wall, len(tickets))
+    result["flushed_wall_s"] = round(flushed_wall, 4)
+    result["sheets_calls"] = pending.calls - calls_before
+    result["written"] = len(pending.rows) - rows_before
+    results["submit_write_behind"] = result
+    return results
+
+def bench_llm(args):
+    from tools import metrics
+    from tools.classify_ticket import classify_ticket, classify_tickets
+    from tools.generate_reply import generate_reply
+
+    tickets = [make_ticket(i, args.long_every) for i in range(args.tickets)]
+    results = {}
+
+    latencies, wall = timed_map(lambda t: classify_ticket(t["Message"]), tickets, args.concurrency)
+    results["classify_ticket"] = summarize(latencies, wall, len(tickets))
+
+    batch = [dict(make_ticket(i + args.tickets, args.long_every)) for i in range(args.tickets)]
+    start = time.perf_counter()
+    classify_tickets(batch, max_workers=args.concurrency, batch_size=args.batch_size)
+    wall = time.perf_counter() - start
+    results["classify_tickets_batched"] = summarize([wall], wall, len(batch))
+
+    metrics.reset("reply.")
+    latencies, wall = timed_map(lambda t: generate_reply(t["Name"], t["Message"]), tickets, args.concurrency)
+    results["generate_reply"] = summarize(latencies, wall, len(tickets))
+    ttft = metrics.snapshot("reply.ttft")
+    results["generate_reply"]["ttft_mean_ms"] = round(ttft.get("reply.ttft.avg_s", 0.0) * 1000, 3)
+
+    if args.reply_templates:
+        # Index the replies just generated as if they had been sent, then reply to near-duplicates
+        from tools.reply_templates import get_reply_templates
+        get_reply_templates().add([
+            {**t, "IssueType_Label": "Billing", "Sentiment": "Negative", "AutoReply": generate_reply(t["Name"], t["Message"])}
+            for t in tickets[:10]
+        ])
+        repeats = [make_ticket(i + 2 * args.tickets, args.long_every) for i in range(args.tickets)]
+        latencies, wall = timed_map(
+            lambda t: generate_reply(t["Name"], t["Message"], "Negative", "Billing"), repeats, args.concurrency
+        )
+        results["generate_reply_templated"] = summarize(latencies, wall, len(repeats))
+    return results
+
+def bench_smtp(args, smtp):
+    from tools.gmail_sender import send_email_smtp
+
+    before = smtp.messages
+    latencies, wall = timed_map(
+        lambda i: send_email_smtp(f"customer{i}@example.com", "Benchmark", "Hello"),
+        range(args.tickets), args.concurrency,
+    )
+    result = summarize(latencies, wall, args.tickets)
+    result["delivered"] = smtp.messages - before
+    return {"send_email_smtp": result}
+
+def bench_resolve(args, smtp, spreadsheet):
+    import mcp_server
+    from tools.outbox import get_outbox, start_outbox_worker
+
+    start_outbox_worker()
+    processed = spreadsheet.worksheets["ProcessedTickets"]
+    processed_before = len(processed.rows)
+    delivered_before = smtp.messages
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(i):
+            ticket = make_ticket(i + 2 * args.tickets, args.long_every)
+            async with semaphore:
+                start = time.perf_counter()
+                await mcp_server._resolve(ticket["Name"], ticket["Email"], ticket["Message"])
+                return time.perf_counter() - start
+
+        return await asyncio.gather(*(one(i) for i in range(args.tickets)))
+
+    start = time.perf_counter()
+    latencies = asyncio.run(run_all())
+    response_wall = time.perf_counter() - start
+
+    # End to end: wait until every queued email is delivered and recorded in ProcessedTickets
+    deadline = time.time() + args.drain_timeout
+    while time.time() < deadline:
+        counts = get_outbox().counts()
+        if not counts.get("queued") and not counts.get("sending") and not counts.get("sent") and len(processed.rows) - processed_before >= args.tickets:
+            break
+        time.sleep(0.05)
+    end_to_end_wall = time.perf_counter() - start
+
+    result = summarize(latencies, response_wall, args.tickets)
+    result["end_to_end_wall_s"] = round(end_to_end_wall, 4)
+    result["end_to_end_tickets_per_sec"] = round(args.tickets / end_to_end_wall, 2)
+    result["delivered"] = smtp.messages - delivered_before
+    result["recorded"] = len(processed.rows) - processed_before
+    return {"resolve_ticket": result}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ticket pipeline against local fakes.")
+    parser.add_argument("--tickets", type=int, default=100, help="tickets per stage")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5, help="fetch_new_tickets calls per mode")
+    parser.add_argument("--new-per-fetch", type=int, default=5, help="rows appended between incremental fetches")
+    parser.add_argument("--batch-size", type=int, default=10, help="CLASSIFY_BATCH_SIZE for the batched run")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake Groq time to first byte (s)")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="fake Groq delay per streamed token (s)")
+    parser.add_argument("--reply-tokens", type=int, default=120)
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0,
+                        help="fake Groq prefill time per prompt token (s)")
+    parser.add_argument("--long-every", type=int, default=0,
+                        help="make every Nth ticket a long email thread with a pasted log (0 = none)")
+    parser.add_argument("--small-model-latency", type=float, default=None,
+                        help="fake Groq time to first byte for GROQ_SMALL_MODEL (s, default --llm-latency)")
+    parser.add_argument("--large-model-latency", type=float, default=None,
+                        help="fake Groq time to first byte for GROQ_LARGE_MODEL (s, default --llm-latency)")
+    parser.add_argument("--chatty-llm", action="store_true",
+                        help="fake Groq wraps classifications in prose and code fences unless JSON mode is on")
+    parser.add_argument("--sheets-latency", type=float, default=0.05, help="fake Sheets API round trip (s)")
+    parser.add_argument("--smtp-latency", type=float, default=0.01, help="fake SMTP DATA latency (s)")
+    parser.add_argument("--llm-cache", action="store_true", help="keep the LLM result cache enabled")
+    parser.add_argument("--local-classifier", action="store_true", help="keep the local classifier tier enabled")
+    parser.add_argument("--reply-templates", action="store_true", help="reuse replies of near-duplicate tickets")
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="ticket-bench-")
+    groq = FakeGroqServer(args.llm_latency, args.token_latency, args.reply_tokens,
+                          prompt_token_latency=args.prompt_token_latency, chatty=args.chatty_llm).start()
+    smtp = SMTPSink(args.smtp_latency).start()
+    configure_environment(args, groq, smtp, workdir)
+    from tools.model_router import LARGE_MODEL, SMALL_MODEL
+    for model, latency in ((SMALL_MODEL, args.small_model_latency), (LARGE_MODEL, args.large_model_latency)):
+        if latency is not None:
+            groq.model_latency[model] = latency
+
+    spreadsheet = FakeSpreadsheet(latency=args.sheets_latency)
+    for title in ("PendingTickets", "ProcessedTickets"):
+        spreadsheet.add_worksheet(title).rows = [list(SHEET_HEADER)]
+    sheet_connector = install_fake_sheets(spreadsheet)
+    warm_up()
+
+    from tools.model_router import escalation_report, model_report
+    from tools.prompt_budget import compaction_report
+    from tools.reply_templates import template_report
+    from tools.structured_output import parse_report
+    results = {}
+    results.update(bench_fetch(sheet_connector, spreadsheet, args))
+    results.update(bench_intake(args, spreadsheet))
+    results.update(bench_llm(args))
+    results.update(bench_smtp(args, smtp))
+    results.update(bench_resolve(args, smtp, spreadsheet))
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "groq_requests": groq.requests,
+        "groq_requests_by_model": dict(groq.models),
+        "results": results,
+        "prompt_compaction": compaction_report(),
+        "model_routing": {"escalations": escalation_report(), "models": model_report()},
+        "classification_parsing": parse_report(),
+        "reply_templates": template_report(),
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for name, result in results.items():
+        print(
+            f"{name:32s} {result['tickets_per_sec'] or 0:>10.2f} tickets/s  "
+            f"p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  p99 {result['p99_ms']:>9.2f} ms"
+        )
+    for row in report["prompt_compaction"]:
+        print(
+            f"prompt {row['task']:15s} {row['size']:>8s}  {row['messages']:>5d} msgs  "
+            f"{row['tokens_saved']:>8d} tokens saved ({row['saved_pct']:>5.1f}%)  avg {row['avg_latency_ms']:>8.1f} ms"
+        )
+    for row in report["model_routing"]["escalations"]:
+        print(f"route  {row['task']:15s} {row['requests']:>5d} requests  {row['escalation_rate']:>5.1f}% escalated")
+    for row in report["model_routing"]["models"]:
+        print(
+            f"model  {row['model']:20s} {row['task']:15s} {row['calls']:>5d} calls  "
+            f"avg {row['avg_latency_ms']:>8.1f} ms  {row['tokens_per_call']:>7.1f} tokens/call"
+        )
+    for row in report["classification_parsing"]:
+        print(
+            f"parse  {row['task']:15s} {row['completions']:>5d} completions  {row['extracted']:>4d} extracted  "
+            f"{row['failures']:>4d} failed  {row['retries']:>4d} retries  {row['defaulted']:>4d} left Unknown"
+        )
+    templates = report["reply_templates"]
+    if templates["lookups"]:
+        print(
+            f"templates {templates['hits']}/{templates['lookups']} replies reused ({templates['hit_rate']:.1f}%)  "
+            f"avg similarity {templates['avg_similarity']:.3f}  ~{templates['tokens_saved']} tokens saved"
+        )
+    print(f"📄 Wrote {args.output}")
+
+    groq.stop()
+    smtp.stop()
+
+if __name__ == "__main__":
+    main()
@@ -3,19 +3,36 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from dotenv import load_dotenv
 from tools.sheet_connector import (
-    fetch_new_tickets,
-    update_ticket,
-    append_processed_ticket,
-    delete_ticket_from_pending,
-    fetch_processed_tickets
+    update_ticket_labels,
+    get_sheet_stats
 )
-from tools.classify_ticket import classify_ticket
-from tools.generate_reply import generate_reply
-from tools.gmail_sender import send_email_smtp
+from tools.storage import TICKET_COLUMNS, get_storage, parse_timestamp
+from tools.classify_ticket import classify_tickets
+from tools.generate_reply import ReplyUnavailable, is_usable_reply, stream_reply
+from tools.outbox import enqueue_reply, get_outbox, start_outbox_worker
+from tools.ledger import BUSY, CLAIMED, DONE, get_ledger, ticket_key
+from tools.intake import get_intake
+from tools.llm_cache import get_cache_stats
+from tools.rollups import get_rollups
+from tools.model_router import escalation_report, model_report
+from tools.prompt_budget import compaction_report
+from tools.reply_templates import REPLY_TEMPLATE_THRESHOLD, template_report
+from tools.structured_output import parse_report
+from tools.metrics import recent_spans, render_prometheus, snapshot as get_stats, ticket_context
 import datetime
+import io
+import math
+import os
 
 load_dotenv()
 
+# When worker.py does the processing, this app is a read-only monitor
+HEADLESS_WORKER = os.getenv("HEADLESS_WORKER", "0") == "1"
+# Seconds a cached ticket read / aggregate is reused across reruns (writes from this app invalidate it)
+UI_CACHE_TTL = float(os.getenv("UI_CACHE_TTL", "60"))
+# Rows per page in the ticket lists
+UI_PAGE_SIZE = int(os.getenv("UI_PAGE_SIZE", "50"))
+
 # --------- Custom Styling ---------
 st.markdown("""
 <style>
@@ -50,64 +67,211 @@ div[data-testid="stSidebar"] > div:first-child {
     font-size: 18px;
 }
 
-/* For Analyzed Tickets with Checkboxes */
-.ticket-details {
-    background-color: #f9fafb;
-    border: 1px solid #ddd;
-    padding: 15px;
-    border-radius: 8px;
-    margin-bottom: 1rem;
-}
-.ticket-header {
-    font-weight: 700;
-    font-size: 1.1rem;
-    margin-bottom: 0.3rem;
-}
-.ticket-category {
-    font-size: 0.9rem;
-    color: #2563eb;
-    margin-bottom: 0.6rem;
-}
-.ticket-message {
-    white-space: pre-wrap;
-    color: #374151;
-}
-.ticket-row {
-    display: flex;
-    align-items: flex-start;
-    margin-bottom: 1rem;
-}
-.ticket-checkbox {
-    width: 40px;
-    margin-top: 40px;
-    flex-shrink: 0;
-}
-.ticket-content {
-    flex-grow: 1;
-}
 </style>
 """, unsafe_allow_html=True)
 
-st.sidebar.title("📌 Navigation")
-tab_selection = st.sidebar.radio("Go to:", ["📋 Pending Tickets", "📂 Analyzed Tickets", "📊 Dashboard"])
+# --------- Cached reads ---------
+# Widget interactions rerun the whole script; these keep them from re-reading the
+# Sheet and rebuilding DataFrames/charts. Keys include `version` (delivered/recorded
+# outbox counts), so rows written by the background sender show up without waiting for the TTL.
+
+@st.cache_resource
+def get_ticket_storage():
+    # Google Sheets or the local SQLite mirror, see TICKET_STORAGE_BACKEND
+    return get_storage()
+
+@st.cache_data(ttl=UI_CACHE_TTL, show_spinner=False)
+def load_pending_tickets(version):
+    return get_ticket_storage().fetch_new_tickets()
+
+@st.cache_data(ttl=UI_CACHE_TTL, show_spinner=False)
+def load_filter_options(version):
+    return get_ticket_storage().processed_filter_options()
+
+@st.cache_data(ttl=UI_CACHE_TTL, show_spinner=False)
+def load_processed_frame(version, start_date, end_date, issue_types):
+    """
+    Processed tickets for one filter combination as a DataFrame.
+    """
+    return pd.DataFrame(
+        get_ticket_storage().query_processed_tickets(start_date, end_date, issue_types=list(issue_types)),
+        columns=TICKET_COLUMNS
+    )
 
-st.markdown("<div class='centered-header'>🤖 AI Support Ticket Management Dashboard</div>", unsafe_allow_html=True)
+@st.cache_data(ttl=UI_CACHE_TTL, show_spinner=False)
+def load_dashboard_options(version):
+    # Catch up on rows appended by other processes, then answer from the rollups
+    get_ticket_storage().sync_rollups()
+    return get_rollups().filter_options()
+
+@st.cache_data(ttl=UI_CACHE_TTL, show_spinner=False)
+def load_dashboard_rollups(version, start_date, end_date, issue_types):
+    """
+    Daily rollup rows (day x issue type x sentiment counts) for one filter combination.
+    """
+    return pd.DataFrame(
+        get_rollups().daily(start_date, end_date, issue_types=list(issue_types)),
+        columns=["day", "issue_type", "sentiment", "count"]
+    )
 
-# Load tickets
-pending_tickets = fetch_new_tickets()
-processed_tickets = fetch_processed_tickets()
+@st.cache_data(max_entries=64, show_spinner=False)
+def render_chart(kind, labels, values):
+    """
+    Render a pie or bar chart to PNG; identical data is only drawn once.
+    """
+    fig, ax = plt.subplots()
+    if kind == "pie":
+        ax.pie(values, labels=labels, autopct="%1.1f%%", startangle=140)
+        ax.axis("equal")
+    else:
+        ax.bar(labels, values, color="#3b82f6")
+        ax.set_ylabel("Count")
+        ax.set_xlabel("Issue Type")
+        ax.set_xticks(range(len(labels)))
+        ax.set_xticklabels(labels, rotation=30, ha="right")
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+def invalidate_ticket_cache():
+    """
+    Drop cached ticket reads after this app writes to the Sheet.
+    """
+    for loader in (load_pending_tickets, load_filter_options, load_processed_frame,
+                   load_dashboard_options, load_dashboard_rollups):
+        loader.clear()
 
-def format_ticket_label(ticket, idx):
-    return f"#{idx} - {ticket['Name']} ({ticket['Email']})"
+st.sidebar.title("📌 Navigation")
+tab_selection = st.sidebar.radio("Go to:", ["📋 Pending Tickets", "📂 Analyzed Tickets", "📊 Dashboard", "⚡ Performance"])
+if st.sidebar.button("🔄 Refresh data"):
+    invalidate_ticket_cache()
 
-def filter_by_date_range(df, date_col, label):
-    df = df.dropna(subset=[date_col])
-    if df.empty:
-        st.info(f"No valid {date_col} data available for {label}.")
-        return df
+st.markdown("<div class='centered-header'>🤖 AI Support Ticket Management Dashboard</div>", unsafe_allow_html=True)
 
-    min_date = df[date_col].min().date()
-    max_date = df[date_col].max().date()
+# Sheets API usage at the start of this render, reported in the sidebar at the end
+sheet_stats_before = get_sheet_stats()
+
+# Replies go through the durable outbox; rows are removed from PendingTickets once delivered
+if not HEADLESS_WORKER:
+    start_outbox_worker()
+outbox_counts = get_outbox().counts()
+data_version = (outbox_counts.get("sent", 0), outbox_counts.get("recorded", 0))
+
+storage = get_ticket_storage()
+pending_tickets = load_pending_tickets(data_version)
+queued_keys = get_outbox().active_ticket_keys()
+queued_count = sum(1 for t in pending_tickets if ticket_key(t) in queued_keys)
+pending_tickets = [t for t in pending_tickets if ticket_key(t) not in queued_keys]
+
+def search_tickets(tickets, query, fields=("Name", "Email", "Message")):
+    """
+    Tickets whose name, email or message contains `query` (case-insensitive).
+    """
+    query = query.strip().lower()
+    if not query:
+        return tickets
+    return [t for t in tickets if any(query in str(t.get(f, "")).lower() for f in fields)]
+
+def search_frame(df, query, fields=("Name", "Email", "Message")):
+    """
+    search_tickets() for a DataFrame of tickets.
+    """
+    query = query.strip()
+    if not query:
+        return df
+    mask = pd.Series(False, index=df.index)
+    for field in fields:
+        mask |= df[field].astype(str).str.contains(query, case=False, regex=False)
+    return df[mask]
+
+def paginate(items, key, page_size=UI_PAGE_SIZE):
+    """
+    Show page controls for a list or DataFrame and return only the rows on the current page,
+    so the page costs the same to build however long the queue is.
+    """
+    pages = max(1, math.ceil(len(items) / page_size))
+    if pages == 1:
+        return items
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1, key=key)
+    start = (page - 1) * page_size
+    st.caption(f"Showing {start + 1}–{min(start + page_size, len(items))} of {len(items)}")
+    return items[start:start + page_size]
+
+def classify_pending(tickets):
+    """
+    Classify the unlabelled tickets at most once per TicketID: labels that another
+    session or worker.py already produced come from the processing ledger, and
+    tickets being classified elsewhere right now are left for a later rerun.
+    Returns the tickets whose labels should be written back to the sheet.
+    """
+    ledger = get_ledger()
+    known, todo, tokens = [], [], {}
+    for ticket in tickets:
+        if ticket.get("IssueType_Label"):
+            continue
+        status, result = ledger.claim(ticket_key(ticket), "classify")
+        if status == DONE:
+            ticket["IssueType_Label"] = result.get("issue_type", "Unknown")
+            ticket["Sentiment"] = result.get("sentiment", "Neutral")
+            known.append(ticket)
+        elif status == CLAIMED:
+            tokens[ticket_key(ticket)] = result
+            todo.append(ticket)
+
+    classified = []
+    try:
+        classified = classify_tickets(todo)
+    finally:
+        succeeded = {ticket_key(t) for t in classified}
+        for ticket in todo:
+            key = ticket_key(ticket)
+            if key in succeeded:
+                ledger.complete(
+                    key, "classify", {"sentiment": ticket["Sentiment"], "issue_type": ticket["IssueType_Label"]}, tokens[key]
+                )
+            else:
+                ledger.release(key, "classify", tokens[key])
+    return known + classified
+
+def draft_reply(ticket):
+    """
+    Generate the ticket's AutoReply, rendering it progressively as tokens arrive.
+    A reply already drafted for this TicketID is reused; one being drafted by another
+    session, or one Groq failed to write, is skipped (AutoReply stays empty).
+    """
+    key = ticket_key(ticket)
+    with st.expander(f"✍️ Reply to {ticket['Name']} ({ticket['Email']})", expanded=True), ticket_context(key):
+        try:
+            status, reply = get_ledger().run_once(
+                key, "reply",
+                lambda: st.write_stream(
+                    stream_reply(ticket["Name"], ticket["Message"], ticket.get("Sentiment"), ticket.get("IssueType_Label"))
+                ),
+                keep=is_usable_reply,
+            )
+        except ReplyUnavailable as e:
+            st.error(f"❌ Could not draft a reply ({e}); the ticket stays pending so it can be retried.")
+            status, reply = None, None
+        if status == DONE:
+            st.markdown(reply)
+        elif status == BUSY:
+            st.warning("⏳ Another session is drafting this reply; it will be sent from there.")
+        ticket["AutoReply"] = reply or ""
+
+def select_date_range(options, label):
+    """
+    Render a date range picker bounded by the processed-ticket timestamps.
+    Returns (start_date, end_date), or (None, None) when no valid timestamps exist.
+    """
+    min_ts = parse_timestamp(options["min_timestamp"])
+    max_ts = parse_timestamp(options["max_timestamp"])
+    if not min_ts or not max_ts:
+        st.info(f"No valid timestamp data available for {label}.")
+        return None, None
+
+    min_date = min_ts.date()
+    max_date = max_ts.date()
     if min_date == max_date:
         max_date = min_date + datetime.timedelta(days=1)
 
@@ -122,41 +286,46 @@ def filter_by_date_range(df, date_col, label):
         start_date, end_date = selected_date_range
     else:
         start_date = end_date = selected_date_range
-
-    filtered_df = df[(df[date_col].dt.date >= start_date) & (df[date_col].dt.date <= end_date)]
-    return filtered_df
+    return start_date, end_date
 
 # --------- Pending Tickets ---------
 if tab_selection == "📋 Pending Tickets":
     st.subheader("📋 Pending Tickets")
+    if queued_count:
+        st.info(f"📤 {queued_count} replies are queued for delivery and will leave this list once sent.")
 
     if not pending_tickets:
         st.success("✅ No pending tickets to process.")
     else:
-        # Classify unlabelled tickets
-        for ticket in pending_tickets:
-            if "IssueType_Label" not in ticket or not ticket["IssueType_Label"]:
-                classification = classify_ticket(ticket["Message"])
-                ticket["IssueType_Label"] = classification.get("issue_type", "Unknown")
-                ticket["Sentiment"] = classification.get("sentiment", "Neutral")
+        # Classify unlabelled tickets in parallel and save the labels for later reruns
+        if HEADLESS_WORKER:
+            st.info("🤖 Tickets are processed by worker.py; this page only monitors the queue.")
+        elif any(not t.get("IssueType_Label") for t in pending_tickets):
+            with st.spinner("🤖 Classifying new tickets..."):
+                classified = classify_pending(pending_tickets)
+            if update_ticket_labels(classified):
+                storage.sync()
+                invalidate_ticket_cache()
 
         analyzed = [t for t in pending_tickets if t.get("IssueType_Label")]
         unanalyzed = [t for t in pending_tickets if not t.get("IssueType_Label")]
+        search = st.text_input("🔎 Search pending tickets", placeholder="Name, email or message text")
 
         col1, col2 = st.columns(2)
 
         with col1:
             st.markdown("### ⏳ Pending (Not Yet Analyzed)")
+            matches = search_tickets(unanalyzed, search)
             if not unanalyzed:
                 st.success("No tickets awaiting classification.")
+            elif not matches:
+                st.info("No tickets match the search.")
             else:
-                for i, ticket in enumerate(unanalyzed, start=1):
-                    st.markdown(
-                        f"<div class='ticket-box'><strong>📩 Ticket #{i}</strong><br>"
-                        f"<strong>Name:</strong> {ticket['Name']}<br>"
-                        f"<strong>Email:</strong> {ticket['Email']}<br>"
-                        f"<strong>Message:</strong><br>{ticket['Message']}</div>", unsafe_allow_html=True
-                    )
+                page = paginate(matches, "unanalyzed_page")
+                st.dataframe(
+                    pd.DataFrame(page, columns=["timestamp", "Name", "Email", "Message"]),
+                    width="stretch", hide_index=True
+                )
 
         with col2:
             st.markdown("### ✅ Analyzed (But Not Sent)")
@@ -166,146 +335,260 @@ if tab_selection == "📋 Pending Tickets":
             else:
                 all_categories = sorted(set(t["IssueType_Label"] for t in analyzed))
                 selected_categories = st.multiselect("🎯 Filter by Category", all_categories, default=all_categories)
-                filtered = [t for t in analyzed if t["IssueType_Label"] in selected_categories]
+                filtered = search_tickets([t for t in analyzed if t["IssueType_Label"] in selected_categories], search)
 
                 if not filtered:
                     st.info("No tickets match the selected categories.")
                 else:
-                    selected_to_send = {}
-
-                    for i, ticket in enumerate(filtered, start=1):
-                        cols = st.columns([0.05, 0.95])
-                        with cols[0]:
-                            selected_to_send[i] = st.checkbox("", key=f"send_ticket_{i}")
-                        with cols[1]:
-                            st.markdown(
-                                f"<div class='ticket-details'>"
-                                f"<div class='ticket-header'>📨 Ticket #{i} - {ticket['Name']} ({ticket['Email']})</div>"
-                                f"<div class='ticket-category'>Category: {ticket['IssueType_Label']}</div>"
-                                f"<div class='ticket-message'>{ticket['Message']}</div>"
-                                f"</div>", unsafe_allow_html=True
-                            )
+                    # Selections are remembered by ticket ID, so they survive paging, searching and new arrivals
+                    selected_keys = st.session_state.setdefault("selected_ticket_keys", set())
+                    by_key = {ticket_key(t): t for t in filtered}
+                    page = paginate(filtered, "analyzed_page")
+                    page_frame = pd.DataFrame(
+                        [{"Send": ticket_key(t) in selected_keys, **{c: t.get(c, "") for c in
+                          ("Name", "Email", "IssueType_Label", "Message")}} for t in page],
+                        index=[ticket_key(t) for t in page],
+                    )
+                    edited = st.data_editor(
+                        page_frame,
+                        key=f"send_editor_{hash(tuple(page_frame.index))}",
+                        hide_index=True,
+                        width="stretch",
+                        disabled=["Name", "Email", "IssueType_Label", "Message"],
+                        column_config={
+                            "Send": st.column_config.CheckboxColumn("Send", width="small"),
+                            "IssueType_Label": st.column_config.TextColumn("Category"),
+                        },
+                    )
+                    for key, send in edited["Send"].items():
+                        (selected_keys.add if send else selected_keys.discard)(key)
+                    selected_keys &= set(by_key)
+                    st.caption(f"{len(selected_keys)} of {len(filtered)} tickets selected")
 
                     col_btn1, col_btn2 = st.columns([1, 1])
                     with col_btn1:
-                        if st.button("✉️ Send Replies to Selected"):
-                            to_process = [ticket for i, ticket in enumerate(filtered, start=1) if selected_to_send.get(i)]
+                        if st.button("✉️ Send Replies to Selected", disabled=HEADLESS_WORKER):
+                            to_process = [by_key[key] for key in by_key if key in selected_keys]
                             if not to_process:
                                 st.warning("Please select at least one ticket to send replies.")
                             else:
                                 for ticket in to_process:
                                     if not ticket.get("AutoReply"):
-                                        ticket["AutoReply"] = generate_reply(ticket["Name"], ticket["Message"])
+                                        draft_reply(ticket)
 
-                                    sentiment = ticket.get("Sentiment", "Neutral")
-                                    issue_type = ticket.get("IssueType_Label", "Unknown")
-                                    reply = ticket["AutoReply"]
-                                    row_number = ticket.get("RowNumber")
-
-                                    send_email_smtp(ticket["Email"], "Automated Reply", reply)
-
-                                    update_ticket(row_number, sentiment, issue_type, reply)
-                                    append_processed_ticket(ticket, sentiment, issue_type, reply)
-                                    delete_ticket_from_pending(row_number)
-
-                                st.success(f"Sent replies to {len(to_process)} tickets and updated the records.")
+                                queued = sum(1 for t in to_process if t.get("AutoReply") and enqueue_reply(t))
+                                selected_keys.clear()
+                                st.success(f"Queued replies to {queued} tickets; records are updated as each email is delivered.")
 
                     with col_btn2:
-                        if st.button("✉️ Send Replies to All"):
+                        if st.button("✉️ Send Replies to All", disabled=HEADLESS_WORKER):
                             for ticket in filtered:
                                 if not ticket.get("AutoReply"):
-                                    ticket["AutoReply"] = generate_reply(ticket["Name"], ticket["Message"])
-
-                                sentiment = ticket.get("Sentiment", "Neutral")
-                                issue_type = ticket.get("IssueType_Label", "Unknown")
-                                reply = ticket["AutoReply"]
-                                row_number = ticket.get("RowNumber")
-
-                                send_email_smtp(ticket["Email"], "Automated Reply", reply)
-
-                                update_ticket(row_number, sentiment, issue_type, reply)
-                                append_processed_ticket(ticket, sentiment, issue_type, reply)
-                                delete_ticket_from_pending(row_number)
+                                    draft_reply(ticket)
 
-                            st.success(f"Sent replies to all ({len(filtered)}) analyzed tickets and updated the records.")
+                            queued = sum(1 for t in filtered if t.get("AutoReply") and enqueue_reply(t))
+                            selected_keys.clear()
+                            st.success(f"Queued replies to all ({queued}) analyzed tickets; records are updated as each email is delivered.")
 
 # --------- Analyzed Tickets ---------
 elif tab_selection == "📂 Analyzed Tickets":
-    if not processed_tickets:
+    options = load_filter_options(data_version)
+    if not options["max_timestamp"] and not options["issue_types"]:
         st.info("No tickets have been analyzed yet.")
     else:
-        df = pd.DataFrame(processed_tickets)
-        if 'Timestamp' in df.columns:
-            df['Timestamp'] = pd.to_datetime(df['Timestamp'], errors='coerce')
-
-        issue_types = df["IssueType_Label"].dropna().unique().tolist()
+        issue_types = options["issue_types"]
         selected_issue_types = st.multiselect("Filter by Issue Type", options=issue_types, default=issue_types)
+        start_date, end_date = select_date_range(options, 'Analyzed Tickets')
 
-        if 'Timestamp' in df.columns and not df['Timestamp'].isnull().all():
-            df = filter_by_date_range(df, 'Timestamp', 'Analyzed Tickets')
-
-        df = df[df["IssueType_Label"].isin(selected_issue_types)]
+        df = load_processed_frame(data_version, start_date, end_date, tuple(selected_issue_types))
 
         if df.empty:
             st.info("No tickets match the selected filters.")
         else:
-            filtered_tickets = df.to_dict('records')
-            processed_labels = [format_ticket_label(t, i) for i, t in enumerate(filtered_tickets, start=1)]
-            selected_processed = st.selectbox("Select an analyzed ticket", processed_labels, key="processed_select_filtered")
-            selected_index = processed_labels.index(selected_processed)
-            ticket = filtered_tickets[selected_index]
-
-            st.markdown(f"<div class='ticket-box'><strong>📝 Message:</strong><br>{ticket['Message']}</div>", unsafe_allow_html=True)
-            st.markdown(f"**Sentiment:** `{ticket.get('Sentiment', '')}`")
-            st.markdown(f"**Issue Type:** `{ticket.get('IssueType_Label', '')}`")
-            st.markdown("**📬 Reply Sent:**")
-            st.text_area("Reply", ticket.get("AutoReply", ""), height=140, disabled=True)
-
-            csv = df.to_csv(index=False).encode("utf-8")
+            search = st.text_input("🔎 Search analyzed tickets", placeholder="Name, email or message text")
+            matches = search_frame(df, search)
+            if matches.empty:
+                st.info("No tickets match the search.")
+            else:
+                page = paginate(matches, "processed_page")
+                selection = st.dataframe(
+                    page[["timestamp", "Name", "Email", "Sentiment", "IssueType_Label"]],
+                    key=f"processed_table_{hash(tuple(page.index))}",
+                    width="stretch",
+                    hide_index=True,
+                    on_select="rerun",
+                    selection_mode="single-row",
+                )
+                selected_rows = selection.selection.rows
+                ticket = page.iloc[selected_rows[0] if selected_rows else 0].to_dict()
+
+                st.markdown(f"**{ticket['Name']}** ({ticket['Email']}) · {ticket['timestamp']}")
+                st.markdown(f"<div class='ticket-box'><strong>📝 Message:</strong><br>{ticket['Message']}</div>", unsafe_allow_html=True)
+                st.markdown(f"**Sentiment:** `{ticket.get('Sentiment', '')}`")
+                st.markdown(f"**Issue Type:** `{ticket.get('IssueType_Label', '')}`")
+                st.markdown("**📬 Reply Sent:**")
+                st.text_area("Reply", ticket.get("AutoReply", ""), height=140, disabled=True)
+
+            csv = matches.to_csv(index=False).encode("utf-8")
             st.download_button("📁 Export Filtered CSV", csv, "processed_tickets_filtered.csv", "text/csv")
 
 # --------- Dashboard ---------
 elif tab_selection == "📊 Dashboard":
-    if not processed_tickets:
+    options = load_dashboard_options(data_version)
+    if not options["max_timestamp"] and not options["issue_types"]:
         st.info("No data to display yet.")
     else:
-        df = pd.DataFrame(processed_tickets)
-        if 'Timestamp' in df.columns:
-            df['Timestamp'] = pd.to_datetime(df['Timestamp'], errors='coerce')
-
-        issue_types = df["IssueType_Label"].dropna().unique().tolist()
+        issue_types = options["issue_types"]
         selected_issue_types = st.multiselect("Filter Dashboard by Issue Type", options=issue_types, default=issue_types)
+        start_date, end_date = select_date_range(options, 'Dashboard')
 
-        if 'Timestamp' in df.columns and not df['Timestamp'].isnull().all():
-            df = filter_by_date_range(df, 'Timestamp', 'Dashboard')
-
-        df = df[df["IssueType_Label"].isin(selected_issue_types)]
+        rollup = load_dashboard_rollups(data_version, start_date, end_date, tuple(selected_issue_types))
 
-        if df.empty:
+        if rollup.empty:
             st.info("No data to display for the selected filters.")
         else:
+            sentiment_counts = rollup.groupby("sentiment")["count"].sum().sort_values(ascending=False)
+            issue_counts = rollup.groupby("issue_type")["count"].sum().sort_values(ascending=False)
             col1, col2 = st.columns(2)
 
             with col1:
                 st.subheader("📊 Sentiment Distribution")
-                sentiment_counts = df["Sentiment"].value_counts(dropna=True)
                 if sentiment_counts.empty:
                     st.write("No sentiment data available.")
                 else:
-                    fig1, ax1 = plt.subplots()
-                    ax1.pie(sentiment_counts, labels=sentiment_counts.index, autopct="%1.1f%%", startangle=140)
-                    ax1.axis("equal")
-                    st.pyplot(fig1)
+                    st.image(render_chart("pie", tuple(sentiment_counts.index), tuple(sentiment_counts.values)))
 
             with col2:
                 st.subheader("🗂️ Issue Type Distribution")
-                issue_counts = df["IssueType_Label"].value_counts(dropna=True)
                 if issue_counts.empty:
                     st.write("No issue type data available.")
                 else:
-                    fig2, ax2 = plt.subplots()
-                    ax2.bar(issue_counts.index, issue_counts.values, color="#3b82f6")
-                    ax2.set_ylabel("Count")
-                    ax2.set_xlabel("Issue Type")
-                    ax2.set_xticklabels(issue_counts.index, rotation=30, ha="right")
-                    st.pyplot(fig2)
+                    st.image(render_chart("bar", tuple(issue_counts.index), tuple(issue_counts.values)))
+
+            # Time series straight from the daily rollups; days without tickets show as 0
+            dated = rollup[rollup["day"] != ""].assign(day=lambda d: pd.to_datetime(d["day"]))
+            if not dated.empty:
+                all_days = pd.date_range(dated["day"].min(), dated["day"].max(), freq="D")
+
+                st.subheader("📈 Tickets per Day")
+                volume = dated.groupby("day")["count"].sum().reindex(all_days, fill_value=0)
+                st.bar_chart(volume.rename("Tickets"))
+
+                st.subheader("💬 Sentiment Trend")
+                trend = dated.pivot_table(index="day", columns="sentiment", values="count", aggfunc="sum", fill_value=0)
+                st.area_chart(trend.reindex(all_days, fill_value=0).rename(columns={"": "Unlabelled"}))
+
+# --------- Performance ---------
+elif tab_selection == "⚡ Performance":
+    st.subheader("⚡ External Call Performance")
+    spans = pd.DataFrame(recent_spans())
+    if spans.empty:
+        st.info("No Groq, Sheets or SMTP calls have been made by this process yet.")
+    else:
+        # Per-operation cost: one row per span name (and model/task for Groq calls)
+        for column in ("model", "task", "retries", "bytes_out", "bytes_in", "total_tokens"):
+            if column not in spans:
+                spans[column] = None
+        spans["operation"] = spans["name"] + spans.apply(
+            lambda s: f" ({s['task']}, {s['model']})" if isinstance(s["task"], str) and isinstance(s["model"], str)
+            else f" ({s['task']})" if isinstance(s["task"], str) else "",
+            axis=1,
+        )
+        grouped = spans.groupby("operation")
+        summary = pd.DataFrame({
+            "calls": grouped.size(),
+            "errors": grouped["status"].apply(lambda s: int((s == "error").sum())),
+            "avg_ms": grouped["duration_s"].mean() * 1000,
+            "p50_ms": grouped["duration_s"].quantile(0.5) * 1000,
+            "p95_ms": grouped["duration_s"].quantile(0.95) * 1000,
+            "retries": grouped["retries"].sum(min_count=1),
+            "tokens": grouped["total_tokens"].sum(min_count=1),
+            "bytes_out": grouped["bytes_out"].sum(min_count=1),
+            "bytes_in": grouped["bytes_in"].sum(min_count=1),
+        }).round(1)
+        st.caption(f"Last {len(spans)} calls made by this Streamlit process.")
+        st.dataframe(summary, width="stretch")
+
+        st.markdown("### 🕒 Recent Calls")
+        recent = spans.sort_values("start", ascending=False).head(200).copy()
+        recent["start"] = pd.to_datetime(recent["start"], unit="s")
+        recent["duration_ms"] = (recent["duration_s"] * 1000).round(1)
+        columns = ["start", "operation", "ticket_id", "status", "duration_ms", "model",
+                   "retries", "total_tokens", "bytes_out", "bytes_in"]
+        st.dataframe(recent[columns], width="stretch", hide_index=True)
+
+    st.markdown("### ✂️ Prompt Compaction")
+    compaction = compaction_report()
+    if compaction:
+        # Message tokens before/after compaction, by the message's original size
+        st.dataframe(pd.DataFrame(compaction), width="stretch", hide_index=True)
+    else:
+        st.caption("No Groq prompts have been sent by this process yet.")
+
+    st.markdown("### 🧭 Model Routing")
+    escalations = escalation_report()
+    if escalations:
+        # Share of requests that skipped or overruled the small model, by reason
+        st.dataframe(pd.DataFrame(escalations), width="stretch", hide_index=True)
+        st.dataframe(pd.DataFrame(model_report()), width="stretch", hide_index=True)
+    else:
+        st.caption("No Groq requests have been routed by this process yet.")
+
+    st.markdown("### 🧩 Classification Parsing")
+    parsing = parse_report()
+    if parsing:
+        # Completions that needed the tolerant extractor, failed validation, or cost a retry
+        st.dataframe(pd.DataFrame(parsing), width="stretch", hide_index=True)
+    else:
+        st.caption("No classifications have been parsed by this process yet.")
+
+    st.markdown("### ♻️ Reply Templates")
+    templates = template_report()
+    if templates["lookups"]:
+        # Replies reused from near-duplicate past tickets instead of generated
+        indexed = templates.pop("indexed")
+        st.caption(
+            f"Similarity threshold {REPLY_TEMPLATE_THRESHOLD}; indexed replies: "
+            + (", ".join(f"{issue_type} {count}" for issue_type, count in indexed.items()) or "none")
+        )
+        st.dataframe(pd.DataFrame([templates]), width="stretch", hide_index=True)
+    else:
+        st.caption("No replies have been looked up in the template index by this process yet.")
+
+    with st.expander("📈 Prometheus metrics"):
+        st.code(render_prometheus(), language="text")
+
+# --------- Sheets API cost of this render ---------
+sheet_stats_after = get_sheet_stats()
+api_calls = sheet_stats_after.get("sheets.api_calls", 0) - sheet_stats_before.get("sheets.api_calls", 0)
+handle_hits = sheet_stats_after.get("sheets.handle_hits", 0) - sheet_stats_before.get("sheets.handle_hits", 0)
+handle_misses = sheet_stats_after.get("sheets.handle_misses", 0) - sheet_stats_before.get("sheets.handle_misses", 0)
+st.sidebar.caption(
+    f"📡 Sheets API calls this render: {int(api_calls)} "
+    f"(handle cache {int(handle_hits)} hits / {int(handle_misses)} misses)"
+)
+llm_lifetime = get_cache_stats()["lifetime"]
+st.sidebar.caption(
+    f"🧠 LLM cache: {sum(v['calls_saved'] for v in llm_lifetime.values())} calls / "
+    f"{sum(v['tokens_saved'] for v in llm_lifetime.values())} tokens saved"
+)
+outbox_counts = get_outbox().counts()
+st.sidebar.caption(
+    f"📤 Outbox: {outbox_counts.get('queued', 0)} queued / {outbox_counts.get('sending', 0)} sending / "
+    f"{outbox_counts.get('recorded', 0)} sent / {outbox_counts['dead_letter']} dead-lettered"
+)
+if outbox_counts.get("sent"):
+    st.sidebar.caption(f"📝 {outbox_counts['sent']} delivered replies are waiting to be recorded in the Sheet")
+intake_stats = get_intake().stats()
+intake_waiting = intake_stats.get("queued", 0) + intake_stats.get("flushing", 0)
+if intake_waiting:
+    st.sidebar.caption(
+        f"📥 Intake: {intake_waiting} submitted tickets waiting to be written "
+        f"(oldest {intake_stats['oldest_age_s']:.0f} s)"
+    )
+reply_stats = get_stats("reply.")
+if reply_stats.get("reply.ttft.count"):
+    st.sidebar.caption(
+        f"⚡ Reply time to first token: {reply_stats['reply.ttft.avg_s'] * 1000:.0f} ms avg "
+        f"over {int(reply_stats['reply.ttft.count'])} replies"
+    )
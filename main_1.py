@@ -5,8 +5,9 @@ from tools.sheet_connector import (
     append_processed_ticket
 )
 from tools.classify_ticket import classify_ticket
-from tools.generate_reply import generate_reply
+from tools.generate_reply import ReplyUnavailable, generate_reply, is_usable_reply
 from tools.gmail_sender import send_email_smtp
+from tools.ledger import BUSY, DONE, get_ledger, ticket_key
 from dotenv import load_dotenv
 
 # ---------- Load environment variables ----------
@@ -25,20 +26,41 @@ tickets = fetch_new_tickets()
 if not tickets:
     st.success("✅ No new tickets to process.")
 else:
+    ledger = get_ledger()
     for i, ticket in enumerate(tickets, start=1):
         
         # Skip already processed tickets
         if ticket["Sentiment"] and ticket["AutoReply"]:
             continue
 
+        ticket_id = ticket_key(ticket)
         with st.expander(f"📩 Ticket #{i} from {ticket['Name']} ({ticket['Email']})"):
             st.markdown("**📝 Message:**")
             st.info(ticket["Message"])
 
-            if st.button(f"🔍 Analyze & Respond Ticket #{i}"):
+            if st.button(f"🔍 Analyze & Respond Ticket #{i}", key=f"respond_{ticket_id}"):
+                # The ledger makes each step run once per TicketID, even across reruns and sessions
                 with st.spinner("🤖 Running AI classification and reply generation..."):
-                    classification = classify_ticket(ticket["Message"])
-                    reply = generate_reply(ticket["Message"])
+                    classify_status, classification = ledger.run_once(
+                        ticket_id, "classify", lambda: classify_ticket(ticket["Message"]),
+                        keep=lambda c: c.get("sentiment") != "Unknown",
+                    )
+                    labels = classification or {}
+                    try:
+                        reply_status, reply = ledger.run_once(
+                            ticket_id, "reply",
+                            lambda: generate_reply(
+                                ticket["Name"], ticket["Message"], labels.get("sentiment"), labels.get("issue_type")
+                            ),
+                            keep=is_usable_reply,
+                        )
+                    except ReplyUnavailable as e:
+                        st.error(f"❌ Could not generate a reply ({e}). Please try again later.")
+                        st.stop()
+
+                if BUSY in (classify_status, reply_status):
+                    st.warning("⏳ This ticket is being processed in another session.")
+                    st.stop()
 
                 st.success("✅ AI Analysis Complete")
                 st.markdown(f"**Sentiment:** `{classification['sentiment']}`")
@@ -46,17 +68,9 @@ else:
                 st.markdown("**📬 Suggested Reply:**")
                 st.text_area("Auto-Generated Reply", reply, height=140)
 
-                # Save to primary sheet
+                # Save to primary sheet (the row is looked up by TicketID, since row numbers shift)
                 update_ticket(
-                    row_number=i + 1,
-                    sentiment=classification["sentiment"],
-                    issue_type=classification["issue_type"],
-                    reply=reply
-                )
-
-                # Save to 'ProcessedTickets' tab
-                append_processed_ticket(
-                    ticket=ticket,
+                    ticket_id=ticket_id,
                     sentiment=classification["sentiment"],
                     issue_type=classification["issue_type"],
                     reply=reply
@@ -64,15 +78,28 @@ else:
 
                 # Auto-send email
                 with st.spinner("📤 Sending email reply..."):
-                    success = send_email_smtp(
-                        to=ticket['Email'],
-                        subject="Regarding Your Support Ticket",
-                        body=reply
+                    email_status, result = ledger.run_once(
+                        ticket_id, "email",
+                        lambda: send_email_smtp(
+                            to=ticket['Email'],
+                            subject="Regarding Your Support Ticket",
+                            body=reply
+                        ),
+                        keep=lambda r: r.get("status") == "success",
                     )
 
-                if success:
-                    st.success("📬 Email sent successfully!")
+                if email_status == BUSY:
+                    st.warning("⏳ This reply is being sent from another session.")
+                elif result.get("status") == "success":
+                    # Save to 'ProcessedTickets' tab once, together with the email
+                    if email_status != DONE:
+                        append_processed_ticket(
+                            ticket=ticket,
+                            sentiment=classification["sentiment"],
+                            issue_type=classification["issue_type"],
+                            reply=reply
+                        )
+                    st.success("📬 Email sent successfully!" if email_status != DONE else "📬 Email was already sent.")
+                    st.info("📝 Ticket updated, logged, and customer notified.")
                 else:
                     st.error("❌ Failed to send email. Check SMTP/app password setup.")
-
-                st.info("📝 Ticket updated, logged, and customer notified.")
@@ -1,53 +1,115 @@
-from mcp.server.fastmcp import FastMCP
-from tools.sheet_connector import update_ticket, append_processed_ticket
+import asyncio
+import json
+import os
+from datetime import datetime
+from mcp.server.fastmcp import Context, FastMCP
+from pydantic import BaseModel
+from tools import metrics, settings
 from tools.classify_ticket import classify_ticket
-from tools.generate_reply import generate_reply
-from tools.gmail_sender import send_email_smtp
+from tools.generate_reply import astream_reply, generate_reply
+from tools.ledger import new_ticket_id
+from tools.outbox import enqueue_reply, start_outbox_worker
 
+# Tickets resolved at the same time by one resolve_tickets call
+MCP_BATCH_CONCURRENCY = int(os.getenv("MCP_BATCH_CONCURRENCY", "8"))
 
 mcp = FastMCP("AICustomerSupportTicketResolver")
 
+class TicketInput(BaseModel):
+    name: str
+    email: str
+    message: str
+
+def _queue_reply(ticket):
+    start_outbox_worker()
+    return enqueue_reply(ticket, subject="Regarding Your Support Ticket", source="mcp")
+
+async def _stream_reply(name: str, message: str, ctx: Context) -> str:
+    """
+    Generate the reply, forwarding each chunk to the client as a progress notification.
+    """
+    parts = []
+    async for chunk in astream_reply(name, message):
+        parts.append(chunk)
+        await ctx.report_progress(len(parts), None, message=chunk)
+    return "".join(parts)
+
+async def _resolve(name: str, email: str, message: str, ctx: Context | None = None) -> dict:
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    ticket_id = new_ticket_id()
+    # Threads and tasks started below inherit the ticket ID, so their spans are tagged with it
+    with metrics.ticket_context(ticket_id):
+        try:
+            # Steps 1 + 2: classification and reply generation don't depend on each other
+            reply_step = _stream_reply(name, message, ctx) if ctx else asyncio.to_thread(generate_reply, name, message)
+            classification, reply = await asyncio.gather(
+                asyncio.to_thread(classify_ticket, message),
+                reply_step,
+            )
+            sentiment = classification["sentiment"]
+            issue_type = classification["issue_type"]
+
+            # Step 3: Queue the email; the outbox worker sends it and appends to ProcessedTickets
+            ticket = {
+                "timestamp": timestamp,
+                "Name": name,
+                "Email": email,
+                "IssueType": issue_type,
+                "Message": message,
+                "Sentiment": sentiment,
+                "IssueType_Label": issue_type,
+                "AutoReply": reply,
+                "TicketID": ticket_id
+            }
+            outbox_id = await asyncio.to_thread(_queue_reply, ticket)
+
+            return {
+                    "status": "success",
+                    "ticket_id": ticket_id,
+                    "email": email,
+                    "sentiment": sentiment,
+                    "issue_type": issue_type,
+                    "reply": reply,
+                    "email_status": "queued" if outbox_id else "duplicate",
+                    "email_message": f"Email to {email} queued for delivery (outbox id {outbox_id})."
+                                     if outbox_id else "An identical reply is already queued."
+                  }
+
+        except Exception as e:
+            return {
+                "status": "error",
+                "email": email,
+                "message": str(e)
+            }
+
 @mcp.tool(name="resolve_ticket", description="Classifies, replies, updates, and emails a support ticket.")
-def resolve_ticket(name: str, email: str, message: str) -> dict:
-    try:
-        # Step 1: AI Classify
-        classification = classify_ticket(message)
-        sentiment = classification["sentiment"]
-        issue_type = classification["issue_type"]
-
-        # Step 2: Generate reply
-        reply = generate_reply(name, message)
-
-        # Step 3: Update Google Sheet (append only)
-        fake_ticket = {
-            "Name": name,
-            "Email": email,
-            "IssueType": issue_type,
-            "Message": message
-        }
-        append_processed_ticket(fake_ticket, sentiment, issue_type, reply)
-
-        # Step 4: Send Email
-        mail_result = send_email_smtp(
-                        to=email,
-                        subject="Regarding Your Support Ticket",
-                        body=reply
-                    )
-
-        return {
-                "status": "success",
-                "sentiment": sentiment,
-                "issue_type": issue_type,
-                "reply": reply,
-                "email_status": mail_result.get("status"),
-                "email_message": mail_result.get("message", "Email sent.")
-              }
-
-    except Exception as e:
-        return {
-            "status": "error",
-            "message": str(e)
-        }
+async def resolve_ticket(name: str, email: str, message: str, ctx: Context) -> dict:
+    # Reply tokens are streamed to the client as progress notifications while they are generated
+    return await _resolve(name, email, message, ctx)
+
+@mcp.tool(
+    name="resolve_tickets",
+    description="Resolves many support tickets concurrently, streaming each result as a progress notification as soon as it finishes."
+)
+async def resolve_tickets(tickets: list[TicketInput], ctx: Context) -> list[dict]:
+    semaphore = asyncio.Semaphore(MCP_BATCH_CONCURRENCY)
+    results = [None] * len(tickets)
+
+    async def run(index, ticket):
+        async with semaphore:
+            return index, await _resolve(ticket.name, ticket.email, ticket.message)
+
+    done = 0
+    for finished in asyncio.as_completed([run(i, t) for i, t in enumerate(tickets)]):
+        index, result = await finished
+        results[index] = result
+        done += 1
+        payload = json.dumps({"index": index, **result})
+        await ctx.report_progress(done, len(tickets), message=payload)
+        await ctx.info(payload)
+    return results
 
 if __name__ == "__main__":
+    settings.configure_console()
+    metrics.start_metrics_server()  # only when METRICS_PORT is set
     mcp.run()
@@ -1,6 +1,7 @@
+import os
+import urllib.request
 import streamlit as st
-from datetime import datetime
-from tools.sheet_connector import get_pending_sheet
+from tools.intake import IntakeFull, get_intake, start_intake_flusher
 
 # ------------------- PAGE CONFIG -------------------
 st.set_page_config(
@@ -39,16 +40,36 @@ st.title("📩 Submit a Support Ticket")
 st.markdown("Please fill out the form below, and our support team will get back to you soon.")
 
 # ------------------- FORM -------------------
+# Optional push to a running worker.py, e.g. http://localhost:8765/notify
+WORKER_NOTIFY_URL = os.getenv("WORKER_NOTIFY_URL")
+
+def notify_worker():
+    if not WORKER_NOTIFY_URL:
+        return
+    try:
+        urllib.request.urlopen(urllib.request.Request(WORKER_NOTIFY_URL, data=b"", method="POST"), timeout=2)
+    except Exception as e:
+        # The worker still picks the ticket up on its next poll
+        print(f"⚠️ Could not notify worker: {e}")
+
+# Runs once per process; also writes out tickets journaled before a restart
+start_intake_flusher(on_flushed=lambda tickets: notify_worker())
+
 def append_ticket_to_pending(name, email, issue_type, message):
-    sheet = get_pending_sheet()
+    """
+    Queue the ticket with a new TicketID, which every later step uses to find it.
+    The ticket is in the local intake journal when this returns; the background
+    flusher appends it to PendingTickets (and then notifies the worker).
+    Returns the TicketID, or None if it could not be queued.
+    """
     try:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # Append with placeholders for Sentiment, IssueType, Reply
-        sheet.append_row([timestamp, name, email, issue_type, message, "", "", ""])
-        return True
+        return get_intake().submit(name, email, issue_type, message)
+    except IntakeFull:
+        st.warning("⏳ We are receiving an unusually high number of tickets. Please try again in a minute.")
+        return None
     except Exception as e:
-        st.error(f"Failed to append ticket to PendingTickets: {e}")
-        return False
+        st.error(f"Failed to queue ticket: {e}")
+        return None
 
 with st.form("ticket_form"):
     st.subheader("📄 Ticket Information")
@@ -70,6 +91,6 @@ with st.form("ticket_form"):
         if not name.strip() or not email.strip() or not message.strip():
             st.error("⚠️ Please fill in all required fields.")
         else:
-            success = append_ticket_to_pending(name.strip(), email.strip(), issue_type, message.strip())
-            if success:
-                st.success("✅ Your ticket has been submitted successfully!")
+            ticket_id = append_ticket_to_pending(name.strip(), email.strip(), issue_type, message.strip())
+            if ticket_id:
+                st.success(f"✅ Your ticket has been submitted successfully! Your ticket ID is **{ticket_id}**.")
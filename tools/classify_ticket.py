@@ -1,54 +1,330 @@
 import os
 import json
-from dotenv import load_dotenv
-from groq import Groq
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tools import metrics
+from tools.llm_cache import estimate_tokens, get_llm_cache, make_key
+from tools.local_classifier import LOCAL_CLASSIFIER_ENABLED, LOCAL_CLASSIFIER_THRESHOLD, local_classify
+from tools.model_router import (
+    LARGE_MODEL, SMALL_MODEL, cache_tag, classification_escalation,
+    classification_models, record_escalation, record_model_call, record_route,
+)
+from tools.prompt_budget import (
+    CLASSIFY_BATCH_ITEM_TOKENS, CLASSIFY_MAX_TOKENS, CLASSIFY_MESSAGE_TOKENS,
+    compact_message, record_completion, record_compaction,
+)
+from tools.rate_limit import groq_limiter
+from tools.settings import get_groq_client
+from tools.structured_output import (
+    CLASSIFY_PARSE_RETRIES, ClassificationParseError,
+    parse_batch_classification, parse_classification, response_format,
+)
 
-load_dotenv()
+# Bump whenever the prompt below changes so cached results are not reused
+CLASSIFY_PROMPT_VERSION = "4"
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise ValueError("🚫 GROQ_API_KEY is missing from your .env file")
+# Parallel classification settings
+CLASSIFY_MAX_WORKERS = int(os.getenv("CLASSIFY_MAX_WORKERS", "8"))
+# Tickets per completion in batch mode (1 disables batching)
+CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", "10"))
 
-client = Groq(api_key=GROQ_API_KEY)
+def local_fast_path(text: str):
+    """
+    Try the local classifier tier; returns a classification if it is confident
+    enough (LOCAL_CLASSIFIER_THRESHOLD), otherwise None so the caller asks Groq.
+    """
+    if not LOCAL_CLASSIFIER_ENABLED:
+        return None
+    with metrics.timed("local_classifier.latency"):
+        result = local_classify(text)
+    if result["confidence"] >= LOCAL_CLASSIFIER_THRESHOLD:
+        metrics.incr("local_classifier.accepted")
+        return {"sentiment": result["sentiment"], "issue_type": result["issue_type"]}
+    metrics.incr("local_classifier.escalated")
+    return None
 
-def classify_ticket(text: str) -> dict:
+def _complete(model, task, prompt, max_tokens, buckets, temperature=0.3, **tags):
+    """
+    One non-streaming classification completion in JSON mode (CLASSIFY_JSON_MODE).
+    Returns (content, usage). The latency is attributed to the size bucket of each message in the prompt.
+    """
+    options = {"response_format": response_format()} if response_format() else {}
+    groq_limiter.acquire()
+    with metrics.span("groq.completion", model=model, task=task, bytes_out=len(prompt), **tags) as call:
+        start = time.perf_counter()
+        completion = get_groq_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=False,  # no streaming for classification, simpler usage
+            **options
+        )
+        elapsed = time.perf_counter() - start
+        usage = getattr(completion, "usage", None)
+        for bucket in buckets:
+            record_completion(task, bucket, elapsed, completion.choices[0].finish_reason)
+        record_model_call(model, task, elapsed, usage)
+        metrics.record_usage(call, usage)
+
+        # The response content text is here:
+        content = completion.choices[0].message.content
+        call.set(bytes_in=len(content or ""))
+    return content, usage
+
+def _request_classification(model, prompt, bucket, retries=0):
+    """
+    Ask `model` to classify, retrying an unparseable answer up to `retries` times at
+    temperature 0. Returns (classification, tokens used); raises ClassificationParseError.
+    """
+    temperature = 0.3
+    tokens = 0
+    while True:
+        content, usage = _complete(model, "classify", prompt, CLASSIFY_MAX_TOKENS, [bucket], temperature=temperature)
+        print("📨 Groq Raw Response:", content)
+        tokens += getattr(usage, "total_tokens", None) or estimate_tokens(prompt + (content or ""))
+        try:
+            return parse_classification(content), tokens
+        except ClassificationParseError as e:
+            print(f"⚠️ Unparseable classification from {model} ({e.kind}): {e}")
+            if retries <= 0:
+                raise
+            retries -= 1
+            metrics.incr("parse.classify.retries")
+            temperature = 0.0
+
+def classify_ticket(text: str, models=None) -> dict:
+    """
+    Classify one ticket with Groq. By default the small model answers first and the
+    large model is only asked when the small one fails, is unsure or returns labels
+    that do not parse (see tools.model_router); pass `models` to force a model order.
+    An unparseable answer from the last model is retried CLASSIFY_PARSE_RETRIES times
+    before the ticket is left Unknown (counted as parse.classify.defaulted).
+    Confident local predictions (local_fast_path) skip Groq entirely.
+    """
+    local = local_fast_path(text)
+    if local is not None:
+        return local
+    return _classify_with_groq(text, models)
+
+def _classify_with_groq(text, models=None, task="classify"):
+    """
+    classify_ticket() without the local tier, for callers that already ran it.
+    The route is recorded under `task` unless `models` is given, in which case the
+    caller has already recorded it there; escalations are always counted under `task`.
+    """
+    cache = get_llm_cache()
+    cache_key = make_key(cache_tag(), CLASSIFY_PROMPT_VERSION, text)
+    if cache:
+        cached = cache.get("classify", cache_key)
+        if cached is not None:
+            return cached
+
+    message, original_tokens, message_tokens = compact_message(text, CLASSIFY_MESSAGE_TOKENS)
+    bucket = record_compaction("classify", original_tokens, message_tokens)
+    if models is None:
+        models, reason = classification_models(original_tokens)
+        record_route(task, reason)
     prompt = f"""
 You are a smart support ticket classifier.
 
 Given a customer ticket, classify it into:
 - Sentiment: Positive, Negative, Neutral
 - Issue Type: Billing, Technical, Login, General, Other
+- Confidence: how sure you are of both labels, from 0 to 1
 
 Respond ONLY with a JSON object like this:
 {{
   "sentiment": "Negative",
-  "issue_type": "Billing"
+  "issue_type": "Billing",
+  "confidence": 0.9
 }}
 
 Customer Ticket:
-\"\"\"{text}\"\"\"
+\"\"\"{message}\"\"\"
 """
 
-    try:
-        completion = client.chat.completions.create(
-            model="llama3-70b-8192",  # your intended model
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=500,
-            temperature=0.3,
-            stream=False  # no streaming for classification, simpler usage
-        )
+    for attempt, model in enumerate(models, start=1):
+        last = attempt == len(models)
+        try:
+            result, tokens = _request_classification(model, prompt, bucket, CLASSIFY_PARSE_RETRIES if last else 0)
+        except ClassificationParseError:
+            if not last:
+                record_escalation(task, "invalid_json")
+                continue
+            metrics.incr("parse.classify.defaulted")
+            break
+        except Exception as e:
+            print(f"⚠️ Classification Error ({model}):", e)
+            if not last:
+                record_escalation(task, "error")
+                continue
+            break
 
-        # The response content text is here:
-        content = completion.choices[0].message.content
-        print("📨 Groq Raw Response:", content)
+        reason = None if last else classification_escalation(result)
+        if reason:
+            record_escalation(task, reason)
+            continue
+        result = {"sentiment": result["sentiment"], "issue_type": result["issue_type"]}
+        if cache:
+            cache.set("classify", cache_key, result, tokens=tokens)
+        return result
+    return {"sentiment": "Unknown", "issue_type": "General"}
+
+def _classify_group(model, group):
+    """
+    Classify `group` ({ticket_id: (text, compacted message, size bucket)}) in one
+    completion with `model`. Items the small model is unsure of are re-asked of the
+    large model in one more completion; missing or invalid items are classified one by one.
+    Routes were recorded by classify_ticket_batch(), so a lone item keeps them.
+    """
+    cache = get_llm_cache()
+    results = {}
+    if len(group) == 1:
+        (ticket_id, (text, _, _)), = group.items()
+        models = [model] if model == LARGE_MODEL else [SMALL_MODEL, LARGE_MODEL]
+        results[ticket_id] = _classify_with_groq(text, models=models, task="classify_batch")
+        return results
 
-        # Safely parse JSON string returned by the model
-        parsed = json.loads(content)
-        return {
-            "sentiment": parsed.get("sentiment", "Unknown"),
-            "issue_type": parsed.get("issue_type", "General")
-        }
+    tickets_block = "\n".join(
+        json.dumps({"id": ticket_id, "message": message}, ensure_ascii=False)
+        for ticket_id, (_, message, _) in group.items()
+    )
+    prompt = f"""
+You are a smart support ticket classifier.
+
+Classify EACH customer ticket below into:
+- sentiment: Positive, Negative, Neutral
+- issue_type: Billing, Technical, Login, General, Other
+- confidence: how sure you are of both labels, from 0 to 1
 
+Respond ONLY with a JSON object whose "tickets" array holds one object per ticket, using the ticket's id, like this:
+{{"tickets": [
+  {{"id": "1", "sentiment": "Negative", "issue_type": "Billing", "confidence": 0.9}}
+]}}
+
+Tickets (one JSON object per line):
+{tickets_block}
+"""
+
+    parsed = {}
+    try:
+        content, usage = _complete(model, "classify_batch", prompt, CLASSIFY_BATCH_ITEM_TOKENS * len(group) + 50,
+                                   [bucket for _, _, bucket in group.values()], items=len(group))
+        parsed = parse_batch_classification(content, set(group))
+        metrics.incr("classify.batch_requests")
+        metrics.incr("classify.batch_items", len(parsed))
+        total_tokens = getattr(usage, "total_tokens", None) or estimate_tokens(prompt + content)
     except Exception as e:
-        print("⚠️ Classification Error:", e)
-        return {"sentiment": "Unknown", "issue_type": "General"}
+        print("⚠️ Batch Classification Error:", e)
+
+    escalated = {}
+    for ticket_id, (text, message, bucket) in group.items():
+        if ticket_id not in parsed:
+            metrics.incr("classify.batch_fallbacks")
+            results[ticket_id] = _classify_with_groq(text)
+            continue
+        reason = classification_escalation(parsed[ticket_id]) if model != LARGE_MODEL else None
+        if reason:
+            record_escalation("classify_batch", reason)
+            escalated[ticket_id] = (text, message, bucket)
+            continue
+        result = {"sentiment": parsed[ticket_id]["sentiment"], "issue_type": parsed[ticket_id]["issue_type"]}
+        if cache:
+            key = make_key(cache_tag(), CLASSIFY_PROMPT_VERSION, text)
+            cache.set("classify", key, result, tokens=total_tokens // len(group))
+        results[ticket_id] = result
+    if escalated:
+        results.update(_classify_group(LARGE_MODEL, escalated))
+    return results
+
+def classify_ticket_batch(messages: dict) -> dict:
+    """
+    Classify several tickets in one completion.
+    `messages` maps ticket ID -> message text; returns ticket ID -> {"sentiment", "issue_type"}.
+    Cached messages skip the LLM; the rest are batched per routed model (long messages
+    go to the large model, see tools.model_router) and classified by _classify_group().
+    The local tier is not consulted; classify_tickets() runs it before batching.
+    """
+    cache = get_llm_cache()
+    results = {}
+    pending = {}
+    for ticket_id, text in messages.items():
+        cached = cache.get("classify", make_key(cache_tag(), CLASSIFY_PROMPT_VERSION, text)) if cache else None
+        if cached is not None:
+            results[ticket_id] = cached
+        else:
+            pending[str(ticket_id)] = text
+
+    if not pending:
+        return results
+    if len(pending) == 1:
+        ticket_id, text = next(iter(pending.items()))
+        results[ticket_id] = _classify_with_groq(text)
+        return results
+
+    groups = {}
+    for ticket_id, text in pending.items():
+        message, original_tokens, message_tokens = compact_message(text, CLASSIFY_MESSAGE_TOKENS)
+        models, reason = classification_models(original_tokens)
+        record_route("classify_batch", reason)
+        bucket = record_compaction("classify_batch", original_tokens, message_tokens)
+        groups.setdefault(models[0], {})[ticket_id] = (text, message, bucket)
+    if not groups:
+        return results
+    if len(groups) == 1:
+        (model, group), = groups.items()
+        results.update(_classify_group(model, group))
+        return results
+    # Small- and large-model batches are independent; don't make one wait for the other
+    with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+        for group_results in pool.map(lambda item: _classify_group(*item), groups.items()):
+            results.update(group_results)
+    return results
+
+def classify_tickets(tickets, max_workers=CLASSIFY_MAX_WORKERS, batch_size=CLASSIFY_BATCH_SIZE):
+    """
+    Classify every ticket without an IssueType_Label in parallel, bounded by
+    `max_workers` threads and the shared Groq rate limiter. Tickets are sent
+    `batch_size` per completion (see classify_ticket_batch).
+    Fills 'Sentiment' and 'IssueType_Label' in place and returns the tickets
+    that were classified successfully (i.e. worth writing back); tickets whose
+    classification failed are left unlabelled so a later run retries them.
+    """
+    unlabelled = [t for t in tickets if not t.get("IssueType_Label")]
+    if not unlabelled:
+        return []
+
+    # Confident local predictions never reach Groq
+    classified = []
+    todo = []
+    for ticket in unlabelled:
+        local = local_fast_path(ticket["Message"])
+        if local is None:
+            todo.append(ticket)
+        else:
+            ticket["IssueType_Label"] = local["issue_type"]
+            ticket["Sentiment"] = local["sentiment"]
+            classified.append(ticket)
+    if not todo:
+        return classified
+
+    batch_size = max(1, batch_size)
+    chunks = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+
+    def classify_chunk(chunk):
+        if len(chunk) == 1:
+            return [_classify_with_groq(chunk[0]["Message"])]
+        by_id = classify_ticket_batch({str(i): t["Message"] for i, t in enumerate(chunk, start=1)})
+        return [by_id[str(i)] for i in range(1, len(chunk) + 1)]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as pool:
+        results = [r for chunk_results in pool.map(classify_chunk, chunks) for r in chunk_results]
+
+    for ticket, classification in zip(todo, results):
+        if classification.get("sentiment") == "Unknown":
+            continue
+        ticket["IssueType_Label"] = classification["issue_type"]
+        ticket["Sentiment"] = classification["sentiment"]
+        classified.append(ticket)
+    return classified
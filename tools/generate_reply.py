@@ -1,16 +1,61 @@
-import os
-from dotenv import load_dotenv
-from groq import Groq
+import asyncio
+import contextvars
+import threading
+import time
+from tools import metrics
+from tools.llm_cache import estimate_tokens, get_llm_cache, make_key
+from tools.model_router import record_model_call, record_route, reply_model
+from tools.prompt_budget import REPLY_MESSAGE_TOKENS, compact_message, record_completion, record_compaction, reply_max_tokens
+from tools.rate_limit import groq_limiter
+from tools.reply_templates import find_template_reply
+from tools.settings import get_groq_client
 
-load_dotenv()
+# Bump whenever the prompt below changes so cached replies are not reused
+REPLY_PROMPT_VERSION = "2"
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise ValueError("🚫 GROQ_API_KEY is missing from your .env file")
+# Apology that used to be returned in place of a reply when Groq failed; ledgers may still hold it
+_FALLBACK_MARKER = "unable to process your request"
 
-client = Groq(api_key=GROQ_API_KEY)
+class ReplyUnavailable(RuntimeError):
+    """
+    Groq failed or the stream broke off, so there is no complete reply to store or send.
+    """
 
-def generate_reply(name: str, text: str) -> str:
+def is_usable_reply(reply):
+    """
+    Whether a reply can be stored and emailed (a `keep` predicate for ProcessingLedger.run_once).
+    """
+    return bool(reply and str(reply).strip()) and _FALLBACK_MARKER not in str(reply).lower()
+
+def stream_reply(name: str, text: str, sentiment=None, issue_type=None):
+    """
+    Generate a reply, yielding text chunks as they arrive from Groq.
+    Cached and reused (tools.reply_templates) replies are yielded as a single chunk.
+    Time to first token and total latency are recorded as reply.ttft / reply.latency in tools.metrics.
+    Raises ReplyUnavailable, after any chunks that did arrive, if no complete reply was written.
+    `sentiment` and `issue_type`, when the ticket is already classified, let Negative
+    tickets go to the large model and near-duplicates of past tickets reuse their reply.
+    """
+    start = time.perf_counter()
+    message, original_tokens, message_tokens = compact_message(text, REPLY_MESSAGE_TOKENS)
+    model, route_reason = reply_model(original_tokens, sentiment)
+    cache = get_llm_cache()
+    cache_key = make_key(model, REPLY_PROMPT_VERSION, name, text)
+    if cache:
+        cached = cache.get("reply", cache_key)
+        if cached is not None:
+            metrics.observe("reply.ttft_cached", time.perf_counter() - start)
+            yield cached
+            return
+
+    reused = find_template_reply(name, text, issue_type, sentiment)
+    if reused is not None:
+        metrics.observe("reply.ttft_template", time.perf_counter() - start)
+        yield reused
+        return
+
+    bucket = record_compaction("reply", original_tokens, message_tokens)
+    record_route("reply", route_reason)
     prompt = f"""
 You are a friendly and professional customer support agent.
 
@@ -23,40 +68,102 @@ Customer Support Team
 Customer Name: {name}
 
 Issue:
-\"\"\"{text}\"\"\"
+\"\"\"{message}\"\"\"
 
 Only return the final response message.
 """
 
-    try:
-        completion = client.chat.completions.create(
-            model="llama3-70b-8192",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=500,
-            top_p=1,
-            stream=True,
-            stop=None,
-        )
-    except Exception as e:
-        print(f"⚠️ API call failed: {e}")
-        return f"Hello {name},\n\nWe are currently unable to process your request. Please try again later.\n\nBest regards,\nCustomer Support Team"
-
-    reply_text = ""  # Collect reply here
-
-    try:
-        for chunk in completion:
-            if hasattr(chunk, "choices") and chunk.choices:
-                delta_content = getattr(chunk.choices[0].delta, "content", None)
-                if delta_content:
-                    print(delta_content, end="", flush=True)  # optional: streaming print
-                    reply_text += delta_content
-            else:
-                print("\n⚠️ Unexpected chunk format or error received.", flush=True)
-                break
-
-    except Exception as e:
-        print(f"\n⚠️ Error during streaming response: {e}", flush=True)
-
-    print()  # newline after streaming print
-    return reply_text
+    parts = []  # Collect reply chunks here; joined once at the end
+    usage = None
+    complete = True
+    finish_reason = None
+
+    groq_limiter.acquire()
+    with metrics.span("groq.completion", model=model, task="reply", stream=True, bytes_out=len(prompt)) as call:
+        try:
+            completion = get_groq_client().chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7,
+                max_tokens=reply_max_tokens(message_tokens),
+                top_p=1,
+                stream=True,
+                stop=None,
+            )
+        except Exception as e:
+            print(f"⚠️ API call failed: {e}")
+            call.set(status="error")
+            metrics.incr("reply.failures")
+            raise ReplyUnavailable(f"reply request failed: {e}") from e
+
+        try:
+            for chunk in completion:
+                if hasattr(chunk, "choices") and chunk.choices:
+                    delta_content = getattr(chunk.choices[0].delta, "content", None)
+                    if delta_content:
+                        if not parts:
+                            metrics.observe("reply.ttft", time.perf_counter() - start)
+                            call.set(ttft_s=time.perf_counter() - start)
+                        parts.append(delta_content)
+                        yield delta_content
+                    finish_reason = getattr(chunk.choices[0], "finish_reason", None) or finish_reason
+                    # Groq reports token usage on the final chunk
+                    x_groq = getattr(chunk, "x_groq", None)
+                    usage = getattr(x_groq, "usage", None) or usage
+                else:
+                    print("\n⚠️ Unexpected chunk format or error received.", flush=True)
+                    complete = False
+                    break
+
+        except Exception as e:
+            print(f"\n⚠️ Error during streaming response: {e}", flush=True)
+            complete = False
+
+        metrics.record_usage(call, usage)
+        if not complete:
+            call.set(status="error")
+        call.set(bytes_in=sum(len(p) for p in parts))
+
+    metrics.observe("reply.latency", time.perf_counter() - start)
+    record_completion("reply", bucket, time.perf_counter() - start, finish_reason)
+    record_model_call(model, "reply", time.perf_counter() - start, usage)
+    reply_text = "".join(parts)
+    if not complete or not reply_text.strip():
+        metrics.incr("reply.failures")
+        raise ReplyUnavailable("reply stream ended early" if parts else "empty reply")
+    if cache:
+        tokens = getattr(usage, "total_tokens", None) or estimate_tokens(prompt + reply_text)
+        cache.set("reply", cache_key, reply_text, tokens=tokens)
+
+def generate_reply(name: str, text: str, sentiment=None, issue_type=None) -> str:
+    return "".join(stream_reply(name, text, sentiment, issue_type))
+
+async def astream_reply(name: str, text: str, sentiment=None, issue_type=None):
+    """
+    Async iterator over stream_reply(); the blocking Groq stream is consumed in a worker thread.
+    Its exceptions (e.g. ReplyUnavailable) are raised here once the chunks before them are consumed.
+    """
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    done = object()
+    error = []
+
+    def produce():
+        try:
+            for chunk in stream_reply(name, text, sentiment, issue_type):
+                loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+        except BaseException as e:
+            error.append(e)
+        finally:
+            loop.call_soon_threadsafe(chunks.put_nowait, done)
+
+    # Run in a copy of the caller's context so spans keep the caller's ticket ID
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(produce,), name="reply-stream", daemon=True).start()
+    while True:
+        chunk = await chunks.get()
+        if chunk is done:
+            if error:
+                raise error[0]
+            return
+        yield chunk
@@ -1,44 +1,165 @@
+import atexit
 import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
-from dotenv import load_dotenv
-import sys
-sys.stdout.reconfigure(encoding='utf-8')
+from tools import metrics
+from tools.settings import get_email_credentials
 
-# Load environment variables
-load_dotenv()
 
-EMAIL_ADDRESS = os.getenv("EMAIL_ADDRESS")
-EMAIL_APP_PASSWORD = os.getenv("EMAIL_APP_PASSWORD")
+# SMTP connection settings (override to point at a local test server)
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_AUTH = os.getenv("SMTP_AUTH", "1") == "1"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "3"))
+# Reconnect after this many messages; Gmail drops long-lived sessions around 100 messages
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "90"))
+# Idle connections older than this are checked with NOOP before reuse
+SMTP_IDLE_CHECK_SECONDS = float(os.getenv("SMTP_IDLE_CHECK_SECONDS", "30"))
 
-if not EMAIL_ADDRESS or not EMAIL_APP_PASSWORD:
-    raise ValueError("❌ EMAIL_ADDRESS or EMAIL_APP_PASSWORD not found in .env")
 
-print("🔐 Loaded credentials:")
-print("Email:", EMAIL_ADDRESS)
-print("App Password (length):", len(EMAIL_APP_PASSWORD))
+class SMTPPool:
+    """
+    Pool of authenticated SMTP sessions. Each session is reused for many messages,
+    health-checked after idling and replaced transparently when the server drops it.
+    Credentials default to EMAIL_ADDRESS / EMAIL_APP_PASSWORD.
+    """
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, username=None, password=None,
+                 starttls=SMTP_STARTTLS, auth=SMTP_AUTH, size=SMTP_POOL_SIZE,
+                 max_messages=SMTP_MAX_MESSAGES_PER_CONNECTION, timeout=SMTP_TIMEOUT):
+        if username is None or password is None:
+            username, password = get_email_credentials()
+            print(f"🔐 Loaded SMTP credentials for {username}")
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.auth = auth
+        self.size = max(1, size)
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self._idle = []  # [server, messages_sent, last_used]
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def _connect(self):
+        print(f"📡 Connecting to {self.host}:{self.port}...")
+        with metrics.span("smtp.connect", host=self.host, starttls=self.starttls):
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            server.set_debuglevel(0)  # Set to 1 to enable full SMTP debug
+            if self.starttls:
+                server.starttls()
+        if self.auth:
+            with metrics.span("smtp.login", host=self.host):
+                server.login(self.username, self.password)
+        return [server, 0, time.monotonic()]
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn[0].quit()
+        except Exception:
+            try:
+                conn[0].close()
+            except Exception:
+                pass
+
+    def _checkout(self):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is not None and time.monotonic() - conn[2] > SMTP_IDLE_CHECK_SECONDS:
+            try:
+                if conn[0].noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected("NOOP failed")
+            except Exception:
+                self._discard(conn)
+                conn = None
+        return conn or self._connect()
+
+    def _checkin(self, conn):
+        conn[2] = time.monotonic()
+        if self.max_messages and conn[1] >= self.max_messages:
+            self._discard(conn)
+            return
+        with self._lock:
+            self._idle.append(conn)
+
+    def send_message(self, msg):
+        """
+        Send one message on a pooled session, reconnecting once if the session was dropped.
+        Any other error (refused sender or recipient, timeout mid-send) propagates without a
+        resend, since the server may already have accepted the message; the outbox retries
+        or dead-letters it.
+        """
+        with self._slots, metrics.span("smtp.send", bytes_out=len(msg.as_bytes()), retries=0) as call:
+            conn = self._checkout()
+            try:
+                try:
+                    conn[0].send_message(msg)
+                except (smtplib.SMTPServerDisconnected, ConnectionError):
+                    self._discard(conn)
+                    call.set(retries=1)
+                    conn = self._connect()
+                    conn[0].send_message(msg)
+            except Exception:
+                self._discard(conn)
+                raise
+            conn[1] += 1
+            self._checkin(conn)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._discard(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_smtp_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SMTPPool()
+            atexit.register(_pool.close)
+        return _pool
+
+def build_message(to, subject, body):
+    msg = MIMEMultipart()
+    msg['From'] = get_smtp_pool().username
+    msg['To'] = to
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+    return msg
 
 
 # ✅ Reusable Email Sender Function
 def send_email_smtp(to, subject, body):
     try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_ADDRESS
-        msg['To'] = to
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
-
-        print(f"📡 Connecting to smtp.gmail.com to send email to {to}...")
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.set_debuglevel(0)  # Set to 1 to enable full SMTP debug
-        server.starttls()
-        server.login(EMAIL_ADDRESS, EMAIL_APP_PASSWORD)
-        server.send_message(msg)
-        server.quit()
-
+        get_smtp_pool().send_message(build_message(to, subject, body))
         print("✅ Email sent successfully to:", to)
         return {"status": "success", "message": f"Email sent to {to}"}
     except Exception as e:
         print("❌ Failed to send email:", e)
         return {"status": "error", "message": str(e)}
+
+def send_many(messages):
+    """
+    Send many emails over the pooled SMTP sessions, SMTP_POOL_SIZE at a time.
+    `messages` is an iterable of dicts with 'to', 'subject' and 'body'.
+    Returns one send_email_smtp()-style result dict per message, in order.
+    """
+    messages = list(messages)
+    if not messages:
+        return []
+    workers = max(1, min(get_smtp_pool().size, len(messages)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda m: send_email_smtp(m["to"], m["subject"], m["body"]), messages))
@@ -0,0 +1,270 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from tools import metrics
+from tools.ledger import new_ticket_id
+
+# Write-behind buffer for ticket submissions: register_ticket.py acknowledges a ticket
+# once it is committed to this local journal, and a flusher thread appends queued
+# tickets to PendingTickets in batched multi-row writes.
+INTAKE_PATH = os.getenv("INTAKE_PATH", "intake.db")
+INTAKE_BATCH_SIZE = int(os.getenv("INTAKE_BATCH_SIZE", "100"))
+INTAKE_FLUSH_INTERVAL = float(os.getenv("INTAKE_FLUSH_INTERVAL", "1"))   # seconds between flushes
+INTAKE_MAX_QUEUED = int(os.getenv("INTAKE_MAX_QUEUED", "5000"))          # back-pressure: refuse submissions beyond this
+INTAKE_RETRY_BASE = float(os.getenv("INTAKE_RETRY_BASE", "5"))           # seconds, doubled per failed attempt
+INTAKE_RETRY_MAX = float(os.getenv("INTAKE_RETRY_MAX", "300"))
+INTAKE_LEASE_SECONDS = float(os.getenv("INTAKE_LEASE_SECONDS", "120"))   # reclaim 'flushing' rows after a crash
+INTAKE_RETENTION_SECONDS = float(os.getenv("INTAKE_RETENTION_SECONDS", "86400"))
+
+class IntakeFull(Exception):
+    """
+    Raised by IntakeJournal.submit() when INTAKE_MAX_QUEUED tickets are already waiting.
+    """
+
+class IntakeJournal:
+    """
+    SQLite journal of submitted tickets. Rows move queued -> flushing -> flushed;
+    a 'flushing' row whose lease expired (the flusher crashed mid-write) is picked up again.
+    """
+
+    def __init__(self, path=INTAKE_PATH, max_queued=INTAKE_MAX_QUEUED):
+        self.max_queued = max_queued
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # A submission is acknowledged on commit, so the commit has to reach the disk
+            self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS intake ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, ticket_id TEXT NOT NULL UNIQUE, ticket TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'queued', attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL, leased_until REAL, last_error TEXT,"
+            " created_at REAL NOT NULL, flushed_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_intake_due ON intake (status, next_attempt_at)")
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def submit(self, name, email, issue_type, message):
+        """
+        Durably queue a new ticket and return its TicketID.
+        Raises IntakeFull when the backlog is at INTAKE_MAX_QUEUED.
+        """
+        now = time.time()
+        ticket = {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "Name": name,
+            "Email": email,
+            "IssueType": issue_type,
+            "Message": message,
+            "TicketID": new_ticket_id(),
+        }
+
+        def insert(conn):
+            queued = conn.execute("SELECT COUNT(*) FROM intake WHERE status != 'flushed'").fetchone()[0]
+            if queued >= self.max_queued:
+                raise IntakeFull(f"{queued} tickets are waiting to be written")
+            conn.execute(
+                "INSERT INTO intake (ticket_id, ticket, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+                (ticket["TicketID"], json.dumps(ticket), now, now),
+            )
+
+        try:
+            self._transaction(insert)
+        except IntakeFull:
+            metrics.incr("intake.rejected")
+            raise
+        metrics.incr("intake.submitted")
+        return ticket["TicketID"]
+
+    def claim(self, limit=INTAKE_BATCH_SIZE):
+        """
+        Lease up to `limit` due tickets, oldest first. Each row's `attempts` counts
+        this claim, so attempts > 1 means an earlier write may already have landed.
+        """
+        now = time.time()
+
+        def lease(conn):
+            rows = conn.execute(
+                "SELECT * FROM intake WHERE (status = 'queued' AND next_attempt_at <= ?)"
+                " OR (status = 'flushing' AND leased_until < ?) ORDER BY id LIMIT ?",
+                (now, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE intake SET status = 'flushing', attempts = attempts + 1, leased_until = ? WHERE id = ?",
+                [(now + INTAKE_LEASE_SECONDS, row["id"]) for row in rows],
+            )
+            return [{**dict(row), "attempts": row["attempts"] + 1} for row in rows]
+
+        return self._transaction(lease)
+
+    def mark_flushed(self, ids):
+        now = time.time()
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE intake SET status = 'flushed', flushed_at = ?, leased_until = NULL WHERE id = ?",
+            [(now, i) for i in ids],
+        ))
+
+    def mark_failed(self, rows, error):
+        """
+        Put a failed batch back in the queue with exponential backoff.
+        """
+        now = time.time()
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE intake SET status = 'queued', last_error = ?, next_attempt_at = ?, leased_until = NULL WHERE id = ?",
+            [(str(error), now + min(INTAKE_RETRY_BASE * 2 ** (row["attempts"] - 1), INTAKE_RETRY_MAX), row["id"])
+             for row in rows],
+        ))
+
+    def purge(self, older_than=INTAKE_RETENTION_SECONDS):
+        """
+        Forget flushed tickets older than `older_than` seconds.
+        """
+        cutoff = time.time() - older_than
+        return self._transaction(lambda conn: conn.execute(
+            "DELETE FROM intake WHERE status = 'flushed' AND flushed_at < ?", (cutoff,)
+        ).rowcount)
+
+    def stats(self):
+        """
+        Tickets per status plus the age (seconds) of the oldest ticket not yet written.
+        """
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM intake GROUP BY status").fetchall())
+            oldest = self._conn.execute("SELECT MIN(created_at) FROM intake WHERE status != 'flushed'").fetchone()[0]
+        counts["oldest_age_s"] = time.time() - oldest if oldest else 0.0
+        return counts
+
+def _append_to_pending(tickets, retried):
+    """
+    Append tickets to PendingTickets in one call. Tickets from a retried batch that
+    are already in the Sheet (the earlier write landed) are not appended again.
+    """
+    from tools.sheet_connector import append_pending_tickets, existing_ticket_ids
+    if retried:
+        present = existing_ticket_ids([t["TicketID"] for t in tickets])
+        if present:
+            metrics.incr("intake.deduplicated", len(present))
+            tickets = [t for t in tickets if t["TicketID"] not in present]
+    if tickets:
+        append_pending_tickets(tickets)
+
+class IntakeFlusher:
+    """
+    Background thread that writes queued submissions to PendingTickets every
+    INTAKE_FLUSH_INTERVAL seconds, INTAKE_BATCH_SIZE rows per Sheets call.
+    """
+
+    def __init__(self, journal, batch_size=INTAKE_BATCH_SIZE, append=_append_to_pending, on_flushed=None):
+        self.journal = journal
+        self.batch_size = max(1, batch_size)
+        self.append = append
+        self.on_flushed = on_flushed
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def flush_once(self):
+        """
+        Write one batch. Returns the number of tickets claimed.
+        """
+        rows = self.journal.claim(self.batch_size)
+        if not rows:
+            return 0
+        tickets = [json.loads(row["ticket"]) for row in rows]
+        try:
+            with metrics.timed("intake.flush_latency"):
+                self.append(tickets, retried=any(row["attempts"] > 1 for row in rows))
+        except Exception as e:
+            self.journal.mark_failed(rows, e)
+            metrics.incr("intake.flush_errors")
+            print(f"🔁 Will retry writing {len(rows)} submitted tickets: {e}")
+            return len(rows)
+
+        self.journal.mark_flushed([row["id"] for row in rows])
+        now = time.time()
+        for row in rows:
+            # Time from the customer's submission until the row is in PendingTickets
+            metrics.observe("intake.flush_lag", now - row["created_at"])
+        metrics.incr("intake.flushed", len(rows))
+        if self.on_flushed:
+            try:
+                self.on_flushed(tickets)
+            except Exception as e:
+                print(f"⚠️ Intake flush callback failed: {e}")
+        return len(rows)
+
+    def _run(self):
+        last_purge = 0.0
+        while not self._stop_event.is_set():
+            try:
+                claimed = self.flush_once()
+                if time.time() - last_purge > 3600:
+                    self.journal.purge()
+                    last_purge = time.time()
+            except Exception as e:
+                print(f"⚠️ Intake flusher error: {e}")
+                claimed = 0
+            # A full batch means more are waiting; otherwise let submissions accumulate
+            if claimed < self.batch_size:
+                self._wake.wait(INTAKE_FLUSH_INTERVAL)
+                self._wake.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="intake-flusher", daemon=True)
+        self._thread.start()
+        return self
+
+    def notify(self):
+        """
+        Flush now instead of waiting for the next interval.
+        """
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        """
+        Stop after a final flush of whatever is due.
+        """
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        while self.flush_once() == self.batch_size:
+            pass
+
+_journal = None
+_flusher = None
+_intake_lock = threading.Lock()
+
+def get_intake():
+    global _journal
+    with _intake_lock:
+        if _journal is None:
+            _journal = IntakeJournal()
+        return _journal
+
+def start_intake_flusher(on_flushed=None):
+    """
+    Start the process-wide flusher once; later calls return the running flusher.
+    Rows left 'flushing' by a crashed process are retried once their lease expires.
+    """
+    global _flusher
+    journal = get_intake()
+    with _intake_lock:
+        if _flusher is None:
+            _flusher = IntakeFlusher(journal, on_flushed=on_flushed).start()
+        return _flusher
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from tools import metrics
+
+# Per-ticket processing ledger: each (ticket, stage) is claimed before the work starts
+# and its result stored when it finishes, so a ticket is classified and replied to at
+# most once no matter how many UI sessions, workers or retries see it. Emails are
+# deduplicated per ticket by the outbox, which keeps sent rows.
+LEDGER_PATH = os.getenv("LEDGER_PATH", "ticket_ledger.db")
+# A claim older than this is considered abandoned (crashed worker) and can be taken over
+LEDGER_LEASE_SECONDS = float(os.getenv("LEDGER_LEASE_SECONDS", "300"))
+
+DONE = "done"
+CLAIMED = "claimed"
+BUSY = "busy"
+
+def new_ticket_id():
+    """
+    A fresh TicketID, assigned once when a ticket is submitted.
+    """
+    return f"TKT-{uuid.uuid4().hex[:12].upper()}"
+
+def ticket_key(ticket):
+    """
+    Identify a ticket by its TicketID. Tickets submitted before TicketIDs existed
+    fall back to a hash of their submission timestamp, email and message.
+    """
+    ticket_id = str(ticket.get("TicketID") or "").strip()
+    if ticket_id:
+        return ticket_id
+    raw = "|".join(str(ticket.get(f, "")) for f in ("timestamp", "Email", "Message"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class ProcessingLedger:
+    """
+    SQLite table of (ticket_id, stage) -> running/done with the stored result.
+    Safe to share between threads and between processes on the same host.
+    """
+
+    def __init__(self, path=LEDGER_PATH, lease_seconds=LEDGER_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ledger ("
+                " ticket_id TEXT NOT NULL, stage TEXT NOT NULL, status TEXT NOT NULL, owner TEXT,"
+                " leased_until REAL, result TEXT, updated_at REAL NOT NULL,"
+                " PRIMARY KEY (ticket_id, stage))"
+            )
+
+    def claim(self, ticket_id, stage):
+        """
+        Try to take (ticket_id, stage). Returns (status, result):
+          (DONE, result)   - already finished; reuse `result`
+          (CLAIMED, token) - this caller now owns the work and must complete() or release() it with `token`
+          (BUSY, None)     - someone else (another process, thread or session) is working on it right now
+        """
+        token = f"{self.owner}:{uuid.uuid4().hex[:8]}"
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT status, owner, leased_until, result FROM ledger WHERE ticket_id = ? AND stage = ?",
+                    (ticket_id, stage),
+                ).fetchone()
+                if row is not None and row["status"] == DONE:
+                    self._conn.execute("COMMIT")
+                    metrics.incr(f"ledger.{stage}.reused")
+                    return DONE, json.loads(row["result"])
+                if row is not None and (row["leased_until"] or 0) > now:
+                    self._conn.execute("COMMIT")
+                    metrics.incr(f"ledger.{stage}.busy")
+                    return BUSY, None
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO ledger (ticket_id, stage, status, owner, leased_until, result, updated_at)"
+                    " VALUES (?, ?, 'running', ?, ?, NULL, ?)",
+                    (ticket_id, stage, token, now + self.lease_seconds, now),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        metrics.incr(f"ledger.{stage}.claimed")
+        return CLAIMED, token
+
+    def complete(self, ticket_id, stage, result, token):
+        """
+        Store the result of a claim. Returns False (and stores nothing) if the claim's
+        lease expired and someone else has taken the work over since.
+        """
+        with self._lock:
+            stored = self._conn.execute(
+                "UPDATE ledger SET status = ?, leased_until = NULL, result = ?, updated_at = ?"
+                " WHERE ticket_id = ? AND stage = ? AND status != ? AND owner = ?",
+                (DONE, json.dumps(result), time.time(), ticket_id, stage, DONE, token),
+            ).rowcount
+        if not stored:
+            metrics.incr(f"ledger.{stage}.lost_claims")
+        return bool(stored)
+
+    def release(self, ticket_id, stage, token):
+        """
+        Give up a claim without a result (the work failed) so it can be retried.
+        """
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM ledger WHERE ticket_id = ? AND stage = ? AND status != ? AND owner = ?",
+                (ticket_id, stage, DONE, token),
+            )
+
+    def discard(self, ticket_id, stage):
+        """
+        Forget a finished result so the stage runs again.
+        """
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM ledger WHERE ticket_id = ? AND stage = ? AND status = ?", (ticket_id, stage, DONE)
+            )
+
+    def result(self, ticket_id, stage):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM ledger WHERE ticket_id = ? AND stage = ? AND status = ?",
+                (ticket_id, stage, DONE),
+            ).fetchone()
+        return json.loads(row["result"]) if row else None
+
+    def run_once(self, ticket_id, stage, fn, keep=None):
+        """
+        Return the stored result of (ticket_id, stage), running fn() to produce it if
+        nobody has yet. Returns (status, result) like claim(), with CLAIMED meaning fn
+        ran here. A result rejected by keep(result) (e.g. an empty reply) is returned but
+        not stored, and one stored before keep rejected it is discarded and produced
+        again; fn's exceptions release the claim and propagate.
+        """
+        status, result = self.claim(ticket_id, stage)
+        if status == DONE and keep is not None and not keep(result):
+            self.discard(ticket_id, stage)
+            metrics.incr(f"ledger.{stage}.discarded")
+            status, result = self.claim(ticket_id, stage)
+        if status != CLAIMED:
+            return status, result
+        token = result
+        try:
+            result = fn()
+        except BaseException:
+            self.release(ticket_id, stage, token)
+            raise
+        if keep is None or keep(result):
+            self.complete(ticket_id, stage, result, token)
+        else:
+            self.release(ticket_id, stage, token)
+        return CLAIMED, result
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+def get_ledger():
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = ProcessingLedger()
+        return _ledger
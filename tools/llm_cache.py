@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from tools import metrics
+
+# Persistent cache of Groq results shared by main.py, main_1.py and mcp_server.py
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+
+def normalize_message(text):
+    """
+    Normalize a customer message for cache keys: trim, lowercase and collapse whitespace.
+    """
+    return re.sub(r"\s+", " ", str(text or "")).strip().lower()
+
+def make_key(model, prompt_version, *parts):
+    """
+    Content address for an LLM call: sha256 of the model, prompt template version and normalized inputs.
+    """
+    payload = json.dumps([model, prompt_version, *[normalize_message(p) for p in parts]])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def estimate_tokens(text):
+    """
+    Rough token count (~4 characters per token) for when the API reports no usage.
+    """
+    return max(1, len(str(text or "")) // 4)
+
+class LLMCache:
+    """
+    SQLite-backed cache with TTL expiry and least-recently-used eviction.
+    Each entry remembers the tokens its original completion cost, so hits can be
+    reported as LLM calls and tokens saved.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " tokens INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)")
+
+    def get(self, namespace, key):
+        """
+        Return the cached value or None if it is missing or older than the TTL.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, tokens, created_at FROM llm_cache WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+            if row is not None and self.ttl > 0 and now - row[2] > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE namespace = ? AND key = ?", (namespace, key))
+                row = None
+            if row is None:
+                metrics.incr(f"llm_cache.{namespace}.misses")
+                return None
+            self._conn.execute(
+                "UPDATE llm_cache SET last_access = ?, hits = hits + 1 WHERE namespace = ? AND key = ?",
+                (now, namespace, key),
+            )
+        metrics.incr(f"llm_cache.{namespace}.hits")
+        metrics.incr(f"llm_cache.{namespace}.tokens_saved", row[1])
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value, tokens=0):
+        """
+        Store a JSON-serializable value and evict the least recently used entries over the limit.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (namespace, key, value, tokens, created_at, last_access, hits)"
+                " VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (namespace, key, json.dumps(value), int(tokens), now, now),
+            )
+            if self.max_entries > 0:
+                self._conn.execute(
+                    "DELETE FROM llm_cache WHERE rowid IN ("
+                    " SELECT rowid FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+    def stats(self):
+        """
+        Lifetime totals across all processes sharing the cache file, per namespace.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT namespace, COUNT(*), SUM(hits), SUM(hits * tokens) FROM llm_cache GROUP BY namespace"
+            ).fetchall()
+        return {
+            namespace: {"entries": entries, "calls_saved": hits or 0, "tokens_saved": tokens or 0}
+            for namespace, entries, hits, tokens in rows
+        }
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_cache")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_llm_cache():
+    """
+    Return the shared LLMCache, or None when LLM_CACHE_ENABLED is off.
+    """
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
+
+def get_cache_stats():
+    """
+    In-process hit/miss/tokens-saved counters plus the persistent lifetime totals.
+    """
+    cache = get_llm_cache()
+    return {
+        "session": metrics.snapshot("llm_cache."),
+        "lifetime": cache.stats() if cache else {},
+    }
@@ -0,0 +1,213 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from tools import settings  # loads .env
+
+# Local (zero-LLM) classification tier that runs before Groq
+LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "1") == "1"
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.8"))
+LOCAL_CLASSIFIER_MODEL_PATH = os.getenv("LOCAL_CLASSIFIER_MODEL_PATH", "local_classifier.json")
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+# Keyword rules: each pattern match is one piece of evidence for the label
+ISSUE_TYPE_RULES = {
+    "Billing": re.compile(
+        r"\b(bill(?:ing|ed)?|invoice[sd]?|charge[sd]?|charged twice|double charged|overcharged?|refund(?:ed|s)?|"
+        r"payment[s]?|paid|subscription|credit card|debit card|receipt|price|pricing|fee[s]?|cancel my plan)\b"
+    ),
+    "Login": re.compile(
+        r"\b(log ?in|logging in|log ?on|sign ?in|signing in|password[s]?|locked out|account (?:is )?locked|"
+        r"2fa|two[- ]factor|otp|verification code|reset link|authenticat\w*|username)\b"
+    ),
+    "Technical": re.compile(
+        r"\b(error[s]?|bug[s]?|crash(?:es|ed|ing)?|not working|doesn't work|does not work|broken|"
+        r"fail(?:s|ed|ing|ure)?|timeout|timed out|slow|freez\w*|frozen|glitch\w*|install\w*|"
+        r"not loading|won't load|blank screen|500|404)\b"
+    ),
+}
+NEGATIVE_RULE = re.compile(
+    r"\b(angry|frustrat\w*|terrible|awful|horrible|worst|unacceptable|disappoint\w*|ridiculous|annoy\w*|"
+    r"upset|still|again|can't|cannot|can not|unable|not working|doesn't work|broken|error|fail\w*|"
+    r"charged twice|double charged|overcharged|locked out|refund|urgent|asap|wrong)\b"
+)
+POSITIVE_RULE = re.compile(
+    r"\b(thank(?:s| you)|great|love|appreciate\w*|awesome|excellent|amazing|happy|pleased|helpful|wonderful)\b"
+)
+
+def tokenize(text):
+    return _TOKEN_RE.findall(str(text or "").lower())
+
+def _rule_issue_type(text):
+    hits = {label: len(pattern.findall(text)) for label, pattern in ISSUE_TYPE_RULES.items()}
+    total = sum(hits.values())
+    if total == 0:
+        return "General", 0.0
+    label, best = max(hits.items(), key=lambda kv: kv[1])
+    # Share of the evidence, damped when there is only a single match
+    share = best / total
+    return label, round(share * min(0.95, 0.6 + 0.15 * best), 3)
+
+def _rule_sentiment(text):
+    negative = len(NEGATIVE_RULE.findall(text))
+    positive = len(POSITIVE_RULE.findall(text))
+    if negative == positive:
+        return "Neutral", 0.5 if negative == 0 else 0.3
+    label, best, other = ("Negative", negative, positive) if negative > positive else ("Positive", positive, negative)
+    return label, round((best / (best + other)) * min(0.95, 0.6 + 0.15 * best), 3)
+
+class NaiveBayesModel:
+    """
+    Multinomial naive Bayes over unigram tokens, small enough to ship as JSON.
+    Its raw posteriors are overconfident, so calibrate() maps them to the accuracy
+    observed on held-out tickets and predict() reports that instead.
+    """
+
+    def __init__(self, log_priors, log_likelihoods, log_unknown, calibration=None):
+        self.log_priors = log_priors
+        self.log_likelihoods = log_likelihoods
+        self.log_unknown = log_unknown
+        # [[raw posterior upper bound, observed accuracy], ...] in ascending order, or None
+        self.calibration = calibration
+
+    @classmethod
+    def train(cls, texts, labels, alpha=1.0):
+        class_counts = Counter(labels)
+        token_counts = defaultdict(Counter)
+        vocabulary = set()
+        for text, label in zip(texts, labels):
+            tokens = tokenize(text)
+            token_counts[label].update(tokens)
+            vocabulary.update(tokens)
+
+        total = sum(class_counts.values())
+        vocab_size = len(vocabulary) or 1
+        log_priors, log_likelihoods, log_unknown = {}, {}, {}
+        for label, count in class_counts.items():
+            denominator = sum(token_counts[label].values()) + alpha * vocab_size
+            log_priors[label] = math.log(count / total)
+            log_likelihoods[label] = {
+                token: math.log((n + alpha) / denominator) for token, n in token_counts[label].items()
+            }
+            log_unknown[label] = math.log(alpha / denominator)
+        return cls(log_priors, log_likelihoods, log_unknown)
+
+    def predict(self, text):
+        """
+        Return (label, probability) for the most likely class; the probability is
+        calibrated when the model has been (see calibrate()).
+        """
+        label, probability = self._posterior(text)
+        if label is not None and self.calibration:
+            probability = next(
+                (accuracy for upper, accuracy in self.calibration if probability <= upper), self.calibration[-1][1]
+            )
+        return label, probability
+
+    def calibrate(self, texts, labels):
+        """
+        Fit a monotonic map from raw posterior to accuracy on held-out `texts`/`labels`
+        (isotonic regression by pooling adjacent violators).
+        """
+        points = sorted(
+            (probability, float(predicted == label))
+            for (predicted, probability), label in zip((self._posterior(text) for text in texts), labels)
+        )
+        blocks = []  # [upper bound, correct, count]
+        for probability, correct in points:
+            blocks.append([probability, correct, 1])
+            while len(blocks) > 1 and blocks[-2][1] / blocks[-2][2] >= blocks[-1][1] / blocks[-1][2]:
+                upper, correct, count = blocks.pop()
+                blocks[-1] = [upper, blocks[-1][1] + correct, blocks[-1][2] + count]
+        self.calibration = [[upper, round(correct / count, 3)] for upper, correct, count in blocks] or None
+
+    def _posterior(self, text):
+        tokens = tokenize(text)
+        scores = {}
+        for label, prior in self.log_priors.items():
+            likelihoods = self.log_likelihoods[label]
+            unknown = self.log_unknown[label]
+            scores[label] = prior + sum(likelihoods.get(token, unknown) for token in tokens)
+        if not scores:
+            return None, 0.0
+        best = max(scores, key=scores.get)
+        normalizer = sum(math.exp(score - scores[best]) for score in scores.values())
+        return best, 1.0 / normalizer
+
+    def to_dict(self):
+        return {
+            "log_priors": self.log_priors,
+            "log_likelihoods": self.log_likelihoods,
+            "log_unknown": self.log_unknown,
+            "calibration": self.calibration,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["log_priors"], data["log_likelihoods"], data["log_unknown"], data.get("calibration"))
+
+_models = None
+_models_lock = threading.Lock()
+
+def load_models(path=LOCAL_CLASSIFIER_MODEL_PATH):
+    """
+    Load the trained sentiment/issue_type models (written by train_local_classifier.py).
+    Returns {} when no model file exists, in which case only the keyword rules are used.
+    """
+    global _models
+    with _models_lock:
+        if _models is None:
+            _models = {}
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                _models = {field: NaiveBayesModel.from_dict(model) for field, model in data.items()}
+        return _models
+
+def reload_models():
+    global _models
+    with _models_lock:
+        _models = None
+    return load_models()
+
+def save_models(models, path=LOCAL_CLASSIFIER_MODEL_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({field: model.to_dict() for field, model in models.items()}, f)
+
+def _combine(model, text, rule_label, rule_confidence):
+    """
+    Choose between the rule prediction and the model's. A calibrated model wins when it
+    is more confident; an uncalibrated one (trained without a holdout) may only raise
+    the confidence of a label the rules agree with.
+    """
+    label, probability = model.predict(text)
+    if not label or (model.calibration is None and label != rule_label):
+        return rule_label, rule_confidence
+    if probability > rule_confidence:
+        return label, round(probability, 3)
+    return rule_label, rule_confidence
+
+def local_classify(text: str) -> dict:
+    """
+    Classify a ticket on CPU with the keyword rules and, if trained, the naive Bayes models.
+    For each field the more confident of the two predictions wins (see _combine); the
+    overall confidence is that of the weaker field.
+    """
+    lowered = str(text or "").lower()
+    issue_type, issue_confidence = _rule_issue_type(lowered)
+    sentiment, sentiment_confidence = _rule_sentiment(lowered)
+
+    models = load_models()
+    if "issue_type" in models:
+        issue_type, issue_confidence = _combine(models["issue_type"], lowered, issue_type, issue_confidence)
+    if "sentiment" in models:
+        sentiment, sentiment_confidence = _combine(models["sentiment"], lowered, sentiment, sentiment_confidence)
+
+    return {
+        "sentiment": sentiment,
+        "issue_type": issue_type,
+        "confidence": min(issue_confidence, sentiment_confidence),
+    }
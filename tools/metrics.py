@@ -0,0 +1,221 @@
+import contextvars
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from tools import settings  # loads .env
+
+# Process-wide counters and latency summaries shared by the tools package.
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_timings = defaultdict(lambda: {"count": 0, "total": 0.0, "max": 0.0})
+
+# Recent spans (one per external call) for the Performance tab
+SPAN_BUFFER_SIZE = int(os.getenv("METRICS_SPAN_BUFFER", "2000"))
+METRICS_PREFIX = os.getenv("METRICS_PREFIX", "ticketbot")
+_spans = deque(maxlen=SPAN_BUFFER_SIZE)
+_current_ticket = contextvars.ContextVar("ticket_id", default=None)
+
+# Numeric span attributes that are also accumulated as counters
+SPAN_COUNTER_ATTRS = ("retries", "bytes_out", "bytes_in", "prompt_tokens", "completion_tokens", "total_tokens")
+
+def incr(name, value=1):
+    """
+    Increment a named counter.
+    """
+    with _lock:
+        _counters[name] += value
+
+def observe(name, seconds):
+    """
+    Record one latency sample (in seconds) for a named timing.
+    """
+    with _lock:
+        timing = _timings[name]
+        timing["count"] += 1
+        timing["total"] += seconds
+        timing["max"] = max(timing["max"], seconds)
+
+@contextmanager
+def timed(name):
+    """
+    Context manager that records the duration of its block under `name`.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+def snapshot(prefix=""):
+    """
+    Return a flat dict of counters and timing summaries whose names start with `prefix`.
+    Timings are reported as <name>.count, <name>.total_s, <name>.avg_s and <name>.max_s.
+    """
+    result = {}
+    with _lock:
+        for name, value in _counters.items():
+            if name.startswith(prefix):
+                result[name] = value
+        for name, timing in _timings.items():
+            if name.startswith(prefix):
+                count = timing["count"]
+                result[f"{name}.count"] = count
+                result[f"{name}.total_s"] = timing["total"]
+                result[f"{name}.avg_s"] = timing["total"] / count if count else 0.0
+                result[f"{name}.max_s"] = timing["max"]
+    return result
+
+def reset(prefix=""):
+    """
+    Drop all counters and timings whose names start with `prefix`.
+    """
+    with _lock:
+        for store in (_counters, _timings):
+            for name in [n for n in store if n.startswith(prefix)]:
+                del store[name]
+        if not prefix:
+            _spans.clear()
+
+@contextmanager
+def ticket_context(ticket_id):
+    """
+    Tag every span recorded inside this block (in this thread/task) with `ticket_id`.
+    """
+    token = _current_ticket.set(ticket_id)
+    try:
+        yield
+    finally:
+        _current_ticket.reset(token)
+
+def current_ticket():
+    return _current_ticket.get()
+
+class Span:
+    """
+    One external call. Attributes can be added while it runs via set();
+    set(status="error") marks a call that failed without raising.
+    """
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = dict(attrs)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Trace an external call: records <name>.latency, <name>.calls, <name>.errors and
+    the numeric SPAN_COUNTER_ATTRS (retries, payload bytes, LLM tokens) as counters,
+    and keeps the span with its ticket ID for recent_spans().
+    """
+    current = Span(name, attrs)
+    started_at = time.time()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield current
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        status = current.attrs.pop("status", status)
+        observe(f"{name}.latency", duration)
+        incr(f"{name}.calls")
+        if status == "error":
+            incr(f"{name}.errors")
+        for key in SPAN_COUNTER_ATTRS:
+            value = current.attrs.get(key)
+            if isinstance(value, (int, float)):
+                incr(f"{name}.{key}", value)
+        record = {
+            "name": name,
+            "ticket_id": current_ticket(),
+            "start": started_at,
+            "duration_s": duration,
+            "status": status,
+            **current.attrs,
+        }
+        with _lock:
+            _spans.append(record)
+
+def record_usage(current, usage):
+    """
+    Copy token counts from a completion `usage` object onto a span.
+    """
+    if usage is None:
+        return
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        value = getattr(usage, key, None)
+        if value is None and isinstance(usage, dict):
+            value = usage.get(key)
+        if value is not None:
+            current.set(**{key: value})
+
+def recent_spans(limit=None):
+    with _lock:
+        spans = list(_spans)
+    return spans[-limit:] if limit else spans
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", f"{METRICS_PREFIX}_{name}")
+
+def render_prometheus():
+    """
+    Render all counters and timings in the Prometheus text exposition format.
+    Timings become summaries (<name>_seconds_count / _sum) plus a <name>_seconds_max gauge.
+    """
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        timings = sorted((name, dict(t)) for name, t in _timings.items())
+    for name, value in counters:
+        metric = _metric_name(name) + "_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+    for name, timing in timings:
+        metric = _metric_name(name) + "_seconds"
+        lines.append(f"# TYPE {metric} summary")
+        lines.append(f"{metric}_count {timing['count']}")
+        lines.append(f"{metric}_sum {timing['total']}")
+        lines.append(f"# TYPE {metric}_max gauge")
+        lines.append(f"{metric}_max {timing['max']}")
+    return "\n".join(lines) + "\n"
+
+_metrics_server = None
+
+def start_metrics_server(port=None, host="0.0.0.0"):
+    """
+    Serve render_prometheus() at GET /metrics on a daemon thread (once per process).
+    The port defaults to METRICS_PORT; 0 or unset disables the endpoint.
+    """
+    global _metrics_server
+    port = int(port if port is not None else os.getenv("METRICS_PORT", "0"))
+    if not port or _metrics_server is not None:
+        return _metrics_server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    _metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=_metrics_server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"📈 Serving metrics at http://{host}:{port}/metrics")
+    return _metrics_server
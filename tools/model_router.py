@@ -0,0 +1,142 @@
+import os
+import threading
+from tools import metrics
+
+# Which Groq model handles each request. Routine tickets go to the small model;
+# long messages, unsure or unparseable classifications and unhappy customers'
+# replies go to the large one.
+LARGE_MODEL = os.getenv("GROQ_LARGE_MODEL", "llama3-70b-8192")
+SMALL_MODEL = os.getenv("GROQ_SMALL_MODEL", "llama3-8b-8192")
+MODEL_ROUTING_ENABLED = os.getenv("MODEL_ROUTING_ENABLED", "1") == "1"
+# Small-model classifications below this self-reported confidence are redone by the large model
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.7"))
+# Messages with at least this many tokens (before compaction) go straight to the large model
+ROUTER_LONG_MESSAGE_TOKENS = int(os.getenv("ROUTER_LONG_MESSAGE_TOKENS", "600"))
+# Replies to tickets classified Negative are written by the large model
+ROUTER_NEGATIVE_REPLIES_LARGE = os.getenv("ROUTER_NEGATIVE_REPLIES_LARGE", "1") == "1"
+# Also have the large model re-check small-model classifications that came out Negative
+ROUTER_RECHECK_NEGATIVE = os.getenv("ROUTER_RECHECK_NEGATIVE", "0") == "1"
+
+ESCALATION_REASONS = ("long_message", "invalid_json", "low_confidence", "negative", "error")
+
+_models_lock = threading.Lock()
+_models = {}  # metric-safe key -> model name
+
+def _model_key(model):
+    key = model.replace(".", "_")
+    with _models_lock:
+        _models[key] = model
+    return key
+
+def cache_tag():
+    """
+    Model part of LLM cache keys, so switching models does not reuse old answers.
+    """
+    return f"{SMALL_MODEL}>{LARGE_MODEL}" if MODEL_ROUTING_ENABLED else LARGE_MODEL
+
+def record_route(task, reason=None):
+    """
+    Count one routed request, and its escalation to the large model if `reason` is set.
+    """
+    metrics.incr(f"router.{task}.requests")
+    if reason:
+        record_escalation(task, reason)
+
+def record_escalation(task, reason):
+    metrics.incr(f"router.{task}.escalations")
+    metrics.incr(f"router.{task}.escalated.{reason}")
+
+def classification_models(message_tokens):
+    """
+    Models to try in order for one classification, plus the escalation reason if the
+    small model is skipped: the small model with the large one as fallback, or just
+    the large model for long messages (or when routing is disabled).
+    """
+    if not MODEL_ROUTING_ENABLED:
+        return [LARGE_MODEL], None
+    if message_tokens >= ROUTER_LONG_MESSAGE_TOKENS:
+        return [LARGE_MODEL], "long_message"
+    return [SMALL_MODEL, LARGE_MODEL], None
+
+def classification_escalation(result):
+    """
+    Why a small-model classification should be redone by the large model, or None to accept it.
+    `result` is None when the completion was not valid JSON with known labels.
+    """
+    if result is None:
+        return "invalid_json"
+    if result.get("confidence", 1.0) < ROUTER_MIN_CONFIDENCE:
+        return "low_confidence"
+    if ROUTER_RECHECK_NEGATIVE and result.get("sentiment") == "Negative":
+        return "negative"
+    return None
+
+def reply_model(message_tokens, sentiment=None):
+    """
+    Model for one reply, plus the escalation reason if it is the large one. Replies are
+    streamed as they are written, so this is decided up front: the large model for long
+    messages and (when the classification is known) negative tickets.
+    """
+    if not MODEL_ROUTING_ENABLED:
+        return LARGE_MODEL, None
+    if message_tokens >= ROUTER_LONG_MESSAGE_TOKENS:
+        return LARGE_MODEL, "long_message"
+    if ROUTER_NEGATIVE_REPLIES_LARGE and sentiment == "Negative":
+        return LARGE_MODEL, "negative"
+    return SMALL_MODEL, None
+
+def record_model_call(model, task, seconds, usage=None):
+    """
+    Per-model latency and token spend for one completion.
+    """
+    prefix = f"model.{_model_key(model)}.{task}"
+    metrics.incr(f"{prefix}.calls")
+    metrics.observe(f"{prefix}.latency", seconds)
+    for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        value = getattr(usage, field, None)
+        if value:
+            metrics.incr(f"{prefix}.{field}", value)
+
+def model_report():
+    """
+    One row per (model, task): calls, average/max latency and tokens spent.
+    """
+    stats = metrics.snapshot("model.")
+    rows = []
+    keys = sorted({tuple(name.split(".")[1:3]) for name in stats})
+    for key, task in keys:
+        prefix = f"model.{key}.{task}"
+        calls = stats.get(f"{prefix}.calls", 0)
+        if not calls:
+            continue
+        rows.append({
+            "model": _models.get(key, key),
+            "task": task,
+            "calls": int(calls),
+            "avg_latency_ms": round(stats.get(f"{prefix}.latency.avg_s", 0.0) * 1000, 1),
+            "max_latency_ms": round(stats.get(f"{prefix}.latency.max_s", 0.0) * 1000, 1),
+            "prompt_tokens": int(stats.get(f"{prefix}.prompt_tokens", 0)),
+            "completion_tokens": int(stats.get(f"{prefix}.completion_tokens", 0)),
+            "tokens_per_call": round(stats.get(f"{prefix}.total_tokens", 0) / calls, 1),
+        })
+    return rows
+
+def escalation_report():
+    """
+    One row per task: routed requests, how many went to the large model and why.
+    """
+    stats = metrics.snapshot("router.")
+    rows = []
+    for task in sorted({name.split(".")[1] for name in stats}):
+        requests = stats.get(f"router.{task}.requests", 0)
+        escalations = stats.get(f"router.{task}.escalations", 0)
+        row = {
+            "task": task,
+            "requests": int(requests),
+            "escalations": int(escalations),
+            "escalation_rate": round(100 * escalations / requests, 1) if requests else 0.0,
+        }
+        for reason in ESCALATION_REASONS:
+            row[reason] = int(stats.get(f"router.{task}.escalated.{reason}", 0))
+        rows.append(row)
+    return rows
@@ -0,0 +1,387 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from tools import metrics
+from tools.ledger import ticket_key
+from tools.rate_limit import RateLimiter
+
+# Durable outbound email queue drained by background worker threads
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "outbox.db")
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+OUTBOX_RATE_PER_MINUTE = float(os.getenv("OUTBOX_RATE_PER_MINUTE", "60"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "30"))        # seconds, doubled per attempt
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", "3600"))
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "300"))  # reclaim 'sending' rows after a crash
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))
+
+def retry_delay(attempts):
+    """
+    Exponential backoff before the next delivery attempt.
+    """
+    return min(OUTBOX_RETRY_BASE * 2 ** max(0, attempts - 1), OUTBOX_RETRY_MAX)
+
+class Outbox:
+    """
+    SQLite-backed email queue with leases, retry scheduling and a dead-letter table.
+    Rows move queued -> sending -> sent -> recorded, or to dead_letter after
+    OUTBOX_MAX_ATTEMPTS failed deliveries. 'sent' means delivered but not yet recorded
+    in the sheet; that step is retried with backoff until it succeeds.
+    """
+
+    def __init__(self, path=OUTBOX_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, ticket_key TEXT, to_addr TEXT NOT NULL,"
+            " subject TEXT NOT NULL, body TEXT NOT NULL, ticket TEXT,"
+            " status TEXT NOT NULL DEFAULT 'queued', attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL, leased_until REAL, last_error TEXT,"
+            " created_at REAL NOT NULL, sent_at REAL)"
+        )
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(outbox)")}
+        # Outboxes created before delivered tickets were recorded durably; their 'sent'
+        # rows are recorded again, which skips whatever already reached the sheet
+        if "record_attempts" not in columns:
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN record_attempts INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN next_record_at REAL")
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN recorded_at REAL")
+            self._conn.execute("UPDATE outbox SET status = 'recorded' WHERE status = 'sent' AND ticket IS NULL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_ticket ON outbox (ticket_key)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            " id INTEGER PRIMARY KEY, ticket_key TEXT, to_addr TEXT NOT NULL, subject TEXT NOT NULL,"
+            " body TEXT NOT NULL, ticket TEXT, attempts INTEGER NOT NULL, last_error TEXT,"
+            " created_at REAL NOT NULL, failed_at REAL NOT NULL)"
+        )
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def enqueue(self, to, subject, body, ticket=None):
+        """
+        Queue one email. A ticket that is already queued, in flight, sent or
+        dead-lettered is not queued again (requeue_dead_letter() retries a dead letter
+        on purpose). Returns the outbox id, or None if it was a duplicate.
+        """
+        key = ticket_key(ticket) if ticket else None
+        now = time.time()
+
+        def insert(conn):
+            if key and conn.execute(
+                "SELECT 1 FROM outbox WHERE ticket_key = ? UNION ALL SELECT 1 FROM dead_letter WHERE ticket_key = ?",
+                (key, key),
+            ).fetchone():
+                return None
+            cursor = conn.execute(
+                "INSERT INTO outbox (ticket_key, to_addr, subject, body, ticket, next_attempt_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, to, subject, body, json.dumps(ticket) if ticket else None, now, now),
+            )
+            return cursor.lastrowid
+
+        outbox_id = self._transaction(insert)
+        metrics.incr("outbox.enqueued" if outbox_id else "outbox.duplicates")
+        return outbox_id
+
+    def claim(self, limit=OUTBOX_BATCH_SIZE):
+        """
+        Lease up to `limit` due messages (including expired leases from crashed workers).
+        """
+        now = time.time()
+
+        def lease(conn):
+            rows = conn.execute(
+                "SELECT * FROM outbox WHERE (status = 'queued' AND next_attempt_at <= ?)"
+                " OR (status = 'sending' AND leased_until < ?) ORDER BY id LIMIT ?",
+                (now, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET status = 'sending', leased_until = ? WHERE id = ?",
+                [(now + OUTBOX_LEASE_SECONDS, row["id"]) for row in rows],
+            )
+            return [dict(row) for row in rows]
+
+        return self._transaction(lease)
+
+    def mark_sent(self, outbox_id):
+        """
+        Record a delivery. Messages without a ticket have nothing to record in the sheet.
+        """
+        now = time.time()
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE outbox SET status = CASE WHEN ticket IS NULL THEN 'recorded' ELSE 'sent' END,"
+            " sent_at = ?, leased_until = NULL, next_record_at = ? WHERE id = ?",
+            (now, now, outbox_id),
+        ))
+        metrics.incr("outbox.sent")
+
+    def claim_unrecorded(self, limit=OUTBOX_BATCH_SIZE):
+        """
+        Lease up to `limit` delivered messages whose ticket is not recorded in the sheet
+        yet and is due (new, retried after a failure or abandoned by a crashed worker).
+        """
+        now = time.time()
+
+        def lease(conn):
+            rows = conn.execute(
+                "SELECT * FROM outbox WHERE status = 'sent' AND ticket IS NOT NULL"
+                " AND COALESCE(next_record_at, 0) <= ? ORDER BY id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET next_record_at = ? WHERE id = ?",
+                [(now + OUTBOX_LEASE_SECONDS, row["id"]) for row in rows],
+            )
+            return [dict(row) for row in rows]
+
+        return self._transaction(lease)
+
+    def mark_recorded(self, outbox_ids):
+        now = time.time()
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE outbox SET status = 'recorded', recorded_at = ?, next_record_at = NULL WHERE id = ?",
+            [(now, i) for i in outbox_ids],
+        ))
+        metrics.incr("outbox.recorded", len(outbox_ids))
+
+    def mark_record_failed(self, rows, error):
+        """
+        Schedule another attempt at recording delivered messages, with exponential backoff.
+        """
+        now = time.time()
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE outbox SET record_attempts = ?, last_error = ?, next_record_at = ? WHERE id = ?",
+            [(row["record_attempts"] + 1, str(error), now + retry_delay(row["record_attempts"] + 1), row["id"])
+             for row in rows],
+        ))
+        metrics.incr("outbox.record_failures", len(rows))
+
+    def mark_failed(self, outbox_id, error):
+        """
+        Schedule a retry with exponential backoff, or move the message to dead_letter.
+        Returns True if the message was dead-lettered.
+        """
+        now = time.time()
+
+        def fail(conn):
+            row = conn.execute("SELECT * FROM outbox WHERE id = ?", (outbox_id,)).fetchone()
+            if row is None:
+                return False
+            attempts = row["attempts"] + 1
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                conn.execute(
+                    "INSERT OR REPLACE INTO dead_letter (id, ticket_key, to_addr, subject, body, ticket,"
+                    " attempts, last_error, created_at, failed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (row["id"], row["ticket_key"], row["to_addr"], row["subject"], row["body"], row["ticket"],
+                     attempts, str(error), row["created_at"], now),
+                )
+                conn.execute("DELETE FROM outbox WHERE id = ?", (outbox_id,))
+                return True
+            conn.execute(
+                "UPDATE outbox SET status = 'queued', attempts = ?, last_error = ?,"
+                " next_attempt_at = ?, leased_until = NULL WHERE id = ?",
+                (attempts, str(error), now + retry_delay(attempts), outbox_id),
+            )
+            return False
+
+        dead = self._transaction(fail)
+        metrics.incr("outbox.dead_lettered" if dead else "outbox.retries")
+        return dead
+
+    def requeue_dead_letter(self, dead_id):
+        """
+        Move a dead-lettered message back to the queue with a fresh attempt budget.
+        """
+        now = time.time()
+
+        def requeue(conn):
+            row = conn.execute("SELECT * FROM dead_letter WHERE id = ?", (dead_id,)).fetchone()
+            if row is None:
+                return None
+            cursor = conn.execute(
+                "INSERT INTO outbox (ticket_key, to_addr, subject, body, ticket, next_attempt_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (row["ticket_key"], row["to_addr"], row["subject"], row["body"], row["ticket"], now, row["created_at"]),
+            )
+            conn.execute("DELETE FROM dead_letter WHERE id = ?", (dead_id,))
+            return cursor.lastrowid
+
+        return self._transaction(requeue)
+
+    def active_ticket_keys(self):
+        """
+        Keys of tickets whose reply is queued, in flight or already sent
+        (a sent ticket may still be waiting for its sheet commit, which the outbox worker retries).
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT ticket_key FROM outbox WHERE ticket_key IS NOT NULL").fetchall()
+        return {row[0] for row in rows}
+
+    def dead_letter_keys(self):
+        """
+        Keys of tickets whose reply was given up on; they stay out of the queue until requeued.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT ticket_key FROM dead_letter WHERE ticket_key IS NOT NULL").fetchall()
+        return {row[0] for row in rows}
+
+    def dead_letters(self):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute("SELECT * FROM dead_letter ORDER BY failed_at DESC")]
+
+    def counts(self):
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+            counts["dead_letter"] = self._conn.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+        return counts
+
+def _record_delivered(tickets):
+    """
+    Persist delivered tickets: all are appended to ProcessedTickets, and the ones that
+    came from PendingTickets are labelled and deleted there. Raises if a write failed;
+    the batch is then retried, and commit_processed_tickets() skips what already landed.
+    """
+    from tools.sheet_connector import commit_processed_tickets
+    commit_processed_tickets(tickets)
+
+class OutboxWorker:
+    """
+    Background threads that drain the outbox through the pooled SMTP sender,
+    rate limited to OUTBOX_RATE_PER_MINUTE. Sheet records are only written after
+    the email for a ticket is confirmed delivered, and retried until they succeed.
+    """
+
+    def __init__(self, outbox, threads=OUTBOX_WORKERS, send=None, on_delivered=_record_delivered):
+        self.outbox = outbox
+        self.threads = max(1, threads)
+        self._send = send
+        self.on_delivered = on_delivered
+        self._limiter = RateLimiter(OUTBOX_RATE_PER_MINUTE / 60, burst=5)
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()
+        self._workers = []
+
+    def _deliver(self, row):
+        if self._send is None:
+            from tools.gmail_sender import build_message, get_smtp_pool
+            self._send = lambda to, subject, body: get_smtp_pool().send_message(build_message(to, subject, body))
+        self._limiter.acquire()
+        self._send(row["to_addr"], row["subject"], row["body"])
+
+    def drain_once(self):
+        """
+        Claim and deliver one batch, then record delivered tickets in the sheet.
+        Returns the number of messages claimed for either step.
+        """
+        rows = self.outbox.claim()
+        for row in rows:
+            try:
+                with metrics.ticket_context(row["ticket_key"]), metrics.timed("outbox.delivery_latency"):
+                    self._deliver(row)
+            except Exception as e:
+                dead = self.outbox.mark_failed(row["id"], e)
+                print(f"{'☠️ Dead-lettered' if dead else '🔁 Will retry'} email {row['id']} to {row['to_addr']}: {e}")
+                continue
+            self.outbox.mark_sent(row["id"])
+        return len(rows) + self.record_once()
+
+    def record_once(self):
+        """
+        Record one batch of delivered tickets with on_delivered(). A batch that fails
+        stays 'sent' and is retried after a backoff. Returns the number of messages claimed.
+        """
+        rows = self.outbox.claim_unrecorded()
+        if not rows:
+            return 0
+        if self.on_delivered:
+            # commit_processed_tickets() takes the cross-process sheet write lock itself
+            try:
+                self.on_delivered([json.loads(row["ticket"]) for row in rows])
+            except Exception as e:
+                self.outbox.mark_record_failed(rows, e)
+                print(f"🔁 Will retry recording {len(rows)} delivered tickets: {e}")
+                return len(rows)
+        self.outbox.mark_recorded([row["id"] for row in rows])
+        return len(rows)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                claimed = self.drain_once()
+            except Exception as e:
+                print(f"⚠️ Outbox worker error: {e}")
+                claimed = 0
+            if not claimed:
+                self._wake.wait(OUTBOX_POLL_INTERVAL)
+                self._wake.clear()
+
+    def start(self):
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._run, name=f"outbox-worker-{i}", daemon=True)
+            thread.start()
+            self._workers.append(thread)
+        return self
+
+    def notify(self):
+        """
+        Wake idle workers after new messages were queued.
+        """
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        self._wake.set()
+        for thread in self._workers:
+            thread.join(timeout)
+
+_outbox = None
+_worker = None
+_outbox_lock = threading.Lock()
+
+def get_outbox():
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox()
+        return _outbox
+
+def start_outbox_worker(threads=OUTBOX_WORKERS):
+    """
+    Start the process-wide outbox worker once; later calls return the running worker.
+    """
+    global _worker
+    outbox = get_outbox()
+    with _outbox_lock:
+        if _worker is None:
+            _worker = OutboxWorker(outbox, threads=threads).start()
+        return _worker
+
+def enqueue_reply(ticket, subject="Automated Reply", source="pending"):
+    """
+    Queue the ticket's AutoReply for delivery. `source` is "pending" when the
+    ticket is a PendingTickets row that must be removed after delivery.
+    Returns the outbox id, or None if the ticket was already queued (or dead-lettered).
+    """
+    payload = {k: v for k, v in ticket.items() if k != "RowNumber"}
+    payload["source"] = source
+    outbox_id = get_outbox().enqueue(ticket["Email"], subject, ticket["AutoReply"], ticket=payload)
+    if _worker is not None:
+        _worker.notify()
+    return outbox_id
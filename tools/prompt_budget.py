@@ -0,0 +1,227 @@
+import math
+import os
+import re
+from tools import metrics
+
+# Prompt preparation for Groq calls: customer messages are cleaned (quoted email
+# history, signatures, repeated log lines) and cut to a per-task token budget,
+# and each task gets a max_tokens sized to the answer it actually needs.
+PROMPT_COMPACTION_ENABLED = os.getenv("PROMPT_COMPACTION_ENABLED", "1") == "1"
+# Message tokens kept in each prompt; classification needs far less context than a reply
+CLASSIFY_MESSAGE_TOKENS = int(os.getenv("CLASSIFY_MESSAGE_TOKENS", "400"))
+REPLY_MESSAGE_TOKENS = int(os.getenv("REPLY_MESSAGE_TOKENS", "1200"))
+# Completion budgets: a {"sentiment", "issue_type"} object is ~20 tokens
+CLASSIFY_MAX_TOKENS = int(os.getenv("CLASSIFY_MAX_TOKENS", "60"))
+CLASSIFY_BATCH_ITEM_TOKENS = int(os.getenv("CLASSIFY_BATCH_ITEM_TOKENS", "40"))
+REPLY_MIN_TOKENS = int(os.getenv("REPLY_MIN_TOKENS", "250"))
+REPLY_MAX_TOKENS = int(os.getenv("REPLY_MAX_TOKENS", "500"))
+
+# Report buckets by the message's original size in tokens
+SIZE_BUCKETS = ((100, "<100"), (300, "100-300"), (1000, "300-1k"), (3000, "1k-3k"), (math.inf, "3k+"))
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_QUOTE_HEADER_RE = re.compile(
+    r"^\s*(On .{0,200} wrote:|-{2,}\s*Original Message\s*-{2,}|-{2,}\s*Forwarded message\s*-{2,}|_{10,})\s*$",
+    re.IGNORECASE,
+)
+_OUTLOOK_HEADER_RE = re.compile(r"^\s*From:\s.+$", re.IGNORECASE)
+_SIGNATURE_RE = re.compile(
+    r"^\s*(--\s*|sent from my \w+.*|get outlook for \w+.*|"
+    r"(best|kind|warm)?\s*regards,?|thanks(,| again,?| in advance,?)?|thank you,?|cheers,?|sincerely,?)\s*$",
+    re.IGNORECASE,
+)
+# Lines that may follow a sign-off besides a name or job title: contact details and device footers
+_CONTACT_LINE_RE = re.compile(
+    r"^\s*(sent from my \w+.*|get outlook for \w+.*|((tel|phone|mobile|cell|fax|[mtf])\.?\s*:?\s*)?\+?[\d\s().-]{7,}|"
+    r"[\w.+-]+@[\w-]+(\.[\w-]+)+|(https?://|www\.)\S+)\s*$",
+    re.IGNORECASE,
+)
+_POSTSCRIPT_RE = re.compile(r"^\s*p\.?\s?s\b", re.IGNORECASE)
+
+def count_tokens(text):
+    """
+    Local token estimate: words split into ~4-character pieces plus one per punctuation mark.
+    Close to the Llama tokenizer for English and cheap enough to run on every message.
+    """
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _TOKEN_RE.findall(str(text or "")))
+
+def size_bucket(tokens):
+    for limit, label in SIZE_BUCKETS:
+        if tokens < limit:
+            return label
+
+def strip_quoted_history(text):
+    """
+    Drop quoted replies: '>' lines and everything after an 'On ... wrote:',
+    'Original Message' or Outlook 'From:'/'Sent:' header.
+    """
+    lines = text.splitlines()
+    kept = []
+    for i, line in enumerate(lines):
+        if _QUOTE_HEADER_RE.match(line):
+            break
+        if _OUTLOOK_HEADER_RE.match(line) and any(l.lower().lstrip().startswith("sent:") for l in lines[i + 1:i + 4]):
+            break
+        if line.lstrip().startswith(">"):
+            continue
+        kept.append(line)
+    return "\n".join(kept)
+
+def _is_signature_line(line):
+    """
+    Whether a line after a sign-off looks like part of a signature: a name or job title
+    (a few capitalised words without digits or sentence punctuation), contact details
+    or a device footer. Postscripts never are.
+    """
+    if not line.strip() or _CONTACT_LINE_RE.match(line):
+        return True
+    if _POSTSCRIPT_RE.match(line):
+        return False
+    return len(line.split()) <= 6 and line.lstrip()[0].isupper() and not re.search(r"[\d:;?!]", line)
+
+def strip_signature(text, max_signature_lines=8):
+    """
+    Drop a trailing sign-off/signature block ('--', 'Best regards,', 'Sent from my iPhone', ...)
+    found within the last `max_signature_lines` non-empty lines. A sign-off is only
+    dropped when it ends the message or everything after it looks like a signature
+    (see _is_signature_line), so a 'Thanks' followed by a PS or more questions stays;
+    after a '--' delimiter any short lines count as signature.
+    """
+    lines = text.rstrip().splitlines()
+    content = [i for i, line in enumerate(lines) if line.strip()]
+    for i in content[-max_signature_lines:]:
+        if i == 0 or not _SIGNATURE_RE.match(lines[i]):
+            continue
+        rest = lines[i + 1:]
+        if lines[i].strip().startswith("--"):
+            is_signature = all(len(line) <= 60 for line in rest)
+        else:
+            is_signature = all(_is_signature_line(line) for line in rest)
+        if is_signature:
+            return "\n".join(lines[:i]).rstrip()
+    return text
+
+def collapse_repeats(text):
+    """
+    Collapse runs of identical lines (typical of pasted logs) into one line plus a count.
+    """
+    out = []
+    previous, repeats = None, 0
+    for line in text.splitlines() + [None]:
+        if line is not None and previous is not None and line.strip() == previous.strip():
+            repeats += 1
+            continue
+        if repeats:
+            out.append(f"[previous line repeated {repeats} more times]")
+        if line is not None:
+            out.append(line)
+        previous, repeats = line, 0
+    return "\n".join(out)
+
+def truncate_middle(text, max_tokens):
+    """
+    Keep the start and the end of an oversized message (where the question and the
+    latest error usually are), dropping lines from the middle.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    lines = text.splitlines()
+    head, tail = [], []
+    budget = max_tokens - 10  # room for the omission marker
+    # Two thirds of the budget for the opening lines, the rest for the closing ones
+    head_budget = budget * 2 // 3
+    used = 0
+    for line in lines:
+        cost = count_tokens(line) or 1
+        if used + cost > head_budget:
+            break
+        head.append(line)
+        used += cost
+    for line in reversed(lines[len(head):]):
+        cost = count_tokens(line) or 1
+        if used + cost > budget:
+            break
+        tail.insert(0, line)
+        used += cost
+    if not head and not tail:
+        # A single huge line: cut by characters instead (~4 per token)
+        return text[:max_tokens * 4] + " [...]"
+    omitted = len(lines) - len(head) - len(tail)
+    return "\n".join(head + [f"[... {omitted} lines omitted ...]"] + tail)
+
+def compact_message(text, max_tokens):
+    """
+    Return `text` cleaned and cut to about `max_tokens` tokens, plus its original
+    and compacted token counts.
+    """
+    text = str(text or "")
+    original = count_tokens(text)
+    if not PROMPT_COMPACTION_ENABLED:
+        return text, original, original
+    compacted = strip_quoted_history(text.replace("\r\n", "\n"))
+    compacted = strip_signature(compacted)
+    compacted = collapse_repeats(compacted)
+    compacted = re.sub(r"\n{3,}", "\n\n", compacted).strip()
+    if not compacted:
+        # Everything looked like quoting or a signature; fall back to the raw message
+        compacted = text.strip()
+    compacted = truncate_middle(compacted, max_tokens)
+    return compacted, original, count_tokens(compacted)
+
+def reply_max_tokens(message_tokens):
+    """
+    Completion budget for a reply: short questions get short answers, long ones up to REPLY_MAX_TOKENS.
+    """
+    return max(REPLY_MIN_TOKENS, min(REPLY_MAX_TOKENS, 150 + message_tokens // 2))
+
+def record_compaction(task, original, compacted):
+    """
+    Count tokens before/after compaction under the message's size bucket.
+    Returns the bucket label, for record_completion().
+    """
+    bucket = size_bucket(original)
+    prefix = f"prompt.{task}.{bucket}"
+    metrics.incr(f"{prefix}.messages")
+    metrics.incr(f"{prefix}.tokens_in", original)
+    metrics.incr(f"{prefix}.tokens_sent", compacted)
+    if compacted < original:
+        metrics.incr(f"{prefix}.compacted")
+    return bucket
+
+def record_completion(task, bucket, seconds, finish_reason=None):
+    """
+    Record a completion's latency; finish_reason "length" means max_tokens cut the answer short.
+    """
+    metrics.observe(f"prompt.{task}.{bucket}.latency", seconds)
+    if finish_reason == "length":
+        metrics.incr(f"prompt.{task}.{bucket}.length_stops")
+
+def compaction_report():
+    """
+    One row per (task, size bucket): messages, tokens in/sent/saved, completion latency
+    and how often max_tokens truncated the answer.
+    """
+    stats = metrics.snapshot("prompt.")
+    rows = []
+    for task in sorted({name.split(".")[1] for name in stats}):
+        for _, bucket in SIZE_BUCKETS:
+            prefix = f"prompt.{task}.{bucket}"
+            messages = stats.get(f"{prefix}.messages", 0)
+            if not messages:
+                continue
+            tokens_in = stats.get(f"{prefix}.tokens_in", 0)
+            tokens_sent = stats.get(f"{prefix}.tokens_sent", 0)
+            rows.append({
+                "task": task,
+                "size": bucket,
+                "messages": int(messages),
+                "compacted": int(stats.get(f"{prefix}.compacted", 0)),
+                "tokens_in": int(tokens_in),
+                "tokens_sent": int(tokens_sent),
+                "tokens_saved": int(tokens_in - tokens_sent),
+                "saved_pct": round(100 * (tokens_in - tokens_sent) / tokens_in, 1) if tokens_in else 0.0,
+                "length_stops": int(stats.get(f"{prefix}.length_stops", 0)),
+                "avg_latency_ms": round(stats.get(f"{prefix}.latency.avg_s", 0.0) * 1000, 1),
+                "max_latency_ms": round(stats.get(f"{prefix}.latency.max_s", 0.0) * 1000, 1),
+            })
+    return rows
@@ -0,0 +1,41 @@
+import os
+import threading
+import time
+from tools import settings  # loads .env
+
+class RateLimiter:
+    """
+    Thread-safe token bucket allowing `rate` calls per second with bursts of up to `burst`.
+    A rate of 0 (or less) disables limiting.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a call is allowed. Returns the number of seconds spent waiting.
+        """
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+# Shared limiter for every Groq completion made by the tools package
+GROQ_REQUESTS_PER_MINUTE = float(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30"))
+GROQ_BURST = int(os.getenv("GROQ_BURST", "5"))
+groq_limiter = RateLimiter(GROQ_REQUESTS_PER_MINUTE / 60, burst=GROQ_BURST)
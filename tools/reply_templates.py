@@ -0,0 +1,319 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from tools import metrics
+from tools.llm_cache import normalize_message
+from tools.ledger import ticket_key
+from tools.prompt_budget import count_tokens
+
+# Reuse of sent replies for near-duplicate tickets ("can't log in", "charged twice"):
+# replies recorded in ProcessedTickets are indexed per issue type as hashed TF-IDF
+# vectors, and a new ticket that is similar enough gets the closest reply with the
+# customer's name swapped in instead of a Groq generation.
+REPLY_TEMPLATES_ENABLED = os.getenv("REPLY_TEMPLATES_ENABLED", "1") == "1"
+REPLY_TEMPLATE_PATH = os.getenv("REPLY_TEMPLATE_PATH", "reply_templates.db")
+# Cosine similarity (0-1) a past ticket needs for its reply to be reused
+REPLY_TEMPLATE_THRESHOLD = float(os.getenv("REPLY_TEMPLATE_THRESHOLD", "0.85"))
+# Longer messages are too specific for a stock answer and always go to Groq
+REPLY_TEMPLATE_MAX_MESSAGE_TOKENS = int(os.getenv("REPLY_TEMPLATE_MAX_MESSAGE_TOKENS", "150"))
+REPLY_TEMPLATE_MAX_PER_TYPE = int(os.getenv("REPLY_TEMPLATE_MAX_PER_TYPE", "2000"))
+REPLY_TEMPLATE_FEATURES = int(os.getenv("REPLY_TEMPLATE_FEATURES", "4096"))  # hashed vector size
+
+NAME_PLACEHOLDER = "{customer_name}"
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+_NUMBER_RE = re.compile(r"\d{4,}")
+
+def _hashed_counts(text):
+    """
+    Term counts of a message's words and word pairs, hashed into REPLY_TEMPLATE_FEATURES buckets.
+    Numbers (order, ticket IDs) are left out: they are rare, so IDF would let them outweigh the
+    wording. crc32 rather than hash() so vectors are the same in every process.
+    """
+    tokens = [t for t in _TOKEN_RE.findall(normalize_message(text)) if not t.isdigit()]
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return Counter(zlib.crc32(gram.encode("utf-8")) % REPLY_TEMPLATE_FEATURES for gram in grams)
+
+def _tf_vector(text):
+    import numpy as np
+    vector = np.zeros(REPLY_TEMPLATE_FEATURES, dtype=np.float32)
+    for feature, count in _hashed_counts(text).items():
+        vector[feature] = 1.0 + math.log(count)  # sublinear tf
+    return vector
+
+def make_template(ticket):
+    """
+    Turn a sent reply into a reusable template with the customer's name replaced by
+    NAME_PLACEHOLDER. Returns None for replies that should not be reused: empty or
+    fallback replies, and replies that mention the customer's email, other parts of
+    their name, or echo a number (order, invoice) from their message.
+    """
+    reply = str(ticket.get("AutoReply") or "").strip()
+    message = str(ticket.get("Message") or "")
+    if not reply or "unable to process your request" in reply.lower():
+        return None
+    email = str(ticket.get("Email") or "").strip().lower()
+    if email and email in reply.lower():
+        return None
+    if set(_NUMBER_RE.findall(reply)) & set(_NUMBER_RE.findall(message)):
+        return None
+    parts = [p for p in re.split(r"\s+", str(ticket.get("Name") or "").strip()) if len(p) >= 2]
+    if parts:
+        reply = re.sub(rf"\b{re.escape(' '.join(parts))}\b", NAME_PLACEHOLDER, reply)
+        reply = re.sub(rf"\b{re.escape(parts[0])}\b", NAME_PLACEHOLDER, reply)
+        if any(re.search(rf"\b{re.escape(part)}\b", reply) for part in parts[1:]):
+            return None
+    return reply
+
+def personalize(template, name):
+    """
+    Fill a template in for a customer: their first name, or 'there' when unknown.
+    """
+    first_name = str(name or "").strip().split(" ")[0] or "there"
+    return template.replace(NAME_PLACEHOLDER, first_name)
+
+class ReplyTemplateIndex:
+    """
+    SQLite store of reusable replies plus an in-memory TF-IDF matrix per issue type,
+    searched by brute-force cosine similarity. Like the rollups, `processed_rows` is
+    how many ProcessedTickets rows have been folded in by catch-up.
+    """
+
+    def __init__(self, path=REPLY_TEMPLATE_PATH, max_per_type=REPLY_TEMPLATE_MAX_PER_TYPE):
+        self.max_per_type = max_per_type
+        self._lock = threading.RLock()
+        self._groups = {}  # issue type -> {"keys", "sentiments", "templates", "rows", "matrix", "idf"}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS reply_templates ("
+                " ticket_key TEXT PRIMARY KEY, issue_type TEXT NOT NULL, sentiment TEXT NOT NULL,"
+                " message TEXT NOT NULL, template TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS template_state (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            rows = self._conn.execute(
+                "SELECT ticket_key, issue_type, sentiment, message, template FROM reply_templates ORDER BY created_at"
+            ).fetchall()
+        for row in rows:
+            self._remember(*row)
+
+    def _remember(self, key, issue_type, sentiment, message, template):
+        group = self._groups.setdefault(
+            issue_type, {"keys": [], "sentiments": [], "templates": [], "rows": [], "matrix": None, "idf": None}
+        )
+        group["keys"].append(key)
+        group["sentiments"].append(sentiment)
+        group["templates"].append(template)
+        group["rows"].append(_tf_vector(message))
+        if len(group["keys"]) > self.max_per_type:
+            # Oldest first out; _add() trims SQLite to the same size
+            for field in ("keys", "sentiments", "templates", "rows"):
+                del group[field][0]
+        group["matrix"] = None
+
+    def _add(self, conn, tickets):
+        added = 0
+        now = time.time()
+        for ticket in tickets:
+            issue_type = str(ticket.get("IssueType_Label") or "")
+            message = str(ticket.get("Message") or "")
+            if issue_type in ("", "Unknown") or count_tokens(message) > REPLY_TEMPLATE_MAX_MESSAGE_TOKENS:
+                continue
+            template = make_template(ticket)
+            if template is None:
+                continue
+            key = ticket_key(ticket)
+            sentiment = str(ticket.get("Sentiment") or "")
+            if not conn.execute(
+                "INSERT OR IGNORE INTO reply_templates VALUES (?, ?, ?, ?, ?, ?)",
+                (key, issue_type, sentiment, message, template, now),
+            ).rowcount:
+                continue
+            self._remember(key, issue_type, sentiment, message, template)
+            added += 1
+        if added:
+            conn.execute(
+                "DELETE FROM reply_templates WHERE ticket_key IN (SELECT ticket_key FROM ("
+                " SELECT ticket_key, ROW_NUMBER() OVER (PARTITION BY issue_type ORDER BY created_at DESC) AS n"
+                " FROM reply_templates) WHERE n > ?)",
+                (self.max_per_type,),
+            )
+        return added
+
+    def add(self, tickets):
+        """
+        Index the replies of newly processed tickets. Returns how many were added.
+        """
+        with self._lock, self._conn:
+            added = self._add(self._conn, tickets)
+        metrics.incr("reply_templates.indexed", added)
+        return added
+
+    def processed_rows(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM template_state WHERE name = 'processed_rows'").fetchone()
+        return row[0] if row else 0
+
+    def fold(self, tickets, processed_rows):
+        """
+        Index the ProcessedTickets rows after processed_rows() and record that the
+        first `processed_rows` rows are now folded in.
+        """
+        with self._lock, self._conn:
+            added = self._add(self._conn, tickets)
+            self._conn.execute("INSERT OR REPLACE INTO template_state VALUES ('processed_rows', ?)", (processed_rows,))
+        metrics.incr("reply_templates.indexed", added)
+        return added
+
+    @staticmethod
+    def _prepare(group):
+        import numpy as np
+        if group["matrix"] is None:
+            tf = np.vstack(group["rows"])
+            df = np.count_nonzero(tf, axis=0)
+            group["idf"] = (np.log((1 + len(tf)) / (1 + df)) + 1).astype(np.float32)
+            matrix = tf * group["idf"]
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            group["matrix"] = matrix / norms
+        return group["matrix"], group["idf"]
+
+    def nearest(self, text, issue_type=None, sentiment=None):
+        """
+        Return (template, similarity, ticket_key) for the most similar indexed ticket of
+        the same issue type (every type when None) and sentiment (when given), or None.
+        """
+        import numpy as np
+        tf = _tf_vector(text)
+        best = None
+        with self._lock:
+            for label, group in self._groups.items():
+                if (issue_type and label != issue_type) or not group["keys"]:
+                    continue
+                matrix, idf = self._prepare(group)
+                query = tf * idf
+                norm = np.linalg.norm(query)
+                if norm == 0:
+                    continue
+                similarities = matrix @ (query / norm)
+                if sentiment:
+                    similarities[np.array(group["sentiments"]) != sentiment] = -1.0
+                i = int(np.argmax(similarities))
+                if similarities[i] >= 0 and (best is None or similarities[i] > best[1]):
+                    best = (group["templates"][i], float(similarities[i]), group["keys"][i])
+        return best
+
+    def sizes(self):
+        with self._lock:
+            return {issue_type: len(group["keys"]) for issue_type, group in sorted(self._groups.items())}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_reply_templates():
+    """
+    The process-wide index. On first use it catches up on ProcessedTickets rows
+    written by other processes in a background thread.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ReplyTemplateIndex()
+            threading.Thread(target=_catch_up, name="reply-templates-sync", daemon=True).start()
+        return _index
+
+def sync_reply_templates():
+    """
+    Index ProcessedTickets rows appended since the last call (by any process).
+    """
+    from tools.sheet_connector import fetch_processed_tickets
+    index = get_reply_templates()
+    processed = fetch_processed_tickets()
+    known = index.processed_rows()
+    if len(processed) < known:
+        # Rows were removed; re-read everything (already indexed tickets are skipped by key)
+        known = 0
+    return index.fold(processed[known:], len(processed))
+
+def _catch_up():
+    try:
+        sync_reply_templates()
+    except Exception as e:
+        print(f"⚠️ Could not load reply templates from ProcessedTickets: {e}")
+
+def record_sent_replies(tickets):
+    """
+    Write-through hook for code that appends to ProcessedTickets. Never raises.
+    """
+    if not REPLY_TEMPLATES_ENABLED:
+        return 0
+    try:
+        return get_reply_templates().add(tickets)
+    except Exception as e:
+        print(f"⚠️ Could not index sent replies: {e}")
+        return 0
+
+def find_template_reply(name, text, issue_type=None, sentiment=None):
+    """
+    Return a personalized past reply for a near-duplicate ticket, or None to generate one.
+    Reuse needs a message of at most REPLY_TEMPLATE_MAX_MESSAGE_TOKENS and a similarity of at
+    least REPLY_TEMPLATE_THRESHOLD to a past ticket of the same issue type, or of any type when
+    the ticket is not classified yet (mcp_server classifies and replies concurrently).
+    """
+    if not REPLY_TEMPLATES_ENABLED:
+        return None
+    metrics.incr("reply_templates.lookups")
+    message_tokens = count_tokens(text)
+    if issue_type == "Unknown":
+        issue_type = None
+    if message_tokens > REPLY_TEMPLATE_MAX_MESSAGE_TOKENS:
+        metrics.incr("reply_templates.skipped.too_long")
+        return None
+    with metrics.timed("reply_templates.search_latency"):
+        match = get_reply_templates().nearest(text, issue_type, sentiment)
+    if match is None:
+        metrics.incr("reply_templates.skipped.no_candidates")
+        return None
+    template, similarity, source = match
+    metrics.observe("reply_templates.similarity", similarity)
+    if similarity < REPLY_TEMPLATE_THRESHOLD:
+        metrics.incr("reply_templates.skipped.below_threshold")
+        return None
+    reply = personalize(template, name)
+    metrics.incr("reply_templates.hits")
+    # Approximate: the message and reply tokens a generation would have cost
+    metrics.incr("reply_templates.tokens_saved", message_tokens + count_tokens(reply))
+    print(f"♻️ Reusing the reply sent for ticket {source} (similarity {similarity:.2f})")
+    return reply
+
+def template_report():
+    """
+    Reuse counters and index size: lookups, hits, hit rate, why lookups missed,
+    average best similarity and estimated tokens saved.
+    """
+    stats = metrics.snapshot("reply_templates.")
+    lookups = stats.get("reply_templates.lookups", 0)
+    hits = stats.get("reply_templates.hits", 0)
+    report = {
+        "lookups": int(lookups),
+        "hits": int(hits),
+        "hit_rate": round(100 * hits / lookups, 1) if lookups else 0.0,
+        "avg_similarity": round(stats.get("reply_templates.similarity.avg_s", 0.0), 3),
+        "tokens_saved": int(stats.get("reply_templates.tokens_saved", 0)),
+        "avg_search_ms": round(stats.get("reply_templates.search_latency.avg_s", 0.0) * 1000, 2),
+    }
+    for reason in ("too_long", "no_candidates", "below_threshold"):
+        report[f"skipped_{reason}"] = int(stats.get(f"reply_templates.skipped.{reason}", 0))
+    report["indexed"] = get_reply_templates().sizes() if REPLY_TEMPLATES_ENABLED and _index is not None else {}
+    return report
@@ -0,0 +1,176 @@
+import os
+import sqlite3
+import threading
+from datetime import timedelta
+from tools import metrics
+from tools.ledger import ticket_key
+
+# Processed-ticket counts per day x IssueType_Label x Sentiment, so the Dashboard
+# reads a few hundred rollup rows instead of scanning every processed ticket.
+ROLLUP_DB_PATH = os.getenv("ROLLUP_DB_PATH", "ticket_rollups.db")
+
+class TicketRollups:
+    """
+    Incrementally maintained rollups of processed tickets.
+
+    add() folds tickets in as they are appended to ProcessedTickets; each ticket is
+    counted once (by ticket_key), so write-through from this process and catch-up
+    from the Sheet can overlap safely. `processed_rows` is how many ProcessedTickets
+    rows have been folded by catch-up, so only newer rows are read next time.
+    """
+
+    def __init__(self, path=ROLLUP_DB_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rollup_daily ("
+                " day TEXT NOT NULL, issue_type TEXT NOT NULL, sentiment TEXT NOT NULL, count INTEGER NOT NULL,"
+                " PRIMARY KEY (day, issue_type, sentiment))"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS rollup_seen (ticket_key TEXT PRIMARY KEY)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS rollup_state (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    @staticmethod
+    def _day(ticket):
+        timestamp = str(ticket.get("timestamp") or "")
+        return timestamp[:10] if len(timestamp) >= 10 else ""
+
+    def _add(self, conn, tickets):
+        added = 0
+        for ticket in tickets:
+            if not conn.execute("INSERT OR IGNORE INTO rollup_seen VALUES (?)", (ticket_key(ticket),)).rowcount:
+                continue
+            conn.execute(
+                "INSERT INTO rollup_daily VALUES (?, ?, ?, 1)"
+                " ON CONFLICT (day, issue_type, sentiment) DO UPDATE SET count = count + 1",
+                (self._day(ticket), str(ticket.get("IssueType_Label") or ""), str(ticket.get("Sentiment") or "")),
+            )
+            added += 1
+        return added
+
+    def _set_processed_rows(self, conn, value):
+        conn.execute("INSERT OR REPLACE INTO rollup_state VALUES ('processed_rows', ?)", (value,))
+
+    def add(self, tickets):
+        """
+        Count newly processed tickets. Returns how many were not already counted.
+        """
+        with self._lock, self._conn:
+            added = self._add(self._conn, tickets)
+        metrics.incr("rollups.added", added)
+        return added
+
+    def processed_rows(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM rollup_state WHERE name = 'processed_rows'").fetchone()
+        return row[0] if row else 0
+
+    def fold(self, tickets, processed_rows):
+        """
+        Count the ProcessedTickets rows after processed_rows() and record that the
+        first `processed_rows` rows are now folded in.
+        """
+        with self._lock, self._conn:
+            added = self._add(self._conn, tickets)
+            self._set_processed_rows(self._conn, processed_rows)
+        metrics.incr("rollups.added", added)
+        return added
+
+    def rebuild(self, tickets):
+        """
+        Recount from scratch, e.g. after rows were removed from ProcessedTickets.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM rollup_daily")
+            self._conn.execute("DELETE FROM rollup_seen")
+            self._add(self._conn, tickets)
+            self._set_processed_rows(self._conn, len(tickets))
+        metrics.incr("rollups.rebuilds")
+
+    # ---------- reads ----------
+
+    @staticmethod
+    def _where(start_date=None, end_date=None, issue_types=None):
+        clauses, params = [], []
+        if start_date:
+            clauses.append("day >= ?")
+            params.append(start_date.strftime("%Y-%m-%d"))
+        if end_date:
+            clauses.append("day < ?")
+            params.append((end_date + timedelta(days=1)).strftime("%Y-%m-%d"))
+        if issue_types is not None:
+            clauses.append(f"issue_type IN ({', '.join('?' * len(issue_types))})" if issue_types else "0")
+            params.extend(issue_types)
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+    def daily(self, start_date=None, end_date=None, issue_types=None):
+        """
+        Rollup rows {day, issue_type, sentiment, count} matching the filters, ordered by day.
+        Dates are inclusive; None disables a filter.
+        """
+        where, params = self._where(start_date, end_date, issue_types)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT day, issue_type, sentiment, count FROM rollup_daily {where} ORDER BY day", params
+            ).fetchall()
+        return [{"day": d, "issue_type": i, "sentiment": s, "count": c} for d, i, s, c in rows]
+
+    def totals(self, column, start_date=None, end_date=None, issue_types=None):
+        """
+        {value: count} of `column` ("sentiment" or "issue_type") over the filtered range, largest first.
+        """
+        if column not in ("sentiment", "issue_type"):
+            raise ValueError(f"Unknown rollup column: {column}")
+        where, params = self._where(start_date, end_date, issue_types)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {column}, SUM(count) FROM rollup_daily {where} GROUP BY {column} ORDER BY 2 DESC, 1", params
+            ).fetchall()
+        return dict(rows)
+
+    def filter_options(self):
+        """
+        Same shape as the storage backends' processed_filter_options(), from the rollups.
+        """
+        with self._lock:
+            issue_types = [r[0] for r in self._conn.execute(
+                "SELECT DISTINCT issue_type FROM rollup_daily WHERE issue_type != '' ORDER BY 1")]
+            sentiments = [r[0] for r in self._conn.execute(
+                "SELECT DISTINCT sentiment FROM rollup_daily WHERE sentiment != '' ORDER BY 1")]
+            min_day, max_day = self._conn.execute(
+                "SELECT MIN(day), MAX(day) FROM rollup_daily WHERE day != ''").fetchone()
+        return {
+            "issue_types": issue_types,
+            "sentiments": sentiments,
+            "min_timestamp": f"{min_day} 00:00:00" if min_day else None,
+            "max_timestamp": f"{max_day} 00:00:00" if max_day else None,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_rollups = None
+_rollups_lock = threading.Lock()
+
+def get_rollups():
+    global _rollups
+    with _rollups_lock:
+        if _rollups is None:
+            _rollups = TicketRollups()
+        return _rollups
+
+def record_processed(tickets):
+    """
+    Write-through hook for code that appends to ProcessedTickets. Never raises:
+    a failure here only delays the counts until the next catch-up.
+    """
+    try:
+        return get_rollups().add(tickets)
+    except Exception as e:
+        print(f"⚠️ Could not update ticket rollups: {e}")
+        return 0
@@ -0,0 +1,78 @@
+import os
+import sys
+import threading
+from dotenv import load_dotenv
+
+# Shared settings and lazily built API clients for the tools package.
+# Importing this (or any tools module) never talks to the network or checks
+# credentials; a client is created the first time something actually uses it.
+load_dotenv()
+
+GOOGLE_CREDENTIALS_FILE = os.getenv("GOOGLE_CREDENTIALS_FILE", "google_cred.json")
+
+_clients = {}
+_clients_lock = threading.RLock()
+
+def require_env(name, message):
+    """
+    Return the environment variable `name`, raising ValueError(message) if it is unset or empty.
+    """
+    value = os.getenv(name)
+    if not value:
+        raise ValueError(message)
+    return value
+
+def get_client(name, factory):
+    """
+    Return the process-wide client registered under `name`, building it with
+    factory() on first use. Later calls (from any thread) get the same object.
+    """
+    client = _clients.get(name)
+    if client is not None:
+        return client
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = factory()
+        return _clients[name]
+
+def set_client(name, client):
+    """
+    Register a ready-made client (e.g. a test double) under `name`.
+    """
+    with _clients_lock:
+        _clients[name] = client
+
+def reset_clients(*names):
+    """
+    Forget the named clients (all of them when no names are given) so they are rebuilt on next use.
+    """
+    with _clients_lock:
+        for name in names or list(_clients):
+            _clients.pop(name, None)
+
+def get_groq_client():
+    """
+    The single Groq client shared by classification and reply generation.
+    """
+    def build():
+        from groq import Groq
+        return Groq(api_key=require_env("GROQ_API_KEY", "🚫 GROQ_API_KEY is missing from your .env file"))
+    return get_client("groq", build)
+
+def get_email_credentials():
+    """
+    Return (EMAIL_ADDRESS, EMAIL_APP_PASSWORD) for the SMTP sender.
+    """
+    address = os.getenv("EMAIL_ADDRESS")
+    password = os.getenv("EMAIL_APP_PASSWORD")
+    if not address or not password:
+        raise ValueError("❌ EMAIL_ADDRESS or EMAIL_APP_PASSWORD not found in .env")
+    return address, password
+
+def configure_console():
+    """
+    Switch stdout to UTF-8 so the emoji log lines print on any console.
+    Called by the command-line entry points, not on import.
+    """
+    if hasattr(sys.stdout, "reconfigure"):
+        sys.stdout.reconfigure(encoding="utf-8")
@@ -1,68 +1,465 @@
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import os
+import sqlite3
+import threading
+import time
 from datetime import datetime
+from tools import metrics
+from tools.ledger import ticket_key
+from tools.reply_templates import record_sent_replies
+from tools.rollups import record_processed
+from tools.settings import GOOGLE_CREDENTIALS_FILE, get_client
 
-# Google Sheets API setup
-scope = [
-    "https://spreadsheets.google.com/feeds",
-    "https://www.googleapis.com/auth/drive"
-]
-creds = ServiceAccountCredentials.from_json_keyfile_name("google_cred.json", scope)
-gs_client = gspread.authorize(creds)
+# "incremental" fetches only newly appended rows, "full" re-downloads the sheet on every fetch
+SHEET_SYNC_MODE = os.getenv("SHEET_SYNC_MODE", "incremental")
+# Writes that address PendingTickets rows by number are serialized across processes
+# (web app, worker shards) through a write transaction on this SQLite file, so rows
+# cannot be deleted between one process's TicketID lookup and its write
+SHEET_LOCK_PATH = os.getenv("SHEET_LOCK_PATH", "sheet_lock.db")
+SHEET_LOCK_TIMEOUT = float(os.getenv("SHEET_LOCK_TIMEOUT", "300"))  # seconds to wait for another writer
+# Incremental syncs only see appended rows; re-read a mirror in full at least this often
+# (seconds, 0 disables) to pick up edits made outside this app or from another host
+SHEET_FULL_SYNC_INTERVAL = float(os.getenv("SHEET_FULL_SYNC_INTERVAL", "300"))
+
+def get_gs_client():
+    """
+    The shared gspread client, authorized from GOOGLE_CREDENTIALS_FILE on first use.
+    """
+    def build():
+        from oauth2client.service_account import ServiceAccountCredentials
+        from tools.sheets_client import build_client, scope
+        creds = ServiceAccountCredentials.from_json_keyfile_name(GOOGLE_CREDENTIALS_FILE, scope)
+        return build_client(creds)
+    return get_client("gspread", build)
 
 # Constants
 SPREADSHEET_NAME = "SupportTickets"
 PENDING_SHEET_NAME = "PendingTickets"
 PROCESSED_SHEET_NAME = "ProcessedTickets"
+# TicketID is last so the Sentiment/IssueType_Label/AutoReply ranges (F:H) stay where they were
+SHEET_HEADER = ["timestamp","Name", "Email", "IssueType", "Message", "Sentiment", "IssueType_Label", "AutoReply", "TicketID"]
+
+# Opened Spreadsheet/Worksheet handles, reused across reruns and MCP calls
+_handle_lock = threading.RLock()
+_workbook = None
+_worksheets = {}
+
+def get_workbook():
+    global _workbook
+    with _handle_lock:
+        if _workbook is None:
+            metrics.incr("sheets.handle_misses")
+            _workbook = get_gs_client().open(SPREADSHEET_NAME)
+        else:
+            metrics.incr("sheets.handle_hits")
+        return _workbook
+
+def _get_worksheet(title):
+    from gspread.exceptions import WorksheetNotFound
+    with _handle_lock:
+        sheet = _worksheets.get(title)
+        if sheet is not None:
+            metrics.incr("sheets.handle_hits")
+            return sheet
+
+        metrics.incr("sheets.handle_misses")
+        workbook = get_workbook()
+        try:
+            sheet = workbook.worksheet(title)
+        except WorksheetNotFound:
+            # Create worksheet and set header row
+            sheet = workbook.add_worksheet(title=title, rows="1000", cols="10")
+            sheet.append_row(SHEET_HEADER)
+        else:
+            _upgrade_header(sheet)
+        _worksheets[title] = sheet
+        return sheet
+
+def _upgrade_header(sheet):
+    """
+    Add the columns introduced since a worksheet was created (e.g. TicketID) to its header row.
+    Rows written before then simply leave the new cells empty.
+    """
+    from gspread.utils import rowcol_to_a1
+    header_range = sheet.batch_get(["1:1"])[0]
+    header = list(header_range[0]) if header_range else []
+    if header != SHEET_HEADER[:len(header)]:
+        print(f"⚠️ Unexpected header in {sheet.title}: {header}")
+        return
+    missing = SHEET_HEADER[len(header):]
+    if not missing:
+        return
+    start = rowcol_to_a1(1, len(header) + 1)
+    end = rowcol_to_a1(1, len(SHEET_HEADER))
+    sheet.batch_update([{"range": f"{start}:{end}", "values": [missing]}])
+    print(f"✅ Added {', '.join(missing)} to the {sheet.title} header")
 
 def get_pending_sheet():
-    workbook = gs_client.open(SPREADSHEET_NAME)
-    try:
-        sheet = workbook.worksheet(PENDING_SHEET_NAME)
-    except gspread.exceptions.WorksheetNotFound:
-        # Create worksheet and set header row
-        sheet = workbook.add_worksheet(title=PENDING_SHEET_NAME, rows="1000", cols="10")
-        sheet.append_row(["timestamp","Name", "Email", "IssueType", "Message", "Sentiment", "IssueType_Label", "AutoReply"])
-    return sheet
+    return _get_worksheet(PENDING_SHEET_NAME)
 
 def get_processed_sheet():
-    workbook = gs_client.open(SPREADSHEET_NAME)
-    try:
-        sheet = workbook.worksheet(PROCESSED_SHEET_NAME)
-    except gspread.exceptions.WorksheetNotFound:
-        sheet = workbook.add_worksheet(title=PROCESSED_SHEET_NAME, rows="1000", cols="10")
-        sheet.append_row(["timestamp","Name", "Email", "IssueType", "Message", "Sentiment", "IssueType_Label", "AutoReply"])
-    return sheet
+    return _get_worksheet(PROCESSED_SHEET_NAME)
+
+def reset_sheet_cache():
+    """
+    Forget the cached Spreadsheet/Worksheet handles so the next access reopens them.
+    """
+    global _workbook
+    with _handle_lock:
+        _workbook = None
+        _worksheets.clear()
+
+def get_sheet_stats():
+    """
+    Return handle cache hit/miss, API call, retry and latency counters for Google Sheets.
+    """
+    return metrics.snapshot("sheets.")
+
+class _PendingWriteLock:
+    """
+    Re-entrant lock held by one thread of one process at a time: the outermost holder
+    keeps a BEGIN IMMEDIATE transaction open on SHEET_LOCK_PATH, which other processes
+    opening the same file wait for. Processes on other hosts are not covered.
+
+    Each hold also bumps a write generation stored in the same file, so every process
+    can tell when another one may have edited PendingTickets rows in place (see generation()).
+    """
+
+    def __init__(self, path=SHEET_LOCK_PATH, timeout=SHEET_LOCK_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._conn = None
+        self._held_from = None
+        self._reader = None
+        self._reader_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        try:
+            initialized = conn.execute("SELECT 1 FROM writes").fetchone() is not None
+        except sqlite3.OperationalError:
+            initialized = False
+        # Only write when the file is new: a write here would queue behind a current holder
+        if not initialized:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS writes (id INTEGER PRIMARY KEY CHECK (id = 0), generation INTEGER NOT NULL)"
+            )
+            conn.execute("INSERT OR IGNORE INTO writes (id, generation) VALUES (0, 0)")
+        return conn
+
+    def generation(self):
+        """
+        Number of write holds committed so far by all processes sharing SHEET_LOCK_PATH.
+        """
+        with self._reader_lock:
+            if self._reader is None:
+                self._reader = self._connect()
+            return self._reader.execute("SELECT generation FROM writes").fetchone()[0]
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                if self._conn is None:
+                    self._conn = self._connect()
+                with metrics.timed("sheets.write_lock_wait"):
+                    self._conn.execute("BEGIN IMMEDIATE")
+                self._held_from = self._conn.execute("SELECT generation FROM writes").fetchone()[0]
+            except BaseException:
+                if self._conn is not None and self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        try:
+            if self._depth == 0:
+                # Count every hold as a write, even a failed one may have changed some rows
+                try:
+                    self._conn.execute("UPDATE writes SET generation = generation + 1")
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                _own_write_committed(self._held_from, self._held_from + 1)
+        finally:
+            self._lock.release()
+
+pending_write_lock = _PendingWriteLock()
+
+class _SheetMirror:
+    """
+    Local copy of a worksheet plus the cursor (last row / last timestamp) seen so far.
+    Row i of `rows` is sheet row i + 2 (row 1 is the header). With `track_writes`, the
+    sheet is one other processes edit in place under pending_write_lock, and the mirror
+    remembers the write generation its rows reflect.
+    """
+
+    def __init__(self, track_writes=False):
+        self.lock = threading.RLock()
+        self.track_writes = track_writes
+        self.header = None
+        self.rows = []      # raw cell values, padded to the header width
+        self.records = []   # dicts as get_all_records() would return them, plus 'RowNumber'
+        self.generation = None
+        self.synced_at = 0.0  # time.monotonic() of the last full resync
+
+    @property
+    def last_row(self):
+        return len(self.rows) + 1
+
+    @property
+    def last_timestamp(self):
+        return self.records[-1].get("timestamp") if self.records else None
+
+    def clear(self):
+        with self.lock:
+            self.header = None
+            self.rows = []
+            self.records = []
+            self.generation = None
+            self.synced_at = 0.0
+
+    def _pad(self, values):
+        values = list(values)[:len(self.header)]
+        return values + [""] * (len(self.header) - len(values))
+
+    def _to_record(self, values, row_number):
+        from gspread.utils import numericise_all
+        record = dict(zip(self.header, numericise_all(values)))
+        record["RowNumber"] = row_number
+        return record
+
+    def load(self, header, rows):
+        self.header = list(header)
+        self.rows = []
+        self.records = []
+        self.extend(rows)
+
+    def extend(self, rows):
+        for values in rows:
+            values = self._pad(values)
+            self.rows.append(values)
+            self.records.append(self._to_record(values, len(self.rows) + 1))
+
+    def patch(self, row_number, changes):
+        """
+        Apply a local write (column name -> value) to a mirrored row.
+        """
+        with self.lock:
+            idx = row_number - 2
+            if self.header is None or not 0 <= idx < len(self.rows):
+                return
+            for column, value in changes.items():
+                if column in self.header:
+                    self.rows[idx][self.header.index(column)] = value
+            self.records[idx] = self._to_record(self.rows[idx], row_number)
+
+    def drop(self, row_numbers):
+        """
+        Remove locally deleted rows and renumber the rows below them.
+        """
+        with self.lock:
+            if self.header is None:
+                return
+            doomed = {r - 2 for r in row_numbers}
+            self.rows = [values for i, values in enumerate(self.rows) if i not in doomed]
+            self.records = [self._to_record(values, i) for i, values in enumerate(self.rows, start=2)]
+
+_mirrors = {
+    PENDING_SHEET_NAME: _SheetMirror(track_writes=True),
+    PROCESSED_SHEET_NAME: _SheetMirror(),
+}
+
+def _own_write_committed(before, after):
+    """
+    This process released pending_write_lock. Its own writes were patched into the
+    mirrors, so a mirror that was current before the hold is still current after it;
+    one that was behind stays behind and is re-read in full on its next sync.
+    """
+    for mirror in _mirrors.values():
+        with mirror.lock:
+            if mirror.track_writes and mirror.generation == before:
+                mirror.generation = after
+
+def _full_resync(sheet, mirror, generation=None):
+    values = sheet.get_all_values()
+    mirror.load(values[0] if values else SHEET_HEADER, values[1:])
+    mirror.generation = generation
+    mirror.synced_at = time.monotonic()
+    metrics.incr("sheets.full_resyncs")
+
+def _sync_sheet(sheet, mirror, full=False):
+    """
+    Bring `mirror` up to date with `sheet` and return its records.
+
+    Incremental mode issues a single batch_get for the header row and the range that
+    starts at the last row already seen. The re-read anchor row must still match the
+    local copy; if the header or anchor differ (columns changed, rows were deleted or
+    reordered elsewhere) the mirror falls back to a full resync. Rows edited in place
+    are only seen by a full resync, which also runs when another process has written
+    under pending_write_lock since the last one, and every SHEET_FULL_SYNC_INTERVAL.
+    """
+    from gspread.utils import rowcol_to_a1
+    with mirror.lock:
+        generation = pending_write_lock.generation() if mirror.track_writes else None
+        stale = mirror.generation != generation or (
+            SHEET_FULL_SYNC_INTERVAL and time.monotonic() - mirror.synced_at > SHEET_FULL_SYNC_INTERVAL
+        )
+        if full or SHEET_SYNC_MODE != "incremental" or mirror.header is None or stale:
+            if stale and mirror.header is not None:
+                metrics.incr("sheets.stale_resyncs")
+            _full_resync(sheet, mirror, generation)
+            return mirror.records
 
-def fetch_new_tickets():
+        anchor = mirror.last_row
+        end_col = rowcol_to_a1(1, len(mirror.header)).rstrip("0123456789")
+        header_range, tail_range = sheet.batch_get(["1:1", f"A{anchor}:{end_col}"])
+        header = header_range[0] if header_range else []
+        tail = list(tail_range)
+
+        expected_anchor = mirror.rows[-1] if mirror.rows else mirror.header
+        if list(header) != mirror.header or not tail or mirror._pad(tail[0]) != expected_anchor:
+            _full_resync(sheet, mirror, generation)
+            return mirror.records
+
+        mirror.extend(tail[1:])
+        metrics.incr("sheets.incremental_syncs")
+        metrics.incr("sheets.incremental_rows", len(tail) - 1)
+        return mirror.records
+
+def get_sync_cursor(sheet_name):
+    """
+    Return the last row number and timestamp the local mirror of `sheet_name` has seen.
+    """
+    mirror = _mirrors[sheet_name]
+    with mirror.lock:
+        return {"last_row": mirror.last_row, "last_timestamp": mirror.last_timestamp}
+
+def reset_sync_cache():
+    """
+    Drop the local sheet mirrors so the next fetch performs a full resync.
+    """
+    for mirror in _mirrors.values():
+        mirror.clear()
+
+def fetch_new_tickets(full=False):
     """
     Fetch tickets from PendingTickets sheet that have empty Sentiment or AutoReply (i.e., pending processing).
     Returns a list of dicts, each with 'RowNumber' added for sheet operations.
+    Only rows appended since the previous call are downloaded unless `full` is True.
     """
     sheet = get_pending_sheet()
-    data = sheet.get_all_records()
-    tickets = []
-    for idx, row in enumerate(data, start=2):  # Skip header (row 1)
-        if not row.get('Sentiment') or not row.get('AutoReply'):
-            row['RowNumber'] = idx
-            tickets.append(row)
-    return tickets
+    records = _sync_sheet(sheet, _mirrors[PENDING_SHEET_NAME], full=full)
+    return [
+        dict(row) for row in records
+        if not row.get('Sentiment') or not row.get('AutoReply')
+    ]
 
-def update_ticket(row_number, sentiment, issue_type, reply):
+def locate_pending_rows(tickets, warn=True):
     """
-    Update a ticket row in PendingTickets sheet with sentiment, issue_type_label, and reply.
-    Column indices based on header:
-      timestamp=1, Name=2, Email=3, IssueType=4, Message=5,
-      Sentiment=6, IssueType_Label=7, AutoReply=8
+    Find the current PendingTickets row of each ticket by its TicketID (see ticket_key),
+    since RowNumbers shift whenever rows above are deleted.
+    Returns copies of the tickets that are still pending, with 'RowNumber' refreshed;
+    with `warn`, tickets that are not are reported.
     """
-    sheet = get_pending_sheet()
+    records = _sync_sheet(get_pending_sheet(), _mirrors[PENDING_SHEET_NAME])
+    rows = {ticket_key(record): record["RowNumber"] for record in records}
+    located = []
+    for ticket in tickets:
+        row_number = rows.get(ticket_key(ticket))
+        if row_number is None:
+            if warn:
+                print(f"⚠️ Ticket {ticket_key(ticket)} from {ticket.get('Email')} is no longer in PendingTickets")
+            continue
+        located.append({**ticket, "RowNumber": row_number})
+    return located
+
+def append_pending_tickets(tickets):
+    """
+    Append new tickets (dicts keyed by SHEET_HEADER, with a TicketID) to PendingTickets
+    in a single API call.
+    """
+    get_pending_sheet().append_rows([[ticket.get(column, "") for column in SHEET_HEADER] for ticket in tickets])
+    print(f"✅ Appended {len(tickets)} tickets to PendingTickets")
+
+def existing_ticket_ids(ticket_ids):
+    """
+    The subset of `ticket_ids` already present in PendingTickets or ProcessedTickets.
+    """
+    wanted = set(ticket_ids)
+    found = set()
+    for title, sheet in ((PENDING_SHEET_NAME, get_pending_sheet()), (PROCESSED_SHEET_NAME, get_processed_sheet())):
+        found.update(ticket_key(record) for record in _sync_sheet(sheet, _mirrors[title]) if ticket_key(record) in wanted)
+    return found
+
+def find_pending_row(ticket_id):
+    """
+    Current PendingTickets row number of the ticket with this ticket_key, or None.
+    """
+    located = locate_pending_rows([{"TicketID": ticket_id}])
+    return located[0]["RowNumber"] if located else None
+
+def update_ticket(ticket_id, sentiment, issue_type, reply):
+    """
+    Write Sentiment, IssueType_Label and AutoReply (columns F:H) of the PendingTickets
+    row holding `ticket_id`, wherever that row is now.
+    """
+    from gspread.utils import rowcol_to_a1
+    try:
+        with pending_write_lock:
+            row_number = find_pending_row(ticket_id)
+            if row_number is None:
+                return
+            get_pending_sheet().batch_update([{
+                "range": f"{rowcol_to_a1(row_number, 6)}:{rowcol_to_a1(row_number, 8)}",
+                "values": [[sentiment, issue_type, reply]],
+            }])
+            _mirrors[PENDING_SHEET_NAME].patch(
+                row_number, {"Sentiment": sentiment, "IssueType_Label": issue_type, "AutoReply": reply}
+            )
+        print(f"✅ Updated ticket {ticket_id} (row {row_number}) in PendingTickets")
+    except Exception as e:
+        print(f"❌ Error updating ticket {ticket_id} in PendingTickets: {e}")
+
+def update_ticket_labels(tickets):
+    """
+    Write Sentiment and IssueType_Label (columns F:G) for many PendingTickets rows
+    in one batched update, so later reruns do not classify them again.
+    Returns the number of rows written.
+    """
+    if not tickets:
+        return 0
     try:
-        sheet.update_cell(row_number, 6, sentiment)       # Sentiment (F)
-        sheet.update_cell(row_number, 7, issue_type)      # IssueType_Label (G)
-        sheet.update_cell(row_number, 8, reply)           # AutoReply (H)
-        print(f"✅ Updated Row {row_number} in PendingTickets")
+        # Located and written under the lock, so no other process shifts the rows in between
+        with pending_write_lock:
+            return _write_labels(tickets)
     except Exception as e:
-        print(f"❌ Error updating row {row_number} in PendingTickets: {e}")
+        print(f"❌ Error writing labels to PendingTickets: {e}")
+        return 0
+
+def _write_labels(tickets):
+    from gspread.utils import rowcol_to_a1
+    tickets = locate_pending_rows(tickets)
+    if not tickets:
+        return 0
+
+    get_pending_sheet().batch_update([
+        {
+            "range": f"{rowcol_to_a1(t['RowNumber'], 6)}:{rowcol_to_a1(t['RowNumber'], 7)}",
+            "values": [[t.get("Sentiment", ""), t.get("IssueType_Label", "")]],
+        }
+        for t in tickets
+    ])
+    mirror = _mirrors[PENDING_SHEET_NAME]
+    for t in tickets:
+        mirror.patch(t["RowNumber"], {"Sentiment": t.get("Sentiment", ""), "IssueType_Label": t.get("IssueType_Label", "")})
+    print(f"✅ Saved labels for {len(tickets)} rows in PendingTickets")
+    return len(tickets)
 
 def append_processed_ticket(ticket, sentiment, issue_type, reply):
     """
@@ -72,7 +469,7 @@ def append_processed_ticket(ticket, sentiment, issue_type, reply):
     sheet = get_processed_sheet()
     try:
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        sheet.append_row([
+        row = [
             timestamp,
             ticket.get("Name", ""),
             ticket.get("Email", ""),
@@ -80,31 +477,152 @@ def append_processed_ticket(ticket, sentiment, issue_type, reply):
             ticket.get("Message", ""),
             sentiment,
             issue_type,
-            reply
-        ])
+            reply,
+            ticket_key(ticket)
+        ]
+        sheet.append_row(row)
         print("✅ Appended ticket to ProcessedTickets")
+        record_processed([dict(zip(SHEET_HEADER, row))])
+        record_sent_replies([dict(zip(SHEET_HEADER, row))])
     except Exception as e:
         print(f"❌ Failed to append ticket to ProcessedTickets: {e}")
 
-def delete_ticket_from_pending(row_number):
+def delete_ticket_from_pending(ticket_id):
     """
-    Delete a ticket row from PendingTickets sheet.
+    Delete the ticket with this ticket_key from PendingTickets sheet.
     """
-    sheet = get_pending_sheet()
     try:
-        sheet.delete_rows(row_number)
-        print(f"✅ Deleted Row {row_number} from PendingTickets")
+        with pending_write_lock:
+            row_number = find_pending_row(ticket_id)
+            if row_number is None:
+                return
+            get_pending_sheet().delete_rows(row_number)
+            _mirrors[PENDING_SHEET_NAME].drop([row_number])
+        print(f"✅ Deleted ticket {ticket_id} (row {row_number}) from PendingTickets")
     except Exception as e:
-        print(f"❌ Error deleting row {row_number} from PendingTickets: {e}")
+        print(f"❌ Error deleting ticket {ticket_id} from PendingTickets: {e}")
 
-def fetch_processed_tickets():
+def fetch_processed_tickets(full=False):
     """
     Fetch all processed tickets from ProcessedTickets sheet.
-    Returns list of dicts.
+    Returns list of dicts. Previously seen rows come from the local mirror and
+    only newly appended rows are downloaded unless `full` is True.
     """
     sheet = get_processed_sheet()
     try:
-        return sheet.get_all_records()
+        records = _sync_sheet(sheet, _mirrors[PROCESSED_SHEET_NAME], full=full)
+        return [{k: v for k, v in row.items() if k != "RowNumber"} for row in records]
     except Exception as e:
         print(f"❌ Error fetching processed tickets: {e}")
         return []
+
+def _group_descending_runs(row_numbers):
+    """
+    Group row numbers into contiguous (start, end) runs, highest rows first.
+    Deleting bottom-up keeps the RowNumber of every row above untouched.
+    """
+    runs = []
+    for row in sorted(set(row_numbers), reverse=True):
+        if runs and runs[-1][0] == row + 1:
+            runs[-1][0] = row
+        else:
+            runs.append([row, row])
+    return [(start, end) for start, end in runs]
+
+def commit_processed_tickets(tickets):
+    """
+    Record a batch of processed tickets in three Sheets API calls:
+      1. one multi-row append to ProcessedTickets of the tickets not already there,
+      2. one batched range update of Sentiment/IssueType_Label/AutoReply on PendingTickets,
+      3. one batched deletion of the affected PendingTickets rows (bottom-up).
+    The pending rows are only touched once the append succeeded: a labelled row is no
+    longer returned by fetch_new_tickets(), so labelling first could lose the ticket.
+    Tickets are matched by TicketID (see ticket_key) in both sheets, so tickets that
+    never had a pending row are only appended. Each ticket needs 'Sentiment',
+    'IssueType_Label' and 'AutoReply' filled in.
+    Both sheets are re-read and written under pending_write_lock, so concurrent commits
+    from other threads or processes on this host never act on stale row numbers.
+    Errors propagate; calling it again with the same tickets finishes an interrupted
+    commit without appending or deleting anything twice.
+    Returns the number of tickets committed.
+    """
+    if not tickets:
+        return 0
+    with pending_write_lock:
+        return _commit_processed(tickets)
+
+def _commit_processed(tickets):
+    from gspread.utils import rowcol_to_a1
+    pending = get_pending_sheet()
+    processed = get_processed_sheet()
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    recorded = {ticket_key(record) for record in _sync_sheet(processed, _mirrors[PROCESSED_SHEET_NAME])}
+    rows = []
+    for ticket in tickets:
+        key = ticket_key(ticket)
+        if key in recorded:
+            # Appended by an earlier attempt whose later steps failed
+            metrics.incr("sheets.commit_already_recorded")
+            continue
+        recorded.add(key)
+        issue_type = ticket.get("IssueType_Label", "Unknown")
+        rows.append([
+            timestamp,
+            ticket.get("Name", ""),
+            ticket.get("Email", ""),
+            ticket.get("IssueType", issue_type),
+            ticket.get("Message", ""),
+            ticket.get("Sentiment", "Neutral"),
+            issue_type,
+            ticket.get("AutoReply", ""),
+            key
+        ])
+
+    if rows:
+        processed.append_rows(rows)
+        print(f"✅ Appended {len(rows)} tickets to ProcessedTickets")
+        try:
+            record_processed([dict(zip(SHEET_HEADER, row)) for row in rows])
+            record_sent_replies([dict(zip(SHEET_HEADER, row)) for row in rows])
+        except Exception as e:
+            # Both catch up from ProcessedTickets later
+            print(f"⚠️ Failed to index {len(rows)} processed tickets locally: {e}")
+
+    located = locate_pending_rows(tickets, warn=False)
+    if not located:
+        return len(tickets)
+
+    pending.batch_update([
+        {
+            "range": f"{rowcol_to_a1(t['RowNumber'], 6)}:{rowcol_to_a1(t['RowNumber'], 8)}",
+            "values": [[t.get("Sentiment", "Neutral"), t.get("IssueType_Label", "Unknown"), t.get("AutoReply", "")]],
+        }
+        for t in located
+    ])
+    mirror = _mirrors[PENDING_SHEET_NAME]
+    for t in located:
+        mirror.patch(t["RowNumber"], {
+            "Sentiment": t.get("Sentiment", "Neutral"),
+            "IssueType_Label": t.get("IssueType_Label", "Unknown"),
+            "AutoReply": t.get("AutoReply", ""),
+        })
+    print(f"✅ Updated {len(located)} rows in PendingTickets")
+
+    requests = [
+        {
+            "deleteDimension": {
+                "range": {
+                    "sheetId": pending.id,
+                    "dimension": "ROWS",
+                    "startIndex": start - 1,  # 0-based, inclusive
+                    "endIndex": end,          # 0-based, exclusive
+                }
+            }
+        }
+        for start, end in _group_descending_runs(t["RowNumber"] for t in located)
+    ]
+    pending.spreadsheet.batch_update({"requests": requests})
+    mirror.drop(t["RowNumber"] for t in located)
+    print(f"✅ Deleted {len(located)} rows from PendingTickets")
+    return len(tickets)
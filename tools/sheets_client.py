@@ -0,0 +1,80 @@
+import json
+import os
+import random
+import time
+import gspread
+from google.auth.transport.requests import AuthorizedSession
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+from gspread.utils import convert_credentials
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+from urllib.parse import urlsplit
+from tools import metrics
+
+# gspread transport for sheet_connector. Kept in its own module so that importing
+# sheet_connector does not pull in gspread/google-auth until a sheet is actually opened.
+
+# Google Sheets API setup
+scope = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/drive"
+]
+
+# Connection tuning
+SHEETS_POOL_SIZE = int(os.getenv("SHEETS_POOL_SIZE", "10"))
+SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "5"))
+SHEETS_MAX_BACKOFF = float(os.getenv("SHEETS_MAX_BACKOFF", "32"))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Reads can be re-sent after any transient failure. A write (append, batch update,
+# row deletion) that failed with a 5xx or a dropped connection may still have been
+# applied, so it is only retried on 429, which the API rejects without applying;
+# callers that repeat it re-check the sheet first (see tools.intake).
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+class PooledHTTPClient(HTTPClient):
+    """
+    gspread HTTP client that retries transient errors with exponential backoff (reads on
+    429/5xx and connection errors, writes on 429 only) and records call count / latency
+    in tools.metrics.
+    The underlying AuthorizedSession only refreshes the OAuth token when it expires.
+    """
+
+    def request(self, method, endpoint, *args, **kwargs):
+        payload = kwargs.get("json")
+        data = kwargs.get("data")
+        bytes_out = len(data) if data else len(json.dumps(payload)) if payload else 0
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        with metrics.span("sheets.request", method=method, endpoint=urlsplit(endpoint).path,
+                          bytes_out=bytes_out) as call:
+            for attempt in range(SHEETS_MAX_RETRIES + 1):
+                start = time.perf_counter()
+                try:
+                    response = super().request(method, endpoint, *args, **kwargs)
+                    call.set(retries=attempt, bytes_in=len(response.content or b""))
+                    return response
+                except APIError as e:
+                    status = getattr(e.response, "status_code", None)
+                    retryable = status == 429 or (idempotent and status in RETRY_STATUS_CODES)
+                    if not retryable or attempt == SHEETS_MAX_RETRIES:
+                        call.set(retries=attempt, status_code=status)
+                        raise
+                except (RequestsConnectionError, Timeout):
+                    if not idempotent or attempt == SHEETS_MAX_RETRIES:
+                        call.set(retries=attempt)
+                        raise
+                finally:
+                    metrics.incr("sheets.api_calls")
+                    metrics.observe("sheets.api_latency", time.perf_counter() - start)
+
+                metrics.incr("sheets.api_retries")
+                time.sleep(min(2 ** attempt + random.random(), SHEETS_MAX_BACKOFF))
+
+def build_client(credentials):
+    """
+    Authorize gspread with a single pooled HTTP session shared by all threads.
+    """
+    session = AuthorizedSession(convert_credentials(credentials))
+    adapter = HTTPAdapter(pool_connections=SHEETS_POOL_SIZE, pool_maxsize=SHEETS_POOL_SIZE)
+    session.mount("https://", adapter)
+    return gspread.Client(credentials, session=session, http_client=PooledHTTPClient)
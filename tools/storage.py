@@ -0,0 +1,291 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from tools import settings  # loads .env
+
+# Storage backend selection: "sheets" reads Google Sheets directly,
+# "sqlite" serves reads from a local mirror that is synced from the Sheet in the background.
+TICKET_STORAGE_BACKEND = os.getenv("TICKET_STORAGE_BACKEND", "sheets")
+TICKET_DB_PATH = os.getenv("TICKET_DB_PATH", "support_tickets.db")
+TICKET_SYNC_INTERVAL = float(os.getenv("TICKET_SYNC_INTERVAL", "30"))
+
+# Same columns (and names) as the PendingTickets/ProcessedTickets header row
+TICKET_COLUMNS = ["timestamp", "Name", "Email", "IssueType", "Message", "Sentiment", "IssueType_Label", "AutoReply", "TicketID"]
+
+def _date_bounds(start_date=None, end_date=None):
+    """
+    Turn an inclusive (start_date, end_date) pair into timestamp string bounds [lower, upper).
+    """
+    lower = start_date.strftime("%Y-%m-%d") if start_date else None
+    upper = (end_date + timedelta(days=1)).strftime("%Y-%m-%d") if end_date else None
+    return lower, upper
+
+class SheetsBackend:
+    """
+    Reads tickets straight from Google Sheets; filters run in memory.
+    """
+
+    def _sheets(self):
+        from tools import sheet_connector
+        return sheet_connector
+
+    def fetch_new_tickets(self):
+        return self._sheets().fetch_new_tickets()
+
+    def fetch_processed_tickets(self):
+        return self._sheets().fetch_processed_tickets()
+
+    def query_processed_tickets(self, start_date=None, end_date=None, issue_types=None, sentiments=None):
+        lower, upper = _date_bounds(start_date, end_date)
+        result = []
+        for ticket in self.fetch_processed_tickets():
+            timestamp = str(ticket.get("timestamp", ""))
+            if lower and timestamp < lower:
+                continue
+            if upper and timestamp >= upper:
+                continue
+            if issue_types is not None and ticket.get("IssueType_Label") not in issue_types:
+                continue
+            if sentiments is not None and ticket.get("Sentiment") not in sentiments:
+                continue
+            result.append(ticket)
+        return result
+
+    def processed_filter_options(self):
+        tickets = self.fetch_processed_tickets()
+        timestamps = sorted(str(t["timestamp"]) for t in tickets if t.get("timestamp"))
+        return {
+            "issue_types": sorted({t["IssueType_Label"] for t in tickets if t.get("IssueType_Label")}),
+            "sentiments": sorted({t["Sentiment"] for t in tickets if t.get("Sentiment")}),
+            "min_timestamp": timestamps[0] if timestamps else None,
+            "max_timestamp": timestamps[-1] if timestamps else None,
+        }
+
+    def sync(self):
+        """
+        Nothing to mirror; reads always hit the Sheet.
+        """
+        return {"pending": 0, "processed": 0}
+
+    def sync_rollups(self):
+        """
+        Fold ProcessedTickets rows appended since the last call (by any process) into the rollups.
+        The Sheet read is incremental, so this only downloads the new rows.
+        """
+        from tools.rollups import get_rollups
+        rollups = get_rollups()
+        processed = self.fetch_processed_tickets()
+        known = rollups.processed_rows()
+        if len(processed) < known:
+            rollups.rebuild(processed)
+            return len(processed)
+        return rollups.fold(processed[known:], len(processed))
+
+class SQLiteBackend:
+    """
+    Local SQLite mirror of PendingTickets and ProcessedTickets.
+    Needs no Google credentials unless sync() is called without explicit sources.
+    """
+
+    def __init__(self, path=TICKET_DB_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._create_schema()
+
+    def _create_schema(self):
+        columns = ", ".join(f'"{c}" TEXT' for c in TICKET_COLUMNS)
+        with self._lock, self._conn:
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS pending_tickets (RowNumber INTEGER PRIMARY KEY, {columns})")
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS processed_tickets (SheetRow INTEGER PRIMARY KEY, {columns})")
+            # Mirrors created before a column existed get it appended, keeping TICKET_COLUMNS order
+            for table in ("pending_tickets", "processed_tickets"):
+                existing = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+                for column in TICKET_COLUMNS:
+                    if column not in existing:
+                        self._conn.execute(f'ALTER TABLE {table} ADD COLUMN "{column}" TEXT')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_processed_timestamp ON processed_tickets ("timestamp")')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_processed_issue_type ON processed_tickets ("IssueType_Label")')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_processed_sentiment ON processed_tickets ("Sentiment")')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_processed_email ON processed_tickets ("Email")')
+
+    def _rows(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    @staticmethod
+    def _values(ticket):
+        return ["" if ticket.get(c) is None else str(ticket.get(c)) for c in TICKET_COLUMNS]
+
+    # ---------- writes (mirror maintenance) ----------
+
+    def replace_pending(self, tickets):
+        """
+        Replace the pending mirror with `tickets` (dicts carrying 'RowNumber').
+        """
+        placeholders = ", ".join("?" * (len(TICKET_COLUMNS) + 1))
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM pending_tickets")
+            self._conn.executemany(
+                f"INSERT INTO pending_tickets VALUES ({placeholders})",
+                [[t["RowNumber"], *self._values(t)] for t in tickets if t.get("RowNumber")],
+            )
+
+    def add_processed(self, tickets, first_row):
+        """
+        Insert processed tickets whose sheet rows start at `first_row`; already mirrored rows are skipped.
+        """
+        placeholders = ", ".join("?" * (len(TICKET_COLUMNS) + 1))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO processed_tickets VALUES ({placeholders})",
+                [[row, *self._values(t)] for row, t in enumerate(tickets, start=first_row)],
+            )
+
+    def processed_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM processed_tickets").fetchone()[0]
+
+    def sync(self, fetch_pending=None, fetch_processed=None):
+        """
+        Pull the Sheet into the mirror. Only processed rows beyond the mirrored count are inserted.
+        The fetch callables default to tools.sheet_connector and can be swapped for offline use.
+        """
+        if fetch_pending is None or fetch_processed is None:
+            from tools import sheet_connector
+            fetch_pending = fetch_pending or sheet_connector.fetch_new_tickets
+            fetch_processed = fetch_processed or sheet_connector.fetch_processed_tickets
+
+        pending = fetch_pending()
+        processed = fetch_processed()
+        known = self.processed_count()
+        if len(processed) < known:
+            # Rows were removed from the Sheet; rebuild instead of guessing which ones
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM processed_tickets")
+            known = 0
+
+        self.replace_pending(pending)
+        self.add_processed(processed[known:], first_row=known + 2)
+        self.sync_rollups()
+        return {"pending": len(pending), "processed": len(processed) - known}
+
+    def sync_rollups(self):
+        """
+        Fold mirrored processed rows that the rollups have not seen yet.
+        """
+        from tools.rollups import get_rollups
+        rollups = get_rollups()
+        count = self.processed_count()
+        known = rollups.processed_rows()
+        if count < known:
+            rollups.rebuild(self.fetch_processed_tickets())
+            return count
+        rows = self._rows("SELECT * FROM processed_tickets WHERE SheetRow >= ? ORDER BY SheetRow", (known + 2,))
+        return rollups.fold([{c: row[c] for c in TICKET_COLUMNS} for row in rows], count)
+
+    # ---------- reads ----------
+
+    def fetch_new_tickets(self):
+        tickets = self._rows("SELECT * FROM pending_tickets ORDER BY RowNumber")
+        return [t for t in tickets if not t.get("Sentiment") or not t.get("AutoReply")]
+
+    def fetch_processed_tickets(self):
+        rows = self._rows("SELECT * FROM processed_tickets ORDER BY SheetRow")
+        return [{c: row[c] for c in TICKET_COLUMNS} for row in rows]
+
+    def query_processed_tickets(self, start_date=None, end_date=None, issue_types=None, sentiments=None):
+        """
+        Indexed filter over processed tickets. Dates are inclusive; None disables a filter.
+        """
+        lower, upper = _date_bounds(start_date, end_date)
+        clauses, params = [], []
+        if lower:
+            clauses.append('"timestamp" >= ?')
+            params.append(lower)
+        if upper:
+            clauses.append('"timestamp" < ?')
+            params.append(upper)
+        for column, values in (("IssueType_Label", issue_types), ("Sentiment", sentiments)):
+            if values is not None:
+                clauses.append(f'"{column}" IN ({", ".join("?" * len(values))})' if values else "0")
+                params.extend(values)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._rows(f'SELECT * FROM processed_tickets {where} ORDER BY "timestamp", SheetRow', params)
+        return [{c: row[c] for c in TICKET_COLUMNS} for row in rows]
+
+    def processed_filter_options(self):
+        with self._lock:
+            issue_types = [r[0] for r in self._conn.execute(
+                'SELECT DISTINCT "IssueType_Label" FROM processed_tickets WHERE "IssueType_Label" != \'\' ORDER BY 1')]
+            sentiments = [r[0] for r in self._conn.execute(
+                'SELECT DISTINCT "Sentiment" FROM processed_tickets WHERE "Sentiment" != \'\' ORDER BY 1')]
+            min_ts, max_ts = self._conn.execute(
+                'SELECT MIN("timestamp"), MAX("timestamp") FROM processed_tickets WHERE "timestamp" != \'\'').fetchone()
+        return {
+            "issue_types": issue_types,
+            "sentiments": sentiments,
+            "min_timestamp": min_ts,
+            "max_timestamp": max_ts,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class BackgroundSync(threading.Thread):
+    """
+    Daemon thread that calls backend.sync() every `interval` seconds.
+    """
+
+    def __init__(self, backend, interval=TICKET_SYNC_INTERVAL):
+        super().__init__(name="ticket-sheet-sync", daemon=True)
+        self.backend = backend
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                result = self.backend.sync()
+                print(f"🔄 Synced Sheet to local store: {result}")
+            except Exception as e:
+                print(f"⚠️ Background sheet sync failed: {e}")
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+_storage = None
+_storage_lock = threading.Lock()
+_sync_thread = None
+
+def get_storage():
+    """
+    Return the process-wide storage backend selected by TICKET_STORAGE_BACKEND.
+    The SQLite backend is synced once up front and then kept fresh by a BackgroundSync thread.
+    """
+    global _storage, _sync_thread
+    with _storage_lock:
+        if _storage is None:
+            if TICKET_STORAGE_BACKEND == "sqlite":
+                _storage = SQLiteBackend()
+                _storage.sync()
+                _sync_thread = BackgroundSync(_storage)
+                _sync_thread.start()
+            else:
+                _storage = SheetsBackend()
+        return _storage
+
+def parse_timestamp(value):
+    """
+    Parse a sheet timestamp string; returns None if it is empty or malformed.
+    """
+    try:
+        return datetime.strptime(str(value), "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
@@ -0,0 +1,166 @@
+import json
+import os
+import re
+from tools import metrics
+
+# Structured output for classification: Groq's JSON mode constrains completions to a
+# JSON object, a tolerant extractor copes with preambles and code fences when it is
+# off (or ignored), and results are validated against the label enums below.
+CLASSIFY_JSON_MODE = os.getenv("CLASSIFY_JSON_MODE", "1") == "1"
+# Extra attempts (at temperature 0) when the final model's answer does not parse
+CLASSIFY_PARSE_RETRIES = int(os.getenv("CLASSIFY_PARSE_RETRIES", "1"))
+
+VALID_SENTIMENTS = ("Positive", "Negative", "Neutral")
+VALID_ISSUE_TYPES = ("Billing", "Technical", "Login", "General", "Other")
+
+PARSE_FAILURE_KINDS = ("empty", "no_json", "wrong_shape", "invalid_labels")
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.IGNORECASE | re.DOTALL)
+
+class ClassificationParseError(ValueError):
+    """
+    A completion held no valid classification. `kind` is one of PARSE_FAILURE_KINDS.
+    """
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+def response_format():
+    """
+    The `response_format` argument for classification completions (None when JSON mode is off).
+    """
+    return {"type": "json_object"} if CLASSIFY_JSON_MODE else None
+
+def extract_json(content):
+    """
+    Return (value, exact): the first JSON object/array in `content` and whether the
+    completion was nothing but that JSON. Preambles, trailing remarks and ``` fences are skipped.
+    """
+    text = str(content or "").strip()
+    if not text:
+        raise ClassificationParseError("empty", "empty completion")
+    try:
+        return json.loads(text), True
+    except ValueError:
+        pass
+    fenced = _FENCE_RE.search(text)
+    candidates = [fenced.group(1)] if fenced else []
+    candidates.append(text)
+    decoder = json.JSONDecoder()
+    for candidate in candidates:
+        for match in re.finditer(r"[\[{]", candidate):
+            try:
+                value, _ = decoder.raw_decode(candidate, match.start())
+                return value, False
+            except ValueError:
+                continue
+    raise ClassificationParseError("no_json", f"no JSON found in {text[:80]!r}")
+
+def _label(value, allowed):
+    """
+    Canonical spelling of `value` in `allowed` ('negative ' -> 'Negative'), or None.
+    """
+    if not isinstance(value, str):
+        return None
+    wanted = value.strip().lower()
+    return next((label for label in allowed if label.lower() == wanted), None)
+
+def validate_classification(value):
+    """
+    Validate one parsed classification object and return
+    {"sentiment", "issue_type", "confidence"} with canonical labels. Confidence is
+    optional (1.0 when absent), clamped to 0..1, and 0.0 when not a number.
+    """
+    if not isinstance(value, dict):
+        raise ClassificationParseError("wrong_shape", f"expected an object, got {type(value).__name__}")
+    sentiment = _label(value.get("sentiment"), VALID_SENTIMENTS)
+    issue_type = _label(value.get("issue_type"), VALID_ISSUE_TYPES)
+    if sentiment is None or issue_type is None:
+        raise ClassificationParseError(
+            "invalid_labels", f"labels {value.get('sentiment')!r}/{value.get('issue_type')!r} are not valid"
+        )
+    try:
+        confidence = min(1.0, max(0.0, float(value.get("confidence", 1.0))))
+    except (TypeError, ValueError):
+        confidence = 0.0
+    return {"sentiment": sentiment, "issue_type": issue_type, "confidence": confidence}
+
+def parse_classification(content, task="classify"):
+    """
+    Parse a single-ticket classification completion. Raises ClassificationParseError.
+    """
+    try:
+        value, exact = extract_json(content)
+        result = validate_classification(value)
+    except ClassificationParseError as e:
+        record_parse_failure(task, e.kind)
+        raise
+    record_parse(task, exact)
+    return result
+
+def parse_batch_classification(content, ticket_ids, task="classify_batch"):
+    """
+    Parse a batch completion: an array of classifications with a known, unique 'id',
+    either bare or (in JSON mode) wrapped in an object such as {"tickets": [...]}.
+    Invalid items are dropped and counted. Returns {ticket_id: classification}.
+    """
+    try:
+        value, exact = extract_json(content)
+        if isinstance(value, dict):
+            value = next((v for v in value.values() if isinstance(v, list)), value)
+        if not isinstance(value, list):
+            raise ClassificationParseError("wrong_shape", "expected an array of classifications")
+    except ClassificationParseError as e:
+        record_parse_failure(task, e.kind)
+        return {}
+    record_parse(task, exact)
+
+    results = {}
+    for item in value:
+        ticket_id = str(item.get("id", "")) if isinstance(item, dict) else ""
+        if ticket_id not in ticket_ids or ticket_id in results:
+            metrics.incr(f"parse.{task}.invalid_items")
+            continue
+        try:
+            results[ticket_id] = validate_classification(item)
+        except ClassificationParseError:
+            metrics.incr(f"parse.{task}.invalid_items")
+    return results
+
+def record_parse(task, exact):
+    metrics.incr(f"parse.{task}.parsed")
+    if not exact:
+        # Only the tolerant extractor could read it
+        metrics.incr(f"parse.{task}.extracted")
+
+def record_parse_failure(task, kind):
+    metrics.incr(f"parse.{task}.failures")
+    metrics.incr(f"parse.{task}.failures.{kind}")
+
+def parse_report():
+    """
+    One row per task: completions parsed, how many needed the tolerant extractor,
+    failures by kind, retries spent on them and tickets left as Unknown.
+    """
+    stats = metrics.snapshot("parse.")
+    rows = []
+    for task in sorted({name.split(".")[1] for name in stats}):
+        prefix = f"parse.{task}"
+        parsed = stats.get(f"{prefix}.parsed", 0)
+        failures = stats.get(f"{prefix}.failures", 0)
+        row = {
+            "task": task,
+            "completions": int(parsed + failures),
+            "parsed": int(parsed),
+            "extracted": int(stats.get(f"{prefix}.extracted", 0)),
+            "failures": int(failures),
+            "failure_rate": round(100 * failures / (parsed + failures), 1) if parsed + failures else 0.0,
+        }
+        for kind in PARSE_FAILURE_KINDS:
+            row[kind] = int(stats.get(f"{prefix}.failures.{kind}", 0))
+        row["invalid_items"] = int(stats.get(f"{prefix}.invalid_items", 0))
+        row["retries"] = int(stats.get(f"{prefix}.retries", 0))
+        row["defaulted"] = int(stats.get(f"{prefix}.defaulted", 0))
+        rows.append(row)
+    return rows
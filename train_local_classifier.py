@@ -0,0 +1,102 @@
+"""
+Retrain the local (zero-LLM) ticket classifier from processed tickets.
+
+Usage:
+    python train_local_classifier.py                         # read ProcessedTickets from Google Sheets
+    python train_local_classifier.py --csv processed_tickets_filtered.csv
+"""
+import argparse
+import csv
+import random
+import time
+from tools.local_classifier import (
+    LOCAL_CLASSIFIER_MODEL_PATH,
+    LOCAL_CLASSIFIER_THRESHOLD,
+    NaiveBayesModel,
+    save_models,
+)
+
+FIELDS = {"sentiment": "Sentiment", "issue_type": "IssueType_Label"}
+
+def load_tickets(csv_path=None):
+    if csv_path:
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+    from tools.sheet_connector import fetch_processed_tickets
+    return fetch_processed_tickets(full=True)
+
+def evaluate(model, texts, labels, threshold):
+    """
+    Accuracy overall and on the predictions that clear the confidence threshold.
+    """
+    confident = correct = confident_correct = 0
+    for text, label in zip(texts, labels):
+        predicted, probability = model.predict(text)
+        correct += predicted == label
+        if probability >= threshold:
+            confident += 1
+            confident_correct += predicted == label
+    total = len(texts) or 1
+    return {
+        "accuracy": correct / total,
+        "coverage": confident / total,
+        "confident_accuracy": confident_correct / confident if confident else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local ticket classifier.")
+    parser.add_argument("--csv", help="CSV exported from the Analyzed Tickets tab (default: read the Sheet)")
+    parser.add_argument("--output", default=LOCAL_CLASSIFIER_MODEL_PATH, help="Model file to write")
+    parser.add_argument("--holdout", type=float, default=0.2,
+                        help="Fraction of tickets held out for calibration and evaluation")
+    parser.add_argument("--threshold", type=float, default=LOCAL_CLASSIFIER_THRESHOLD)
+    args = parser.parse_args()
+
+    tickets = [t for t in load_tickets(args.csv) if str(t.get("Message", "")).strip()]
+    print(f"📥 Loaded {len(tickets)} processed tickets")
+    if not tickets:
+        return
+
+    random.seed(0)
+    random.shuffle(tickets)
+
+    models = {}
+    for field, column in FIELDS.items():
+        rows = [(str(t["Message"]), str(t.get(column, ""))) for t in tickets if t.get(column) not in ("", None, "Unknown")]
+        # Split the labelled rows, not all tickets: blank and Unknown labels differ per field
+        split = int(len(rows) * (1 - args.holdout))
+        train, test = rows[:split], rows[split:]
+        if not train:
+            print(f"⚠️ No labelled tickets for {field}, skipping")
+            continue
+
+        model = NaiveBayesModel.train([t for t, _ in train], [l for _, l in train])
+        # Half of the holdout calibrates the posteriors, the other half measures the result
+        calibration, evaluation = test[:len(test) // 2], test[len(test) // 2:]
+        if calibration:
+            model.calibrate([t for t, _ in calibration], [l for _, l in calibration])
+        else:
+            print(f"⚠️ No holdout to calibrate {field}; its predictions will only count when the keyword rules agree")
+        if evaluation:
+            report = evaluate(model, [t for t, _ in evaluation], [l for _, l in evaluation], args.threshold)
+            print(
+                f"📊 {field}: accuracy {report['accuracy']:.1%}, "
+                f"coverage at {args.threshold} {report['coverage']:.1%} "
+                f"(accuracy there {report['confident_accuracy']:.1%})"
+            )
+
+        # Final model uses every labelled ticket and keeps the holdout calibration
+        models[field] = NaiveBayesModel.train([t for t, _ in rows], [l for _, l in rows])
+        models[field].calibration = model.calibration
+
+        start = time.perf_counter()
+        for text, _ in rows[:1000]:
+            models[field].predict(text)
+        per_ticket = (time.perf_counter() - start) / max(1, min(len(rows), 1000))
+        print(f"⏱️ {field}: {per_ticket * 1000:.3f} ms per ticket")
+
+    save_models(models, args.output)
+    print(f"✅ Saved local classifier to {args.output}")
+
+if __name__ == "__main__":
+    main()
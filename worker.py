@@ -0,0 +1,262 @@
+"""
+Headless ticket processor: polls PendingTickets and runs classify -> reply -> send
+outside Streamlit, with its own parallelism per stage.
+
+Usage:
+    python worker.py                                   # run forever
+    python worker.py --once                            # process the current backlog and exit
+    python worker.py --shard 0/2 & python worker.py --shard 1/2   # split tickets across processes
+
+register_ticket.py can push new submissions by POSTing to http://<host>:WORKER_PORT/notify
+(set WORKER_NOTIFY_URL in its environment), which triggers an immediate poll.
+"""
+import argparse
+import os
+import queue
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+from tools import metrics, settings
+from tools.classify_ticket import classify_ticket
+from tools.generate_reply import generate_reply, is_usable_reply
+from tools.ledger import BUSY, get_ledger, ticket_key
+from tools.outbox import OutboxWorker, enqueue_reply, get_outbox, start_outbox_worker
+from tools.sheet_connector import fetch_new_tickets
+
+load_dotenv()
+
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "15"))
+WORKER_CLASSIFY_WORKERS = int(os.getenv("WORKER_CLASSIFY_WORKERS", "4"))
+WORKER_REPLY_WORKERS = int(os.getenv("WORKER_REPLY_WORKERS", "4"))
+WORKER_SEND_WORKERS = int(os.getenv("WORKER_SEND_WORKERS", "2"))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "200"))
+WORKER_PORT = int(os.getenv("WORKER_PORT", "8765"))
+
+_STOP = object()
+
+class Pipeline:
+    """
+    Three-stage pipeline connected by bounded queues:
+      classify (classify_ticket) -> reply (generate_reply) -> send (outbox worker threads).
+    Each stage has its own thread count; the send stage also writes the sheet
+    records once delivery is confirmed.
+    """
+
+    def __init__(self, classify_workers=WORKER_CLASSIFY_WORKERS, reply_workers=WORKER_REPLY_WORKERS,
+                 send_workers=WORKER_SEND_WORKERS, shard_index=0, shard_count=1):
+        self.classify_workers = max(1, classify_workers)
+        self.reply_workers = max(1, reply_workers)
+        self.send_workers = max(1, send_workers)
+        self.shard_index = shard_index
+        self.shard_count = max(1, shard_count)
+        self.classify_queue = queue.Queue(maxsize=WORKER_QUEUE_SIZE)
+        self.reply_queue = queue.Queue(maxsize=WORKER_QUEUE_SIZE)
+        self.wake = threading.Event()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def owns(self, key):
+        return zlib.crc32(key.encode("utf-8")) % self.shard_count == self.shard_index
+
+    def submit(self, ticket):
+        """
+        Hand a pending ticket to the pipeline unless it belongs to another shard,
+        is already in flight here or already has a reply in the outbox.
+        """
+        key = ticket_key(ticket)
+        if not self.owns(key):
+            return False
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            self._in_flight.add(key)
+        self.classify_queue.put(ticket)
+        metrics.incr("worker.submitted")
+        return True
+
+    def _done(self, ticket):
+        with self._lock:
+            self._in_flight.discard(ticket_key(ticket))
+
+    def _classify_stage(self):
+        while True:
+            ticket = self.classify_queue.get()
+            try:
+                if ticket is _STOP:
+                    return
+                if not ticket.get("IssueType_Label") or not ticket.get("Sentiment"):
+                    with metrics.ticket_context(ticket_key(ticket)), metrics.timed("worker.classify_latency"):
+                        status, classification = get_ledger().run_once(
+                            ticket_key(ticket), "classify", lambda: classify_ticket(ticket["Message"]),
+                            keep=lambda c: c.get("sentiment") != "Unknown",
+                        )
+                    if status == BUSY:
+                        metrics.incr("worker.skipped_busy")
+                        self._done(ticket)
+                        continue
+                    ticket["IssueType_Label"] = classification.get("issue_type", "Unknown")
+                    ticket["Sentiment"] = classification.get("sentiment", "Neutral")
+                self.reply_queue.put(ticket)
+            except Exception as e:
+                print(f"❌ Classification stage failed for {ticket.get('Email')}: {e}")
+                self._done(ticket)
+            finally:
+                self.classify_queue.task_done()
+
+    def _reply_stage(self):
+        while True:
+            ticket = self.reply_queue.get()
+            try:
+                if ticket is _STOP:
+                    return
+                if not ticket.get("AutoReply"):
+                    with metrics.ticket_context(ticket_key(ticket)), metrics.timed("worker.reply_latency"):
+                        status, reply = get_ledger().run_once(
+                            ticket_key(ticket), "reply",
+                            lambda: generate_reply(
+                                ticket["Name"], ticket["Message"], ticket.get("Sentiment"), ticket.get("IssueType_Label")
+                            ),
+                            keep=is_usable_reply,
+                        )
+                    if status == BUSY:
+                        metrics.incr("worker.skipped_busy")
+                        continue
+                    ticket["AutoReply"] = reply
+                if ticket["AutoReply"]:
+                    enqueue_reply(ticket)
+                    metrics.incr("worker.queued_for_send")
+            except Exception as e:
+                print(f"❌ Reply stage failed for {ticket.get('Email')}: {e}")
+            finally:
+                if ticket is not _STOP:
+                    self._done(ticket)
+                self.reply_queue.task_done()
+
+    def start(self, send=True):
+        """
+        Start the classify and reply threads, and the outbox send threads unless `send`
+        is False (the caller then drains the outbox itself, see drain_outbox()).
+        """
+        for i in range(self.classify_workers):
+            self._spawn(self._classify_stage, f"classify-{i}")
+        for i in range(self.reply_workers):
+            self._spawn(self._reply_stage, f"reply-{i}")
+        if send:
+            start_outbox_worker(threads=self.send_workers)
+        return self
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def poll_once(self):
+        """
+        Fetch pending tickets (incrementally) and submit the ones not yet handled:
+        not queued, sent or dead-lettered in the outbox.
+        """
+        outbox = get_outbox()
+        handled = outbox.active_ticket_keys() | outbox.dead_letter_keys()
+        submitted = 0
+        for ticket in fetch_new_tickets():
+            if ticket_key(ticket) not in handled and self.submit(ticket):
+                submitted += 1
+        if submitted:
+            print(f"📥 Submitted {submitted} tickets to the pipeline")
+        return submitted
+
+    def wait_idle(self):
+        self.classify_queue.join()
+        self.reply_queue.join()
+
+    def stop(self):
+        for _ in range(self.classify_workers):
+            self.classify_queue.put(_STOP)
+        for _ in range(self.reply_workers):
+            self.reply_queue.put(_STOP)
+
+    def run_forever(self, interval=WORKER_POLL_INTERVAL):
+        while True:
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"⚠️ Polling PendingTickets failed: {e}")
+            self.wake.wait(interval)
+            self.wake.clear()
+
+def serve_notifications(pipeline, port=WORKER_PORT):
+    """
+    Accept POST /notify pushes (e.g. from register_ticket.py) that trigger an immediate poll.
+    """
+
+    class NotifyHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/notify":
+                self.send_error(404)
+                return
+            pipeline.wake.set()
+            self.send_response(202)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), NotifyHandler)
+    threading.Thread(target=server.serve_forever, name="worker-notify", daemon=True).start()
+    print(f"🔔 Listening for ticket notifications on port {port}")
+    return server
+
+def drain_outbox():
+    """
+    Deliver and record everything currently due in the outbox on this thread (used by
+    --once). No background send threads are involved, so the process never exits while
+    a leased message is half sent; that message would be sent again once its lease expired.
+    """
+    worker = OutboxWorker(get_outbox())
+    while worker.drain_once():
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Process pending support tickets without the Streamlit UI.")
+    parser.add_argument("--classify-workers", type=int, default=WORKER_CLASSIFY_WORKERS)
+    parser.add_argument("--reply-workers", type=int, default=WORKER_REPLY_WORKERS)
+    parser.add_argument("--send-workers", type=int, default=WORKER_SEND_WORKERS)
+    parser.add_argument("--poll-interval", type=float, default=WORKER_POLL_INTERVAL)
+    parser.add_argument("--shard", default="0/1", help="index/count, to split tickets across processes")
+    parser.add_argument("--port", type=int, default=WORKER_PORT, help="notification port (0 disables)")
+    parser.add_argument("--once", action="store_true", help="process the current backlog and exit")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("METRICS_PORT", "0")),
+                        help="serve Prometheus metrics at /metrics on this port (0 disables)")
+    args = parser.parse_args()
+
+    settings.configure_console()
+    shard_index, shard_count = (int(part) for part in args.shard.split("/"))
+    metrics.start_metrics_server(args.metrics_port)
+    pipeline = Pipeline(
+        classify_workers=args.classify_workers,
+        reply_workers=args.reply_workers,
+        send_workers=args.send_workers,
+        shard_index=shard_index,
+        shard_count=shard_count,
+    ).start(send=not args.once)
+    print(
+        f"🤖 Worker started (shard {shard_index}/{shard_count}; classify={pipeline.classify_workers}, "
+        f"reply={pipeline.reply_workers}, send={pipeline.send_workers})"
+    )
+
+    if args.once:
+        pipeline.poll_once()
+        pipeline.wait_idle()
+        drain_outbox()
+        pipeline.stop()
+        print(f"✅ Done: {metrics.snapshot('worker.')}")
+        return
+
+    if args.port:
+        serve_notifications(pipeline, args.port)
+    pipeline.run_forever(args.poll_interval)
+
+if __name__ == "__main__":
+    main()